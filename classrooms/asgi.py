@@ -13,4 +13,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'classrooms.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from core.early_hints import EarlyHintsMiddleware  # noqa: E402
+from core.media_app import SignedMediaApp  # noqa: E402
+from core.streaming import video_limiter  # noqa: E402
+from core.warmup import warm_up_on_boot  # noqa: E402
+
+warm_up_on_boot()
+
+site_application = EarlyHintsMiddleware(django_application)
+
+# vidéos aux URLs signées : vérifiées et servies sans passer par Django,
+# sous les mêmes limites de flux et de débit que lesson_video
+media_application = SignedMediaApp(
+    settings.MEDIA_ROOT, settings.SIGNED_MEDIA_KEY, settings.SIGNED_MEDIA_URL, limiter=video_limiter,
+)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'].startswith(settings.SIGNED_MEDIA_URL):
+        return await media_application(scope, receive, send)
+    return await site_application(scope, receive, send)
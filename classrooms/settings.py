@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+import hashlib
 import os
 
 AUTH_USER_MODEL = 'core.TheUser'
@@ -22,6 +23,14 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# manifeste de `manage.py gc_media` (hors de MEDIA_ROOT, qui est servi)
+MEDIA_GC_MANIFEST = os.path.join(BASE_DIR, 'gc_media.json')
+
+# CSV d'import déposés depuis l'admin en attendant leur tâche (mots de passe
+# en clair : hors de MEDIA_ROOT, supprimés après l'import)
+ROSTER_IMPORT_ROOT = os.path.join(BASE_DIR, 'roster-imports')
+ROSTER_IMPORT_WORKERS = None  # process de hachage, None = un par cœur
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
@@ -34,6 +43,10 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['*']
 
+# préchauffage des workers au démarrage (routes, templates, caches) ;
+# OPYC_WARMUP=0/1 force le choix
+WARMUP_ON_BOOT = os.environ.get('OPYC_WARMUP', '0' if DEBUG else '1') == '1'
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard_control' 
 LOGOUT_REDIRECT_URL  = 'login'
@@ -90,14 +103,131 @@ WSGI_APPLICATION = 'classrooms.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite en production : journal WAL (les lectures ne bloquent plus sur une
+# écriture), fsync aux checkpoints seulement, pages en mmap et cache plus
+# grand, attente au lieu de "database is locked". Pragmas appliqués à chaque
+# connexion ; IMMEDIATE prend le verrou d'écriture dès le BEGIN.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # en Kio
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
 
+# Cache
+# Les invalidations (photo des utilisateurs, version du catalogue) doivent
+# atteindre tous les workers : hors DEBUG un cache partagé est obligatoire
+# (vérifié au démarrage, core.backends.require_shared_cache), par exemple
+# OPYC_CACHE_URL=redis://127.0.0.1:6379/1 (paquet redis) ou
+# memcached://127.0.0.1:11211 (paquet pymemcache). LocMem, un cache par
+# process, reste le défaut en développement ; OPYC_SINGLE_PROCESS=1
+# l'autorise aussi pour un déploiement à un seul worker.
+CACHE_URL = os.environ.get('OPYC_CACHE_URL', '')
+
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_URL.removeprefix('memcached://'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'opyc-default',
+        }
+    }
+
+SHARED_CACHE_REQUIRED = not DEBUG and os.environ.get('OPYC_SINGLE_PROCESS') != '1'
+
+# Sessions lues depuis le cache, écrites en base seulement quand elles changent
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# request.user chargé depuis une photo en cache (invalidée par core.signals)
+AUTHENTICATION_BACKENDS = ['core.backends.CachedModelBackend']
+
+USER_SNAPSHOT_TIMEOUT = 60 * 5
+
+
+# Tâches hors requête (core.jobs), exécutées par `manage.py run_workers` ;
+# JOBS_EAGER les exécute sur place (tests)
+JOBS_WORKERS = 2
+JOBS_EAGER = False
+JOBS_POLL_INTERVAL = 1.0
+JOBS_RETRY_DELAY = 30  # secondes, doublé à chaque essai
+JOBS_LOCK_TIMEOUT = 60 * 30  # tâche "en cours" depuis plus longtemps : remise en file
+
+# Notifications aux apprenants (publication d'un cours, nouvelle leçon)
+NOTIFICATION_BACKENDS = [
+    'core.notifications.InboxBackend',
+    'core.notifications.EmailBackend',
+]
+NOTIFICATION_BATCH_SIZE = 5000
+SITE_URL = os.environ.get('OPYC_SITE_URL', 'http://localhost:8000')
+
+# Pages des cours publiés rendues d'avance (core.snapshots). Les vues gardent
+# leurs vérifications puis renvoient la page ; avec SNAPSHOT_ACCEL_REDIRECT
+# c'est le serveur frontal qui l'envoie, par exemple avec nginx :
+#   location /internal-snapshots/ {
+#       internal;
+#       alias <SNAPSHOT_ROOT>/;
+#   }
+# OPYC_SNAPSHOTS=0/1 force le choix
+SNAPSHOT_PUBLISHING = os.environ.get('OPYC_SNAPSHOTS', '0' if DEBUG else '1') == '1'
+SNAPSHOT_ROOT = os.path.join(BASE_DIR, 'snapshots')
+SNAPSHOT_ACCEL_REDIRECT = os.environ.get('OPYC_SNAPSHOT_ACCEL') or None
+
+# Autocomplétion du catalogue (core.prefix_index) : index en mémoire de chaque
+# process ; au-delà de cette limite les leçons restantes ne sont pas indexées
+SEARCH_INDEX_MAX_ENTRIES = 200_000
+
+# Vidéos des leçons (core.streaming), limites par process : débit par
+# utilisateur puis global (octets/s, 0 = illimité), flux simultanés
+VIDEO_CHUNK_SIZE = 256 * 1024
+VIDEO_RATE_PER_USER = 2 * 1024 * 1024
+VIDEO_BURST_PER_USER = 8 * 1024 * 1024  # démarrage rapide de la lecture
+VIDEO_RATE_GLOBAL = 100 * 1024 * 1024
+VIDEO_BURST_GLOBAL = 16 * 1024 * 1024
+VIDEO_STREAMS_PER_USER = 3
+VIDEO_MAX_STREAMS = 400
+
+# URLs signées des vidéos (core.signed_media) : vérifiées sans base par
+# core.media_app, montée devant Django dans classrooms/asgi.py ou lancée seule
+# derrière le frontal (OPYC_MEDIA_KEY = cette clé, OPYC_MEDIA_ROOT = MEDIA_ROOT).
+# Expiration arrondie à l'heure : même URL pendant une heure, donc cachable.
+SIGNED_MEDIA_URL = '/protected-media/'
+SIGNED_MEDIA_KEY = os.environ.get('OPYC_MEDIA_KEY') or hashlib.sha256(f'opyc-media:{SECRET_KEY}'.encode()).hexdigest()
+SIGNED_MEDIA_TTL = 60 * 60 * 6
+SIGNED_MEDIA_BUCKET = 60 * 60
+
+# En local les e-mails sont écrits dans des fichiers
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+DEFAULT_FROM_EMAIL = 'opyc <no-reply@opyc.local>'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from django.views.static import serve
 from django.conf import settings
 from django.conf.urls.static import static
 from core.views import CustomLoginFormView
@@ -19,5 +20,9 @@ if settings.DEBUG:
         path('__debug__/', include(debug_toolbar.urls))
     ] + urlpatterns
     
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # vidéos des leçons exclues : seulement par URL signée (core.signed_media)
+    urlpatterns += [
+        re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?!lessons/)(?P<path>.*)$', serve,
+                {'document_root': settings.MEDIA_ROOT}),
+    ]
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
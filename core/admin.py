@@ -1,26 +1,41 @@
-from django.contrib import admin
+from datetime import timedelta
+
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from .admin_utils import (
+    AutocompleteFilter, PaginatedInlineMixin, PrefixSearchMixin, ScalableAdminMixin
+)
+from .cohorts import cohort_from_course, cohort_from_group, enroll_cohort
+from .forms import RosterImportForm, EnrollActionForm, CohortActionForm
+from .roster import start_roster_import
+from .jobs import job_stats
 from .models import (
-    TheUser, Category, Module, Course, Chapter, Lesson, Enrollment
+    TheUser, Category, Module, Course, Chapter, Lesson, Enrollment, Job, DeadJob, RosterImport
 )
 
-class LessonInline(admin.TabularInline):
+class LessonInline(PaginatedInlineMixin, admin.TabularInline):
     model = Lesson
     extra = 1
     exclude = ('slug',)
-    fields = ('order', 'title', 'content')
+    fields = ('order', 'title', 'content', 'video_duration')
 
-class ChapterInline(admin.TabularInline):
+class ChapterInline(PaginatedInlineMixin, admin.TabularInline):
     model = Chapter
     extra = 1
     exclude = ('slug',)
     fields = ('order', 'name')
 
-class CourseInline(admin.TabularInline):
+class CourseInline(PaginatedInlineMixin, admin.TabularInline):
     model = Course
     extra = 1
     exclude = ('slug',)
     fields = ('title', 'teacher', 'is_published')
+    autocomplete_fields = ('teacher',)
 
 class ModuleInline(admin.TabularInline):
     model = Module
@@ -28,58 +43,201 @@ class ModuleInline(admin.TabularInline):
     exclude = ('slug',)
     fields = ('name',)
 
-class EnrollmentInline(admin.TabularInline):
+class EnrollmentInline(PaginatedInlineMixin, admin.TabularInline):
     model = Enrollment
     extra = 1
     raw_id_fields = ('student',)
 
 @admin.register(TheUser)
-class TheUserAdmin(UserAdmin):
+class TheUserAdmin(ScalableAdminMixin, UserAdmin):
     list_display = ('username', 'email', 'role', 'is_staff')
+    search_fields = ('^username', '^email')
     list_filter = ('role', 'is_staff')
     list_editable = ('role',)
     fieldsets = UserAdmin.fieldsets + (
         ('Rôle & Permissions', {'fields': ('role',)}),
     )
+    change_list_template = 'admin/core/theuser/change_list.html'
+    action_form = EnrollActionForm
+    actions = ['enroll_selected']
+
+    @admin.action(description="Inscrire les apprenants sélectionnés au cours")
+    def enroll_selected(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid() or not form.cleaned_data['course']:
+            self.message_user(request, "Indiquez le slug d'un cours existant.", messages.ERROR)
+            return
+
+        created = enroll_cohort(queryset, [form.cleaned_data['course']])
+        self.message_user(request, f"{created} inscription(s) créée(s).", messages.SUCCESS)
+
+    def get_urls(self):
+        return [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_roster_view),
+                name='core_theuser_import_roster',
+            ),
+            path(
+                'import/<int:pk>/',
+                self.admin_site.admin_view(self.roster_status_view),
+                name='core_theuser_roster_status',
+            ),
+        ] + super().get_urls()
+
+    def import_roster_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        form = RosterImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            # hachage des mots de passe et insertion dans une tâche (core.jobs), pas dans la requête
+            roster = start_roster_import(form.cleaned_data['csv_file'], request.user)
+            self.message_user(request, "Import mis en file.", messages.SUCCESS)
+            return redirect('admin:core_theuser_roster_status', roster.pk)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'form': form,
+            'title': 'Importer un CSV',
+        }
+        return TemplateResponse(request, 'admin/core/theuser/import_roster.html', context)
+
+    def roster_status_view(self, request, pk):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        roster = get_object_or_404(RosterImport.objects.select_related('job'), pk=pk)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'roster': roster,
+            'errors': roster.errors[:100],
+            'title': f'Import CSV #{roster.pk}',
+        }
+        return TemplateResponse(request, 'admin/core/theuser/roster_status.html', context)
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name',)
+    search_fields = ('^name',)
     exclude = ('slug',)
     inlines = [ModuleInline]
 
 @admin.register(Module)
 class ModuleAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category')
+    list_display = ('name', 'category', 'course_count')
     list_filter = ('category',)
+    list_select_related = ('category',)
+    search_fields = ('^name',)
     exclude = ('slug',)
     inlines = [CourseInline]
 
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
-    list_display = ('title', 'module', 'teacher', 'is_published', 'created_at')
-    list_filter = ('module', 'is_published', 'teacher')
+class CourseAdmin(ScalableAdminMixin, PrefixSearchMixin, admin.ModelAdmin):
+    list_display = ('title', 'module', 'teacher', 'is_published', 'lesson_count', 'enrollment_count', 'created_at')
+    list_filter = (
+        ('module', AutocompleteFilter), 'is_published', ('teacher', AutocompleteFilter)
+    )
     list_editable = ('is_published',)
-    search_fields = ('title', 'description')
+    list_select_related = ('module', 'teacher')
+    search_fields = ('search_key',)
+    body_search_fields = ('description',)
+    search_help_text = "Début du titre. « body:mots » cherche dans la description (parcourt toute la table)."
+    autocomplete_fields = ('module', 'teacher')
     exclude = ('slug',)
     inlines = [ChapterInline, EnrollmentInline]
+    action_form = CohortActionForm
+    actions = ['enroll_cohort']
+
+    @admin.action(description="Inscrire une cohorte aux cours sélectionnés")
+    def enroll_cohort(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid():
+            self.message_user(request, "Cohorte invalide.", messages.ERROR)
+            return
+
+        group = form.cleaned_data['group']
+        source = form.cleaned_data['source_course']
+        if bool(group) == bool(source):
+            self.message_user(request, "Choisissez un groupe OU un cours source.", messages.ERROR)
+            return
+
+        students = cohort_from_group(group) if group else cohort_from_course(source)
+        created = enroll_cohort(students, queryset)
+        self.message_user(request, f"{created} inscription(s) créée(s).", messages.SUCCESS)
 
 @admin.register(Chapter)
-class ChapterAdmin(admin.ModelAdmin):
-    list_display = ('name', 'course', 'order')
-    list_filter = ('course',)
-    search_fields = ('name',)
+class ChapterAdmin(ScalableAdminMixin, PrefixSearchMixin, admin.ModelAdmin):
+    list_display = ('name', 'course', 'order', 'lesson_count')
+    list_filter = (('course', AutocompleteFilter),)
+    list_select_related = ('course',)
+    search_fields = ('search_key',)
+    autocomplete_fields = ('course',)
     exclude = ('slug',)
     inlines = [LessonInline]
 
 @admin.register(Lesson)
-class LessonAdmin(admin.ModelAdmin):
-    list_display = ('title', 'chapter', 'order')
-    list_filter = ('chapter__course', 'chapter')
-    search_fields = ('title', 'content')
+class LessonAdmin(ScalableAdminMixin, PrefixSearchMixin, admin.ModelAdmin):
+    list_display = ('title', 'chapter', 'order', 'video_duration')
+    list_filter = (
+        ('chapter__course', AutocompleteFilter), ('chapter', AutocompleteFilter)
+    )
+    list_select_related = ('chapter',)
+    search_fields = ('search_key',)
+    body_search_fields = ('content',)
+    search_help_text = "Début du titre. « body:mots » cherche dans le contenu (parcourt toute la table)."
+    autocomplete_fields = ('chapter',)
     exclude = ('slug',)
 
 @admin.register(Enrollment)
-class EnrollmentAdmin(admin.ModelAdmin):
+class EnrollmentAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('student', 'course', 'created_at')
-    list_filter = ('course', 'created_at')
\ No newline at end of file
+    list_filter = (('course', AutocompleteFilter), 'created_at')
+    list_select_related = ('student', 'course')
+    search_fields = ('^student__username',)
+    autocomplete_fields = ('student', 'course')
+
+@admin.register(Job)
+class JobAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts', 'run_at', 'duration', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = (
+        'name', 'args', 'kwargs', 'attempts', 'locked_by',
+        'started_at', 'finished_at', 'duration', 'last_error',
+    )
+    change_list_template = 'admin/core/job/change_list.html'
+    actions = ['retry_jobs']
+
+    @admin.action(description="Remettre en file les tâches sélectionnées")
+    def retry_jobs(self, request, queryset):
+        count = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(), last_error='',
+        )
+        self.message_user(request, f"{count} tâche(s) remise(s) en file.", messages.SUCCESS)
+
+    def changelist_view(self, request, extra_context=None):
+        # métriques des dernières 24 h, par nom de tâche
+        if self.change_list_template:
+            since = timezone.now() - timedelta(days=1)
+            extra_context = {**(extra_context or {}), 'job_stats': job_stats(since=since)}
+        return super().changelist_view(request, extra_context)
+
+@admin.register(DeadJob)
+class DeadJobAdmin(JobAdmin):
+    list_display = ('name', 'attempts', 'finished_at', 'short_error')
+    list_filter = ('name',)
+    change_list_template = None
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(status=Job.DEAD)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="erreur")
+    def short_error(self, obj):
+        return obj.last_error.strip().splitlines()[-1][:120] if obj.last_error else ''
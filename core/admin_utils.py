@@ -0,0 +1,175 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.db import connections
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.functional import cached_property
+from .utils import normalize
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    '''
+    Filtre sur une clé étrangère sans lister toute la table liée : seule la
+    valeur choisie est chargée, les autres sont cherchées via l'autocomplete
+    de l'admin (le ModelAdmin lié doit définir search_fields).
+    '''
+    template = 'admin/core/autocomplete_filter.html'
+
+    def has_output(self):
+        return True
+
+    def field_choices(self, field, request, model_admin):
+        if not self.lookup_val:
+            return []
+        model = field.remote_field.model
+        return [
+            (obj.pk, str(obj))
+            for obj in model._default_manager.filter(pk__in=self.lookup_val)
+        ]
+
+    @property
+    def autocomplete_url(self):
+        return reverse('admin:autocomplete')
+
+    @property
+    def source_opts(self):
+        # l'autocomplete de l'admin part du modèle qui porte la clé étrangère
+        return self.field.model._meta
+
+
+class PrefixSearchMixin:
+    '''
+    Le champ `search_key` (core.utils.SearchKeyModel : titre en minuscules,
+    sans accents, indexé) est cherché avec des bornes (>= terme normalisé et
+    < terme + '\uffff') : "python débutant" trouve "Python Débutant" par
+    l'index. Un OU avec un autre champ ferait parcourir toute la table : la
+    recherche dans le texte (`body_search_fields`) se demande explicitement,
+    en préfixant le terme par "body:".
+    '''
+    body_search_fields = ()
+    body_prefix = 'body:'
+
+    def get_search_results(self, request, queryset, search_term):
+        if self.body_search_fields and search_term.strip().startswith(self.body_prefix):
+            words = search_term.strip()[len(self.body_prefix):].strip()
+            if not words:
+                return queryset, False
+            condition = Q()
+            for field in self.body_search_fields:
+                condition |= Q(**{f'{field}__icontains': words})
+            return queryset.filter(condition), False
+
+        fields = self.get_search_fields(request)
+        term = normalize(search_term)
+        if not term or 'search_key' not in fields:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(search_key__gte=term, search_key__lt=term + '\uffff'), False
+
+
+def estimate_row_count(model, using='default'):
+    ''' estimation du nombre de lignes sans COUNT(*), ou None si indisponible '''
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [table],
+            )
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # MAX(rowid) se lit dans l'index : exact tant qu'il y a peu de suppressions
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+            row = cursor.fetchone()
+            return row[0] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Paginator de l'admin pour les grosses tables : la liste complète utilise
+    une estimation au-delà de `count_limit` lignes (MAX(rowid) sous SQLite,
+    jamais inférieur au vrai nombre). Une liste filtrée est comptée
+    exactement : tronquer ce compte rendrait ses dernières pages inaccessibles.
+    '''
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        return queryset.order_by().count()
+
+
+class ScalableAdminMixin:
+    ''' réglages communs des changelists prévues pour des centaines de milliers de lignes '''
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        if any(
+            isinstance(f, tuple) and issubclass(f[1], AutocompleteFilter)
+            for f in self.list_filter
+        ):
+            # le widget d'autocomplete fournit select2 et son initialisation
+            media += AutocompleteSelect(None, self.admin_site).media + forms.Media(
+                js=['core/js/admin_autocomplete_filter.js']
+            )
+        return media
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    '''
+    Formset d'inline limité à une page de lignes : seule cette page est
+    chargée, rendue et renvoyée au POST (et seules les lignes modifiées
+    sont enregistrées, comme pour tout formset).
+    '''
+    per_page = 25
+    page_param = 'page'
+    page_number = None
+    query_params = None
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            queryset = super().get_queryset()
+            self.paginator = Paginator(queryset, self.per_page)
+            self.page = self.paginator.get_page(self.page_number)
+            self._queryset = self.page.object_list
+        return self._queryset
+
+    def page_links(self):
+        ''' [(numéro ou '…', query string ou None)] pour le template '''
+        self.get_queryset()
+        links = []
+        for number in self.paginator.get_elided_page_range(self.page.number):
+            if number == self.paginator.ELLIPSIS or number == self.page.number:
+                links.append((number, None))
+                continue
+            params = self.query_params.copy()
+            params[self.page_param] = number
+            links.append((number, '?' + params.urlencode()))
+        return links
+
+
+class PaginatedInlineMixin:
+    ''' inline dont les lignes existantes sont paginées (?<modèle>_page=N) '''
+    formset = PaginatedInlineFormSet
+    per_page = 25
+    template = 'admin/core/edit_inline/paginated_tabular.html'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.page_param = f'{self.opts.model_name}_page'
+        formset.page_number = request.GET.get(formset.page_param)
+        formset.query_params = request.GET.copy()
+        return formset
@@ -0,0 +1,253 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.http import Http404, HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+from .catalog import catalog_version
+from .models import Category, Module, Course, Chapter, Lesson
+from .prefix_index import search_index
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MIN_LENGTH = 2
+API_CACHE_TIMEOUT = 60 * 10
+
+
+class Resource:
+    '''
+    Description d'une ressource de l'API : `fields` associe le nom exposé au
+    chemin ORM, lu avec values_list() (pas d'instances de modèle).
+    '''
+
+    def __init__(self, queryset, fields, default_fields=None, filters=None):
+        self.queryset = queryset
+        self.fields = fields
+        self.default_fields = default_fields or tuple(fields)
+        self.filters = filters or {}
+
+    def select(self, names):
+        return self.queryset.order_by('pk').values_list('pk', *[self.fields[n] for n in names])
+
+
+has_video = ExpressionWrapper(
+    Q(video_file__isnull=False) & ~Q(video_file=''), output_field=BooleanField()
+)
+
+RESOURCES = {
+    'categories': Resource(
+        Category.objects.all(),
+        {'id': 'id', 'slug': 'slug', 'name': 'name'},
+    ),
+    'modules': Resource(
+        Module.objects.all(),
+        {'id': 'id', 'slug': 'slug', 'name': 'name', 'category': 'category__slug'},
+        filters={'category': 'category__slug'},
+    ),
+    'courses': Resource(
+        Course.objects.filter(is_published=True),
+        {
+            'id': 'id', 'slug': 'slug', 'title': 'title', 'description': 'description',
+            'module': 'module__slug', 'category': 'module__category__slug',
+            'teacher': 'teacher__username', 'created_at': 'created_at',
+        },
+        default_fields=('id', 'slug', 'title', 'module', 'category', 'teacher'),
+        filters={'module': 'module__slug', 'category': 'module__category__slug'},
+    ),
+    'chapters': Resource(
+        Chapter.objects.filter(course__is_published=True),
+        {
+            'id': 'id', 'slug': 'slug', 'name': 'name', 'description': 'description',
+            'order': 'order', 'course': 'course__slug',
+        },
+        default_fields=('id', 'slug', 'name', 'order', 'course'),
+        filters={'course': 'course__slug'},
+    ),
+    'lessons': Resource(
+        Lesson.objects.filter(chapter__course__is_published=True).annotate(has_video=has_video),
+        {
+            'id': 'id', 'slug': 'slug', 'title': 'title', 'content': 'content',
+            'order': 'order', 'has_video': 'has_video',
+            'chapter': 'chapter__slug', 'course': 'chapter__course__slug',
+        },
+        default_fields=('id', 'slug', 'title', 'order', 'has_video', 'chapter', 'course'),
+        filters={'chapter': 'chapter__slug', 'course': 'chapter__course__slug'},
+    ),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest("curseur invalide")
+
+
+def _fields(resource, params):
+    requested = params.get('fields')
+    if not requested:
+        return list(resource.default_fields)
+    names = [n.strip() for n in requested.split(',') if n.strip()]
+    unknown = [n for n in names if n not in resource.fields]
+    if unknown:
+        raise BadRequest(f"champ(s) inconnu(s) : {', '.join(unknown)}")
+    return names
+
+
+def _limit(params):
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("limit doit être un entier")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _rows(names, values_list):
+    for row in values_list:
+        yield dict(zip(names, row[1:]))
+
+
+def _list_payload(params, path, resource):
+    names = _fields(resource, params)
+    limit = _limit(params)
+    queryset = resource.select(names)
+
+    for param, lookup in resource.filters.items():
+        if param in params:
+            queryset = queryset.filter(**{lookup: params[param]})
+    if 'cursor' in params:
+        queryset = queryset.filter(pk__gt=decode_cursor(params['cursor']))
+
+    # keyset : une ligne de plus pour savoir s'il existe une page suivante
+    rows = list(queryset[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = params.copy()
+        params['cursor'] = encode_cursor(rows[-1][0])
+        # relatif : le corps en cache ne dépend pas de l'hôte de la requête
+        next_url = f'{path}?{params.urlencode()}'
+
+    return {'results': list(_rows(names, rows)), 'next': next_url}
+
+
+def _cache_key(full_path):
+    raw = f'{catalog_version()}:{full_path}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def api_etag(request, resource=None, *args, **kwargs):
+    # le contenu ne dépend que de l'URL et de la version du catalogue ;
+    # pas d'ETag pour une ressource inconnue (404)
+    if resource not in RESOURCES:
+        return None
+    return _cache_key(request.get_full_path())
+
+
+def _dumps(payload):
+    return json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def _cached_json(request, build):
+    ''' corps JSON mis en cache par version du catalogue et URL '''
+    key = f'api:{_cache_key(request.get_full_path())}'
+    body = cache.get(key)
+    if body is None:
+        try:
+            body = _dumps(build())
+        except BadRequest as e:
+            return _error(str(e))
+        except Http404:
+            return _error("introuvable", status=404)
+        cache.set(key, body, API_CACHE_TIMEOUT)
+    return HttpResponse(body, content_type='application/json')
+
+
+@require_GET
+@cache_control(public=True, max_age=60)
+@condition(etag_func=api_etag)
+def resource_list(request, resource):
+    if resource not in RESOURCES:
+        return _error("ressource inconnue", status=404)
+    resource = RESOURCES[resource]
+    return _cached_json(request, lambda: _list_payload(request.GET, request.path, resource))
+
+
+@require_GET
+@cache_control(public=True, max_age=60)
+@condition(etag_func=api_etag)
+def resource_detail(request, resource, slug):
+    if resource not in RESOURCES:
+        return _error("ressource inconnue", status=404)
+    resource = RESOURCES[resource]
+
+    def build():
+        names = _fields(resource, request.GET)
+        row = resource.select(names).filter(slug=slug).first()
+        if row is None:
+            raise Http404
+        return next(_rows(names, [row]))
+
+    return _cached_json(request, build)
+
+
+def prime_first_pages():
+    ''' première page de chaque liste mise en cache (warm-up), sans requête HTTP '''
+    for name, resource in RESOURCES.items():
+        path = reverse('api_list', args=[name])
+        body = _dumps(_list_payload(QueryDict(), path, resource))
+        cache.set(f'api:{_cache_key(path)}', body, API_CACHE_TIMEOUT)
+    return len(RESOURCES)
+
+
+EXPORT_ORDER = ('categories', 'modules', 'courses', 'chapters', 'lessons')
+
+
+def _export_lines():
+    for name in EXPORT_ORDER:
+        resource = RESOURCES[name]
+        names = list(resource.default_fields)
+        rows = resource.select(names).iterator(chunk_size=2000)
+        for row in _rows(names, rows):
+            row['type'] = name
+            yield _dumps(row) + '\n'
+
+
+@require_GET
+def catalog_export(request):
+    ''' tout le catalogue en JSON Lines, ligne par ligne depuis le curseur '''
+    response = StreamingHttpResponse(_export_lines(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="catalog.jsonl"'
+    return response
+
+
+@require_GET
+@cache_control(public=True, max_age=60)
+def autocomplete(request):
+    ''' suggestions (cours, modules, leçons) depuis l'index en mémoire, sans requête SQL '''
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', AUTOCOMPLETE_LIMIT)), MAX_LIMIT))
+    except ValueError:
+        return _error("limit doit être un entier")
+    results = search_index.search(query, limit) if len(query) >= AUTOCOMPLETE_MIN_LENGTH else []
+    return JsonResponse({'query': query, 'results': results})
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .backends import require_shared_cache
+
+        require_shared_cache()
+        from . import signals  # noqa: F401
@@ -0,0 +1,89 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from .models import Enrollment
+
+USER_SNAPSHOT_KEY = 'user-snapshot:{}'
+
+# un cache par process : une invalidation n'est vue que par son worker
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def require_shared_cache():
+    '''
+    Appelée au démarrage (CoreConfig.ready). Avec un cache local, un
+    utilisateur désactivé ou changé de rôle le resterait jusqu'à
+    USER_SNAPSHOT_TIMEOUT dans les autres workers.
+    '''
+    if not settings.SHARED_CACHE_REQUIRED:
+        return
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            f"{backend} est propre à chaque process : configurez un cache partagé "
+            "(OPYC_CACHE_URL) ou OPYC_SINGLE_PROCESS=1 pour un seul worker"
+        )
+
+
+def user_snapshot_key(user_id):
+    return USER_SNAPSHOT_KEY.format(user_id)
+
+
+def build_user_snapshot(user_id):
+    ''' photo compacte d'un utilisateur : colonnes, groupes et cours suivis '''
+    UserModel = get_user_model()
+    fields = [f.attname for f in UserModel._meta.concrete_fields]
+    row = UserModel._default_manager.filter(pk=user_id).values_list(*fields).first()
+    if row is None:
+        return None
+
+    group_ids = tuple(
+        Group.objects.filter(user=user_id).values_list('pk', flat=True)
+    )
+    course_ids = tuple(
+        Enrollment.objects.filter(student_id=user_id)
+        .order_by().values_list('course_id', flat=True)
+    )
+    return (tuple(fields), row, group_ids, course_ids)
+
+
+def user_from_snapshot(snapshot):
+    fields, row, group_ids, course_ids = snapshot
+    user = get_user_model().from_db('default', fields, row)
+    # les cached_property du modèle sont pré-remplies : aucune requête ensuite
+    user.__dict__['group_ids'] = frozenset(group_ids)
+    user.__dict__['enrolled_course_ids'] = frozenset(course_ids)
+    return user
+
+
+def get_cached_user(user_id):
+    key = user_snapshot_key(user_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_user_snapshot(user_id)
+        if snapshot is None:
+            return None
+        cache.set(key, snapshot, settings.USER_SNAPSHOT_TIMEOUT)
+    return user_from_snapshot(snapshot)
+
+
+def invalidate_user_snapshot(*user_ids):
+    cache.delete_many([user_snapshot_key(pk) for pk in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    ''' ModelBackend qui charge request.user depuis le cache '''
+
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
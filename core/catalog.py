@@ -0,0 +1,35 @@
+'''
+Version du catalogue, dans le cache par défaut : c'est elle qui invalide les
+caches de chaque worker (arbres des cours, API, index de recherche). Hors
+DEBUG ce cache doit être partagé entre les workers, ce que vérifie
+core.backends.require_shared_cache au démarrage.
+'''
+import threading
+import time
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog-version'
+
+_bumps = threading.local()
+
+
+def catalog_version():
+    ''' change à chaque modification du catalogue (clé des caches et ETag) '''
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = bump_catalog_version()
+    return version
+
+
+def bump_catalog_version():
+    previous = cache.get(CATALOG_VERSION_KEY)
+    version = time.time_ns()
+    cache.set(CATALOG_VERSION_KEY, version, None)
+    _bumps.last = (previous, version)
+    return version
+
+
+def last_bump():
+    ''' (version d'avant, version posée) du dernier bump de ce thread, ou None '''
+    return getattr(_bumps, 'last', None)
@@ -0,0 +1,103 @@
+import csv
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+from .backends import invalidate_user_snapshot
+from .counters import adjust
+from .models import TheUser, Course, Enrollment
+
+
+def cohort_from_group(group):
+    return TheUser.objects.filter(groups=group)
+
+
+def cohort_from_course(course):
+    return TheUser.objects.filter(enrollments__course=course)
+
+
+def cohort_from_usernames(usernames):
+    return TheUser.objects.filter(username__in=list(usernames))
+
+
+def read_usernames(fp):
+    for row in csv.DictReader(fp):
+        username = (row.get('username') or '').strip()
+        if username:
+            yield username
+
+
+def _student_id_batches(students, batch_size):
+    # la règle de Enrollment.clean (apprenants seulement) est appliquée en SQL
+    student_ids = (
+        students.filter(role=TheUser.STUDENT)
+        .values_list('pk', flat=True)
+        .distinct()
+        .order_by('pk')
+    )
+    last = 0
+    while True:
+        batch = list(student_ids.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def _insert_enrollments(course_id, student_ids, chunk_size=500):
+    '''
+    INSERT ... ON CONFLICT DO NOTHING RETURNING : les apprenants réellement
+    inscrits par cette requête. Une inscription concurrente arrivée entre
+    la lecture des inscrits et l'insertion n'est pas comptée en double.
+    '''
+    connection = connections[router.db_for_write(Enrollment)]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        Enrollment.objects.bulk_create(
+            [Enrollment(student_id=pk, course_id=course_id) for pk in student_ids],
+            ignore_conflicts=True,
+        )
+        # sans RETURNING : une course perdue compte une ligne de trop (corrigée par reconcile_counters)
+        return list(student_ids)
+
+    opts, quote = Enrollment._meta, connection.ops.quote_name
+    columns = ', '.join(quote(opts.get_field(f).column) for f in ('student', 'course', 'created_at', 'updated_at'))
+    student_column = quote(opts.get_field('student').column)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    inserted = []
+    with connection.cursor() as cursor:
+        for i in range(0, len(student_ids), chunk_size):
+            chunk = student_ids[i:i + chunk_size]
+            cursor.execute(
+                f"INSERT INTO {quote(opts.db_table)} ({columns}) VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT DO NOTHING RETURNING {student_column}",
+                [value for pk in chunk for value in (pk, course_id, now, now)],
+            )
+            inserted += [row[0] for row in cursor.fetchall()]
+    return inserted
+
+
+def enroll_cohort(students, courses, batch_size=2000):
+    ''' inscrit un ensemble d'apprenants à un ou plusieurs cours, par lots '''
+    created = 0
+    courses = list(courses)
+
+    for batch in _student_id_batches(students, batch_size):
+        new_ids = set()
+        with transaction.atomic():
+            for course in courses:
+                enrolled = set(
+                    Enrollment.objects.filter(course=course, student_id__in=batch)
+                    .values_list('student_id', flat=True)
+                )
+                missing = [pk for pk in batch if pk not in enrolled]
+                if not missing:
+                    continue
+                # compteur ajusté des lignes réellement insérées, pas de celles lues manquantes
+                inserted = _insert_enrollments(course.pk, missing)
+                adjust(Course.objects.filter(pk=course.pk), enrollment_count=len(inserted))
+                created += len(inserted)
+                new_ids.update(inserted)
+
+        # bulk_create ne déclenche pas les signaux
+        invalidate_user_snapshot(*new_ids)
+
+    return created
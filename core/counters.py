@@ -0,0 +1,71 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from .models import Module, Course, Chapter, Lesson, Enrollment
+
+
+def adjust(queryset, **deltas):
+    ''' incrément atomique en base (UPDATE ... SET n = n + d), sans lire les lignes '''
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        # jamais négatif, même si le compteur avait dérivé (corrigé par reconcile_counters)
+        queryset.update(**{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()})
+
+
+def adjust_lessons(chapter_id, count=0, duration=0):
+    ''' leçons ajoutées/retirées d'un chapitre : compteurs du chapitre et de son cours '''
+    adjust(Chapter.objects.filter(pk=chapter_id), lesson_count=count, video_duration=duration)
+    adjust(Course.objects.filter(chapters=chapter_id), lesson_count=count, video_duration=duration)
+
+
+class Counter:
+    '''
+    Compteur dénormalisé : `field` de `model` vaut l'agrégat `aggregate` des
+    lignes de `source` reliées par `link` (et filtrées par `filters`).
+    '''
+
+    def __init__(self, model, field, source, link, aggregate, **filters):
+        self.model = model
+        self.field = field
+        self.source = source
+        self.link = link
+        self.aggregate = aggregate
+        self.filters = filters
+
+    def __str__(self):
+        return f'{self.model._meta.model_name}.{self.field}'
+
+    def actual(self):
+        ''' valeur réelle, en sous-requête corrélée '''
+        rows = (
+            self.source.objects.filter(**{self.link: OuterRef('pk')}, **self.filters)
+            .order_by().values(self.link).annotate(value=self.aggregate).values('value')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    def drifted(self):
+        return (
+            self.model.objects.annotate(actual=self.actual())
+            .exclude(**{self.field: F('actual')}).values_list('pk', flat=True)
+        )
+
+    def reconcile(self, dry_run=False):
+        ''' corrige les lignes en écart ; l'UPDATE recalcule en base, pas de valeur lue avant '''
+        stale = list(self.drifted())
+        if stale and not dry_run:
+            self.model.objects.filter(pk__in=stale).update(**{self.field: self.actual()})
+        return len(stale)
+
+
+COUNTERS = (
+    Counter(Chapter, 'lesson_count', Lesson, 'chapter', Count('pk')),
+    Counter(Chapter, 'video_duration', Lesson, 'chapter', Sum('video_duration')),
+    Counter(Course, 'lesson_count', Lesson, 'chapter__course', Count('pk')),
+    Counter(Course, 'video_duration', Lesson, 'chapter__course', Sum('video_duration')),
+    Counter(Course, 'enrollment_count', Enrollment, 'course', Count('pk')),
+    Counter(Module, 'course_count', Course, 'module', Count('pk'), is_published=True),
+)
+
+
+def reconcile_counters(dry_run=False):
+    ''' {compteur: nombre de lignes corrigées} '''
+    return {str(counter): counter.reconcile(dry_run) for counter in COUNTERS}
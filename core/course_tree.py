@@ -0,0 +1,228 @@
+import threading
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.urls import reverse
+from .catalog import catalog_version
+from .models import Course, Chapter, Lesson
+
+MAX_TREES = 512
+
+
+class LessonNode:
+    __slots__ = ('pk', 'slug', 'title', 'order', 'has_video', 'url', 'chapter', 'index')
+
+    def __init__(self, pk, slug, title, order, has_video):
+        self.pk = pk
+        self.slug = slug
+        self.title = title
+        self.order = order
+        self.has_video = has_video
+
+    @property
+    def video_url(self):
+        # route lesson_video, sous l'URL de la leçon
+        return f'{self.url}video/'
+
+    def __repr__(self):
+        return f'<LessonNode {self.slug}>'
+
+
+class ChapterNode:
+    __slots__ = ('pk', 'slug', 'name', 'description', 'order', 'lessons', 'course')
+
+    def __init__(self, pk, slug, name, description, order):
+        self.pk = pk
+        self.slug = slug
+        self.name = name
+        self.description = description
+        self.order = order
+        self.lessons = []
+
+    @property
+    def first_lesson(self):
+        return self.lessons[0] if self.lessons else None
+
+    def __repr__(self):
+        return f'<ChapterNode {self.slug}>'
+
+
+class CourseTree:
+    '''
+    Un cours complet (module, catégorie, chapitres, leçons) en objets légers,
+    URLs calculées au chargement. Lecture seule : partagé entre les requêtes.
+    '''
+    __slots__ = (
+        'pk', 'slug', 'title', 'description', 'is_published', 'teacher_id',
+        'lesson_count', 'video_duration', 'module_slug', 'module_name', 'category_slug', 'category_name',
+        'url', 'chapters', 'lessons', '_lesson_index',
+    )
+
+    def __init__(self, row):
+        self.pk = row['pk']
+        self.slug = row['slug']
+        self.title = row['title']
+        self.description = row['description']
+        self.is_published = row['is_published']
+        self.teacher_id = row['teacher_id']
+        self.lesson_count = row['lesson_count']
+        self.video_duration = row['video_duration']
+        self.module_slug = row['module__slug']
+        self.module_name = row['module__name']
+        self.category_slug = row['module__category__slug']
+        self.category_name = row['module__category__name']
+        self.url = reverse('chapter_list', args=self.path)
+        self.chapters = []
+        self.lessons = []
+        self._lesson_index = {}
+
+    @property
+    def path(self):
+        return (self.category_slug, self.module_slug, self.slug)
+
+    def _finish(self):
+        # leçons à plat dans l'ordre du cours : précédente/suivante par index
+        for chapter in self.chapters:
+            for lesson in chapter.lessons:
+                lesson.chapter = chapter
+                lesson.index = len(self.lessons)
+                lesson.url = reverse('lesson_detail', args=(*self.path, chapter.slug, lesson.slug))
+                self.lessons.append(lesson)
+                self._lesson_index[chapter.slug, lesson.slug] = lesson
+
+    def lesson(self, chapter_slug, lesson_slug):
+        return self._lesson_index.get((chapter_slug, lesson_slug))
+
+    def previous_lesson(self, lesson):
+        return self.lessons[lesson.index - 1] if lesson.index else None
+
+    def next_lesson(self, lesson):
+        following = lesson.index + 1
+        return self.lessons[following] if following < len(self.lessons) else None
+
+    def navigation(self, lesson):
+        ''' contexte de navigation de la page d'une leçon (sommaire, précédente, suivante) '''
+        chapter = lesson.chapter
+        context = {'course': self, 'chapter': chapter, 'all_lessons': chapter.lessons, 'current_node': lesson}
+
+        previous = self.previous_lesson(lesson)
+        if previous and previous.chapter is chapter:
+            context['previous_lesson'] = previous
+
+        following = self.next_lesson(lesson)
+        if following and following.chapter is chapter:
+            context['next_lesson'] = following
+        elif following:
+            context['next_chapter_lesson'] = following
+        return context
+
+    def __repr__(self):
+        return f'<CourseTree {self.slug}>'
+
+
+COURSE_FIELDS = (
+    'pk', 'slug', 'title', 'description', 'is_published', 'teacher_id',
+    'lesson_count', 'video_duration', 'module__slug', 'module__name', 'module__category__slug', 'module__category__name',
+)
+
+
+def load_course_trees(condition):
+    ''' les cours qui vérifient `condition`, en trois requêtes quel que soit leur nombre '''
+    trees = {row['pk']: CourseTree(row) for row in Course.objects.filter(condition).values(*COURSE_FIELDS)}
+    if not trees:
+        return trees
+
+    chapters = {}
+    for pk, course_id, slug, name, description, order in (
+        Chapter.objects.filter(course_id__in=trees).order_by('course_id', 'order')
+        .values_list('pk', 'course_id', 'slug', 'name', 'description', 'order')
+    ):
+        node = chapters[pk] = ChapterNode(pk, slug, name, description, order)
+        node.course = trees[course_id]
+        trees[course_id].chapters.append(node)
+
+    for pk, chapter_id, slug, title, order, video in (
+        Lesson.objects.filter(chapter_id__in=chapters).order_by('chapter_id', 'order')
+        .values_list('pk', 'chapter_id', 'slug', 'title', 'order', 'video_file')
+    ):
+        chapters[chapter_id].lessons.append(LessonNode(pk, slug, title, order, bool(video)))
+
+    for tree in trees.values():
+        tree._finish()
+    return trees
+
+
+class CourseTreeCache:
+    '''
+    Arbres gardés en mémoire du process (LRU), vidés dès que la version du
+    catalogue change. Cette version est dans le cache par défaut : une
+    modification n'est vue par les autres workers que si ce cache est
+    partagé (obligatoire hors DEBUG, core.backends.require_shared_cache).
+    '''
+
+    def __init__(self, max_size=MAX_TREES):
+        self.max_size = max_size
+        self._trees = OrderedDict()
+        self._paths = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        version = catalog_version()
+        if version != self._version:
+            self._trees.clear()
+            self._paths.clear()
+            self._version = version
+
+    def _store(self, trees, version):
+        self._check_version()
+        if version != self._version:
+            # catalogue modifié pendant le chargement : on ne garde pas ces arbres
+            return
+        for pk, tree in trees.items():
+            self._trees[pk] = tree
+            self._paths[tree.path] = pk
+        while len(self._trees) > self.max_size:
+            _, evicted = self._trees.popitem(last=False)
+            self._paths.pop(evicted.path, None)
+
+    def get(self, category_slug, module_slug, course_slug):
+        path = (category_slug, module_slug, course_slug)
+        with self._lock:
+            self._check_version()
+            version = self._version
+            pk = self._paths.get(path)
+            if pk is not None:
+                self._trees.move_to_end(pk)
+                return self._trees[pk]
+
+        trees = load_course_trees(Q(
+            slug=course_slug, module__slug=module_slug, module__category__slug=category_slug,
+        ))
+        with self._lock:
+            self._store(trees, version)
+        return next(iter(trees.values()), None)
+
+    def many(self, pks):
+        ''' arbres des cours `pks`, dans le même ordre (les absents sont ignorés) '''
+        pks = list(pks)
+        with self._lock:
+            self._check_version()
+            version = self._version
+            found = {pk: self._trees[pk] for pk in pks if pk in self._trees}
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            loaded = load_course_trees(Q(pk__in=missing))
+            with self._lock:
+                self._store(loaded, version)
+            found.update(loaded)
+        return [found[pk] for pk in pks if pk in found]
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+            self._paths.clear()
+            self._version = None
+
+
+course_trees = CourseTreeCache()
@@ -0,0 +1,39 @@
+from django.templatetags.static import static
+
+# feuilles de style demandées par base.html sur toutes les pages
+BOOTSTRAP_CSS = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css'
+
+
+def asset_links():
+    return [
+        f'<{BOOTSTRAP_CSS}>; rel=preload; as=style',
+        f'<{static("core/css/base.css")}>; rel=preload; as=style',
+    ]
+
+
+class EarlyHintsMiddleware:
+    '''
+    Middleware ASGI : envoie un 103 Early Hints avec les feuilles de style
+    avant même que la vue ne s'exécute, quand le serveur le permet
+    (extension ASGI "http.response.early_hint", ex. Hypercorn).
+    '''
+
+    def __init__(self, app, prefixes=('/start-study/',)):
+        self.app = app
+        self.prefixes = prefixes
+        self._links = None
+
+    def links(self):
+        if self._links is None:
+            self._links = [link.encode('latin-1') for link in asset_links()]
+        return self._links
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] == 'http'
+            and scope['method'] == 'GET'
+            and 'http.response.early_hint' in scope.get('extensions', {})
+            and scope['path'].startswith(self.prefixes)
+        ):
+            await send({'type': 'http.response.early_hint', 'links': self.links()})
+        await self.app(scope, receive, send)
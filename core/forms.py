@@ -1,6 +1,8 @@
 from django import forms
 from django.forms import ModelForm
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from django.contrib.auth.models import Group
 from .models import TheUser, Course
 
 
@@ -35,3 +37,27 @@ class CourseCreateForm(ModelForm):
     class Meta:
         model = Course
         fields = ['module', 'title', 'description']
+
+class RosterImportForm(forms.Form):
+    csv_file = forms.FileField(label="Fichier CSV")
+
+class EnrollActionForm(ActionForm):
+    course = forms.ModelChoiceField(
+        queryset=Course.objects.all(),
+        to_field_name='slug',
+        widget=forms.TextInput(attrs={'placeholder': 'slug du cours'}),
+        required=False,
+        label="Cours",
+    )
+
+class CohortActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        queryset=Group.objects.all(), required=False, label="Groupe"
+    )
+    source_course = forms.ModelChoiceField(
+        queryset=Course.objects.all(),
+        to_field_name='slug',
+        widget=forms.TextInput(attrs={'placeholder': 'slug du cours source'}),
+        required=False,
+        label="ou inscrits du cours",
+    )
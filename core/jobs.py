@@ -0,0 +1,216 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CANDIDATES = 5
+MAX_BACKOFF = 30.0  # secondes entre deux essais après une erreur de la boucle
+
+
+def job_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, *args, priority=0, delay=None, max_attempts=3, unique=False, **kwargs):
+    '''
+    Met func(*args, **kwargs) en file (arguments sérialisables en JSON).
+    La ligne est écrite dans la transaction en cours : annulée avec elle.
+    unique : si la même tâche attend déjà, elle suffit et est renvoyée.
+    JOBS_EAGER : exécutée sur place après le commit (tests).
+    '''
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: func(*args, **kwargs))
+        return None
+
+    if unique:
+        pending = Job.objects.filter(
+            name=job_name(func), status=Job.QUEUED, args=list(args), kwargs=kwargs
+        ).first()
+        if pending:
+            return pending
+
+    return Job.objects.create(
+        name=job_name(func), args=list(args), kwargs=kwargs, priority=priority,
+        run_at=timezone.now() + (delay or timedelta()), max_attempts=max_attempts,
+    )
+
+
+def claim(worker_id):
+    '''
+    Réserve la prochaine tâche prête. UPDATE conditionnel sur le statut :
+    si un autre worker l'a prise entre-temps, 0 ligne modifiée, on passe à la suivante.
+    '''
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+        .order_by('-priority', 'run_at', 'pk').values_list('pk', flat=True)[:CLAIM_CANDIDATES]
+    )
+    for pk in candidates:
+        won = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, started_at=now, attempts=F('attempts') + 1,
+        )
+        if won:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def execute(job):
+    ''' exécute une tâche réservée et enregistre son issue (durée, erreur, nouvel essai) '''
+    start = time.perf_counter()
+    try:
+        import_string(job.name)(*job.args, **job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.DEAD
+            logger.error("tâche %s abandonnée après %d essai(s)", job, job.attempts)
+        else:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+            logger.warning("tâche %s en échec, nouvel essai à %s", job, job.run_at)
+    else:
+        job.status = Job.DONE
+        job.last_error = ''
+
+    job.duration = time.perf_counter() - start
+    job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.save(update_fields=['status', 'run_at', 'last_error', 'duration', 'finished_at', 'locked_by'])
+    return job
+
+
+def requeue_stale(timeout=None):
+    '''
+    Tâches restées "en cours" (worker arrêté brutalement, tâche trop longue) :
+    l'essai interrompu compte (attempts est incrémenté par claim), comme un
+    échec dans execute() : nouvel essai différé, ou DEAD au dernier essai.
+    Renvoie le nombre de tâches remises en file.
+    '''
+    now = timezone.now()
+    limit = now - timedelta(seconds=timeout or settings.JOBS_LOCK_TIMEOUT)
+    error = f"toujours en cours après {timeout or settings.JOBS_LOCK_TIMEOUT} s : worker arrêté ou tâche trop longue"
+    requeued = 0
+    stale = Job.objects.filter(status=Job.RUNNING, started_at__lt=limit)
+    for pk, attempts, max_attempts in stale.values_list('pk', 'attempts', 'max_attempts'):
+        # UPDATE conditionnel : la tâche a pu se terminer entre-temps
+        job = Job.objects.filter(pk=pk, status=Job.RUNNING)
+        if attempts >= max_attempts:
+            if job.update(status=Job.DEAD, locked_by='', finished_at=now, last_error=error):
+                logger.error("tâche #%d abandonnée après %d essai(s) : %s", pk, attempts, error)
+        else:
+            requeued += job.update(
+                status=Job.QUEUED, locked_by='', run_at=now + retry_delay(attempts), last_error=error,
+            )
+    return requeued
+
+
+def run_pending(worker_id='inline', limit=None):
+    ''' exécute les tâches prêtes jusqu'à épuisement (ou `limit`) ; renvoie leur nombre '''
+    done = 0
+    while limit is None or done < limit:
+        job = claim(worker_id)
+        if job is None:
+            break
+        execute(job)
+        done += 1
+    return done
+
+
+def job_stats(since=None):
+    ''' métriques par tâche : nombre, échecs définitifs, durée moyenne et maximale '''
+    jobs = Job.objects.filter(finished_at__isnull=False)
+    if since:
+        jobs = jobs.filter(finished_at__gte=since)
+    return list(
+        jobs.order_by().values('name').annotate(
+            count=Count('pk'),
+            dead=Count('pk', filter=Q(status=Job.DEAD)),
+            avg_duration=Avg('duration'),
+            max_duration=Max('duration'),
+        ).order_by('name')
+    )
+
+
+class WorkerPool:
+    ''' N threads qui réservent et exécutent des tâches jusqu'à stop() '''
+
+    def __init__(self, threads=1, poll_interval=1.0, burst=False):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.processed = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, index):
+        worker_id = f'{self._prefix}:{index}'
+        next_sweep = time.monotonic() + settings.JOBS_LOCK_TIMEOUT
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    close_old_connections()
+                    if index == 0 and time.monotonic() > next_sweep:
+                        requeue_stale()
+                        next_sweep = time.monotonic() + settings.JOBS_LOCK_TIMEOUT
+                    job = claim(worker_id)
+                    if job is not None:
+                        execute(job)
+                except Exception:
+                    # "database is locked" passager : le thread patiente et reprend,
+                    # le pool ne rétrécit pas (tâche réservée : remise en file par requeue_stale)
+                    failures += 1
+                    delay = min(max(self.poll_interval, 0.1) * 2 ** failures, MAX_BACKOFF)
+                    logger.exception("worker %s : erreur, reprise dans %.1f s", worker_id, delay)
+                    connections.close_all()
+                    self._stop.wait(delay)
+                    continue
+
+                failures = 0
+                if job is None:
+                    if self.burst:
+                        return
+                    self._stop.wait(self.poll_interval)
+                    continue
+                with self._lock:
+                    self.processed += 1
+        finally:
+            connections.close_all()
+
+    def run(self):
+        requeue_stale()
+        workers = [
+            threading.Thread(target=self._loop, args=(i,), name=f'opyc-worker-{i}', daemon=True)
+            for i in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for worker in workers:
+                worker.join()
+        return self.processed
@@ -0,0 +1,98 @@
+import logging
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, migrations, models
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.test.utils import setup_test_environment, teardown_test_environment
+from core.query_audit import audit, index_name, view_requests
+from core.seed import seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Rejoue chaque vue sur un catalogue généré (base de test jetable), passe chaque requête "
+        "dans EXPLAIN QUERY PLAN et propose des index pour les parcours complets et tris temporaires"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=20)
+        parser.add_argument('--students', type=int, default=50)
+        parser.add_argument('--verbose-plans', action='store_true', help="affiche le SQL et le plan de chaque constat")
+        parser.add_argument('--migration', metavar='NOM',
+                            help="écrit une migration core/migrations/<n>_<NOM>.py avec les index proposés")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("EXPLAIN QUERY PLAN : SQLite uniquement")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            data = seed_catalog(
+                courses=options['courses'], chapters=3, lessons=4,
+                students=options['students'], enrollments=10, prefix='audit',
+            )
+            # les 404 attendues (vidéo absente, page inexistante) ne polluent pas le rapport
+            request_logger = logging.getLogger('django.request')
+            level = request_logger.level
+            request_logger.setLevel(logging.ERROR)
+            try:
+                counts, findings, advice = audit(view_requests(data, 'audit'))
+            finally:
+                request_logger.setLevel(level)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(counts, findings, advice, options['verbose_plans'])
+        if options['migration'] and advice:
+            self.write_migration(options['migration'], advice)
+
+    def report(self, counts, findings, advice, verbose):
+        by_view = {}
+        for finding in findings:
+            by_view.setdefault(finding.view, []).append(finding)
+
+        self.stdout.write(f"{'vue':<22} {'requêtes':>8} {'parcours':>8} {'tris':>5}")
+        for view, count in counts.items():
+            problems = [p for f in by_view.get(view, []) for p in f.problems]
+            scans = sum(kind == 'scan' for kind, _, _ in problems)
+            sorts = sum(kind == 'sort' for kind, _, _ in problems)
+            line = f"{view:<22} {count:>8} {scans:>8} {sorts:>5}"
+            self.stdout.write(self.style.WARNING(line) if problems else line)
+
+        if verbose:
+            for finding in findings:
+                self.stdout.write(f"\n[{finding.view}] {finding.sql}")
+                for detail in finding.plan:
+                    self.stdout.write(f"    {detail}")
+
+        if not advice:
+            self.stdout.write(self.style.SUCCESS("\naucun index à proposer"))
+            return
+        self.stdout.write("\nindex proposés (à ajouter dans Meta.indexes) :")
+        for (model, fields), views in sorted(advice.items(), key=lambda item: -len(item[1])):
+            self.stdout.write(
+                f"  {model.__name__}: models.Index(fields={list(fields)!r}, name={index_name(model, fields)!r})"
+                f"  # {', '.join(sorted(views))}"
+            )
+
+    def write_migration(self, name, advice):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        leaves = loader.graph.leaf_nodes('core')
+        number = int(leaves[0][1].split('_')[0]) + 1 if leaves else 1
+
+        migration = migrations.Migration(f'{number:04d}_{name}', 'core')
+        migration.dependencies = leaves
+        migration.operations = [
+            migrations.AddIndex(model_name=model._meta.model_name,
+                                index=models.Index(fields=list(fields), name=index_name(model, fields)))
+            for model, fields in advice
+        ]
+        writer = MigrationWriter(migration)
+        with open(writer.path, 'w') as fp:
+            fp.write(writer.as_string())
+        self.stdout.write(self.style.SUCCESS(f"\n{os.path.relpath(writer.path)} écrite"))
+        self.stdout.write("  ajoutez les mêmes index dans Meta.indexes, sinon makemigrations les retirera")
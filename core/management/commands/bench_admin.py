@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from core.models import TheUser, Course, Chapter, Lesson, Enrollment
+from core.seed import seed_catalog
+
+CHANGELISTS = (
+    ('/admin/core/course/', Course),
+    ('/admin/core/chapter/', Chapter),
+    ('/admin/core/lesson/', Lesson),
+    ('/admin/core/enrollment/', Enrollment),
+    ('/admin/core/theuser/', TheUser),
+)
+
+
+class Command(BaseCommand):
+    help = "Mesure la latence des changelists de l'admin à plusieurs volumes (base de test jetable)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                            help="nombre de cours ajoutés à chaque palier")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.bench(options['sizes'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def bench(self, sizes, repeat):
+        admin = TheUser.objects.create_superuser('bench-admin', 'bench@example.com', None)
+        client = Client()
+        client.force_login(admin)
+
+        self.stdout.write(f"{'lignes':>8}  {'page':<26} {'médiane ms':>10} {'requêtes':>8}")
+        for step, size in enumerate(sizes):
+            seed_catalog(
+                courses=size, chapters=2, lessons=3, students=max(size // 10, 1),
+                enrollments=5, prefix=f'bench{step}',
+            )
+            for url, model in CHANGELISTS:
+                timings = []
+                for _ in range(repeat):
+                    with CaptureQueriesContext(connection) as ctx:
+                        start = time.perf_counter()
+                        client.get(url)
+                        timings.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(
+                    f"{model.objects.count():>8}  {url:<26} {statistics.median(timings):>10.1f} "
+                    f"{len(ctx.captured_queries):>8}"
+                )
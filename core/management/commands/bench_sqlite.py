@@ -0,0 +1,125 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from core.models import Enrollment
+from core.seed import seed_catalog
+
+# réglages d'avant : ceux de Django par défaut
+DEFAULT_OPTIONS = {'init_command': 'PRAGMA journal_mode=DELETE;PRAGMA synchronous=FULL'}
+
+
+def toggle_enrollment(student_id, course_id):
+    ''' une écriture par appel : inscrit, ou désinscrit si déjà inscrit '''
+    enrollment, created = Enrollment.objects.get_or_create(student_id=student_id, course_id=course_id)
+    if not created:
+        enrollment.delete()
+
+
+class Command(BaseCommand):
+    help = (
+        "Débit lecture/écriture SQLite sur une base fichier jetable : réglages par défaut, "
+        "puis pragmas de production (WAL...)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help="durée de chaque mesure")
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--courses', type=int, default=20)
+
+    def handle(self, *args, **options):
+        tmp = tempfile.mkdtemp(prefix='opyc-bench-')
+        original = connection.settings_dict['OPTIONS']
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            data = seed_catalog(
+                courses=options['courses'], chapters=1, lessons=1,
+                students=options['students'], enrollments=0, prefix='bench',
+            )
+            pairs = [(s.pk, c.pk) for s in data['students'] for c in data['courses']]
+            phases = (
+                ('défaut', DEFAULT_OPTIONS),
+                ('production', original),
+            )
+            self.stdout.write(
+                f"{'réglages':<18} {'lectures/s':>10} {'écritures/s':>11} {'p95 écriture ms':>15} {'verrous':>8}"
+            )
+            for name, db_options in phases:
+                result = self.phase(db_options, pairs, options)
+                self.stdout.write(
+                    f"{name:<18} {result['reads']:>10.0f} {result['writes']:>11.0f} "
+                    f"{result['p95']:>15.1f} {result['locked']:>8}"
+                )
+        finally:
+            connection.settings_dict['OPTIONS'] = original
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def phase(self, db_options, pairs, options):
+        # nouvelles connexions avec ces réglages (le journal se change sans autre connexion ouverte)
+        connection.close()
+        connection.settings_dict['OPTIONS'] = db_options
+        connection.ensure_connection()
+
+        deadline = time.monotonic() + options['seconds']
+        reads, writes, latencies, locked = [0], [0], [], [0]
+        lock = threading.Lock()
+        course_ids = sorted({course for _, course in pairs})
+
+        def reader():
+            count = 0
+            while time.monotonic() < deadline:
+                course = random.choice(course_ids)
+                list(Enrollment.objects.filter(course_id=course).values_list('student_id', flat=True)[:50])
+                count += 1
+            with lock:
+                reads[0] += count
+
+        def writer():
+            done, mine, errors = 0, [], 0
+            while time.monotonic() < deadline:
+                pair = random.choice(pairs)
+                start = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        toggle_enrollment(*pair)
+                except OperationalError:
+                    errors += 1
+                    continue
+                mine.append(time.perf_counter() - start)
+                done += 1
+            with lock:
+                writes[0] += done
+                latencies.extend(mine)
+                locked[0] += errors
+
+        def run(target):
+            try:
+                target()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(reader,)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=run, args=(writer,)) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        seconds = options['seconds']
+        p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else 0.0
+        return {'reads': reads[0] / seconds, 'writes': writes[0] / seconds, 'p95': p95, 'locked': locked[0]}
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core.models import Course
+from core.snapshots import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Génère les pages statiques de tous les cours publiés (premier déploiement, reprise)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('courses', nargs='*', help="slugs des cours (tous les cours publiés par défaut)")
+
+    def handle(self, *args, **options):
+        courses = Course.objects.filter(is_published=True)
+        if options['courses']:
+            courses = courses.filter(slug__in=options['courses'])
+
+        built = 0
+        for pk, slug in courses.values_list('pk', 'slug').iterator():
+            version = build_snapshot(pk)
+            self.stdout.write(f"{slug} : {version}")
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f"{built} cours publié(s) en statique"))
@@ -0,0 +1,44 @@
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from core.cohorts import (
+    cohort_from_course, cohort_from_group, cohort_from_usernames,
+    enroll_cohort, read_usernames,
+)
+from core.models import Course
+
+
+class Command(BaseCommand):
+    help = "Inscrit une cohorte d'apprenants (groupe, CSV ou inscrits d'un autre cours) à des cours"
+
+    def add_arguments(self, parser):
+        parser.add_argument('courses', nargs='+', help="slugs des cours cibles")
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--group', help="nom du groupe")
+        source.add_argument('--csv', help="CSV avec une colonne username")
+        source.add_argument('--from-course', help="slug du cours dont on copie les inscrits")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        courses = list(Course.objects.filter(slug__in=options['courses']))
+        unknown = set(options['courses']) - {c.slug for c in courses}
+        if unknown:
+            raise CommandError(f"cours introuvable(s) : {', '.join(sorted(unknown))}")
+
+        if options['group']:
+            try:
+                group = Group.objects.get(name=options['group'])
+            except Group.DoesNotExist:
+                raise CommandError(f"groupe introuvable : {options['group']}")
+            students = cohort_from_group(group)
+        elif options['csv']:
+            with open(options['csv'], newline='', encoding='utf-8-sig') as fp:
+                students = cohort_from_usernames(read_usernames(fp))
+        else:
+            try:
+                source = Course.objects.get(slug=options['from_course'])
+            except Course.DoesNotExist:
+                raise CommandError(f"cours introuvable : {options['from_course']}")
+            students = cohort_from_course(source)
+
+        created = enroll_cohort(students, courses, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{created} inscription(s) créée(s)"))
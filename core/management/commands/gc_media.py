@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.media_gc import MediaCollector
+
+
+class Command(BaseCommand):
+    help = "Supprime les fichiers de MEDIA_ROOT qui ne sont plus référencés par aucune leçon"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="affiche l'espace récupérable sans rien supprimer")
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help="ignore les fichiers plus récents (secondes)")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.5,
+                            help="pause entre deux lots de suppressions (secondes)")
+        parser.add_argument('--manifest', default=settings.MEDIA_GC_MANIFEST)
+
+    def handle(self, *args, **options):
+        collector = MediaCollector(
+            settings.MEDIA_ROOT,
+            options['manifest'],
+            min_age=options['min_age'],
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            dry_run=options['dry_run'],
+        ).run()
+
+        self.stdout.write(
+            f"{collector.scanned} dossier(s) examiné(s), "
+            f"{collector.skipped} inchangé(s) ignoré(s)"
+        )
+        size = collector.reclaimable / (1024 * 1024)
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f"{collector.orphans} fichier(s) orphelin(s), {size:.1f} Mo récupérables"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{collector.deleted} fichier(s) supprimé(s), {size:.1f} Mo libérés"
+            ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.roster import import_roster, read_roster
+
+
+class Command(BaseCommand):
+    help = "Importe des apprenants et enseignants depuis un CSV (username,password,role,email,first_name,last_name)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--workers', type=int, default=None,
+                            help="process utilisés pour hasher les mots de passe")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            fp = open(options['csv_file'], newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(e)
+
+        with fp:
+            report = import_roster(
+                read_roster(fp),
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+            )
+
+        for line, message in report.errors:
+            self.stderr.write(f"ligne {line} : {message}")
+        self.stdout.write(self.style.SUCCESS(str(report)))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from core.catalog import bump_catalog_version
+from core.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs dénormalisés (leçons, durée, inscriptions, cours) qui ont dérivé"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="affiche les écarts sans rien corriger")
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters(dry_run=options['dry_run'])
+
+        for counter, count in fixed.items():
+            if count:
+                self.stdout.write(f"{counter} : {count} ligne(s) en écart")
+        total = sum(fixed.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{total} ligne(s) à corriger"))
+            return
+
+        if total:
+            # les arbres de cours en mémoire portent les compteurs de leçons
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"{total} ligne(s) corrigée(s)"))
@@ -0,0 +1,58 @@
+import signal
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.jobs import WorkerPool, job_stats
+
+
+class Command(BaseCommand):
+    help = "Exécute les tâches en file (table Job) avec un pool de threads, éventuellement sur plusieurs process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.JOBS_WORKERS)
+        parser.add_argument('--processes', type=int, default=1,
+                            help="lance autant de process, chacun avec --threads threads")
+        parser.add_argument('--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL)
+        parser.add_argument('--burst', action='store_true',
+                            help="s'arrête quand la file est vide (cron, tests)")
+
+    def handle(self, *args, **options):
+        if options['processes'] > 1:
+            return self.spawn(options)
+
+        started = timezone.now()
+        pool = WorkerPool(options['threads'], options['poll_interval'], options['burst'])
+        signal.signal(signal.SIGTERM, lambda *_: pool.stop())
+        processed = pool.run()
+
+        for row in job_stats(since=started):
+            self.stdout.write(
+                f"{row['name']} : {row['count']} tâche(s), {row['dead']} abandonnée(s), "
+                f"moyenne {row['avg_duration']:.3f} s, max {row['max_duration']:.3f} s"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{processed} tâche(s) exécutée(s)"))
+
+    def spawn(self, options):
+        command = [
+            sys.executable, sys.argv[0], 'run_workers', '--processes', '1',
+            '--threads', str(options['threads']), '--poll-interval', str(options['poll_interval']),
+        ]
+        if options['burst']:
+            command.append('--burst')
+        children = [subprocess.Popen(command) for _ in range(options['processes'])]
+
+        def stop(*_):
+            for child in children:
+                child.terminate()
+        signal.signal(signal.SIGTERM, stop)
+
+        try:
+            for child in children:
+                child.wait()
+        except KeyboardInterrupt:
+            stop()
+            for child in children:
+                child.wait()
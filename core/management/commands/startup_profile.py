@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+FIRST_RESPONSE_SCRIPT = '''
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+from classrooms.wsgi import application
+booted = time.perf_counter()
+
+def call(path):
+    environ = {'PATH_INFO': path}
+    setup_testing_defaults(environ)
+    status = []
+    begin = time.perf_counter()
+    b''.join(application(environ, lambda s, h, exc_info=None: status.append(s)))
+    return time.perf_counter() - begin, status[0]
+
+first, status = call(sys.argv[1])
+second, _ = call(sys.argv[1])
+print(json.dumps({
+    'boot': booted - start, 'first': first, 'second': second, 'status': status,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = "Mesure le coût de démarrage de classrooms.wsgi : imports par module et première réponse"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help="URL demandée pour la première réponse")
+        parser.add_argument('--top', type=int, default=20, help="nombre de modules affichés")
+
+    def run(self, args, warmup):
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'classrooms.settings'),
+            'OPYC_WARMUP': '1' if warmup else '0',
+        }
+        result = subprocess.run(
+            [sys.executable, *args], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr)
+        return result
+
+    def import_times(self):
+        ''' sortie de python -X importtime : (cumulé µs, propre µs, module) '''
+        result = self.run(['-X', 'importtime', '-c', 'import classrooms.wsgi'], warmup=False)
+        rows = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            own, cumulative, module = line[len('import time:'):].split('|')
+            rows.append((int(cumulative), int(own), module.strip()))
+        return rows
+
+    def handle(self, *args, **options):
+        rows = self.import_times()
+        total = sum(own for _, own, _ in rows)
+        self.stdout.write(f"imports : {len(rows)} modules, {total / 1000:.1f} ms au total")
+        self.stdout.write(f"{'cumulé ms':>10} {'propre ms':>10}  module")
+        for cumulative, own, module in sorted(rows, reverse=True)[:options['top']]:
+            self.stdout.write(f"{cumulative / 1000:>10.1f} {own / 1000:>10.1f}  {module}")
+
+        self.stdout.write(f"\npremière réponse ({options['path']}) :")
+        for warmup in (False, True):
+            data = json.loads(self.run(
+                ['-c', FIRST_RESPONSE_SCRIPT, options['path']], warmup=warmup
+            ).stdout)
+            label = 'avec warm-up' if warmup else 'sans warm-up'
+            self.stdout.write(
+                f"  {label:<13} démarrage {data['boot'] * 1000:7.1f} ms, "
+                f"1re requête {data['first'] * 1000:7.1f} ms, "
+                f"2e requête {data['second'] * 1000:7.1f} ms ({data['status']})"
+            )
@@ -0,0 +1,161 @@
+'''
+Application ASGI autonome qui sert les vidéos aux URLs signées
+(core.signed_media) : ni Django, ni base, seulement la clé et le dossier.
+
+    OPYC_MEDIA_ROOT=/srv/opyc/media OPYC_MEDIA_KEY=... uvicorn core.media_app:application
+
+Les flux passent par un core.streaming.StreamLimiter, par utilisateur
+signé (u) et au total : classrooms/asgi.py, qui la monte devant Django sur
+SIGNED_MEDIA_URL, lui donne celui de lesson_video ; lancée seule, elle en
+crée un avec les réglages VIDEO_* de classrooms.settings.
+
+Avec OPYC_MEDIA_ACCEL=/internal-media/ elle ne fait que vérifier et renvoie
+un X-Accel-Redirect : nginx envoie le fichier (et peut le mettre en cache),
+au débit par utilisateur (X-Accel-Limit-Rate) ; les flux simultanés sont
+alors à limiter dans nginx (limit_conn).
+'''
+import asyncio
+import mimetypes
+import os
+import time
+from urllib.parse import parse_qsl, quote
+
+from .signed_media import chunk_sizes, clean_path, serve_range, verify_query
+from .streaming import TooManyStreams
+
+CHUNK_SIZE = 256 * 1024
+
+
+class SignedMediaApp:
+
+    def __init__(self, root, key, prefix='/protected-media/', accel_redirect=None, chunk_size=CHUNK_SIZE,
+                 limiter=None):
+        self.root = os.path.abspath(root)
+        self.key = key
+        self.prefix = prefix
+        self.accel_redirect = accel_redirect
+        self.chunk_size = chunk_size
+        self.limiter = limiter
+
+    @classmethod
+    def from_env(cls):
+        from .streaming import StreamLimiter
+
+        # limites de débit : réglages VIDEO_* (module lu seul, sans django.setup())
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'classrooms.settings')
+        return cls(
+            root=os.environ['OPYC_MEDIA_ROOT'],
+            key=os.environ['OPYC_MEDIA_KEY'],
+            prefix=os.environ.get('OPYC_SIGNED_MEDIA_URL', '/protected-media/'),
+            accel_redirect=os.environ.get('OPYC_MEDIA_ACCEL') or None,
+            limiter=StreamLimiter(),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await self.error(send, 405)
+        path = scope['path']
+        name = clean_path(path[len(self.prefix):]) if path.startswith(self.prefix) else None
+        if name is None:
+            return await self.error(send, 404)
+
+        params = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        if not verify_query(self.key, name, params):
+            return await self.error(send, 403)
+
+        # la signature dans l'URL fait le contrôle d'accès : navigateur et
+        # frontal réutilisent la réponse jusqu'à l'expiration signée
+        headers = [(b'cache-control', f'public, max-age={max(int(params["e"]) - int(time.time()), 0)}'.encode())]
+        if self.accel_redirect:
+            headers.append((b'x-accel-redirect', quote(self.accel_redirect + name).encode()))
+            if self.limiter and self.limiter.user_rate:
+                headers.append((b'x-accel-limit-rate', str(self.limiter.user_rate).encode()))
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        await self.serve(scope, send, os.path.join(self.root, *name.split('/')), headers, int(params['u']))
+
+    async def serve(self, scope, send, filename, headers, user_id):
+        try:
+            fp = await asyncio.to_thread(open, filename, 'rb')
+        except (FileNotFoundError, IsADirectoryError):
+            return await self.error(send, 404)
+
+        try:
+            size = os.fstat(fp.fileno()).st_size
+            request_headers = dict(scope.get('headers', []))
+            status, start, end, range_headers = serve_range(
+                request_headers.get(b'range', b'').decode('latin-1'),
+                request_headers.get(b'if-range', b'').decode('latin-1'),
+                size, f'"{os.path.basename(filename)}"',
+            )
+            range_headers = [(k.lower().encode(), v.encode()) for k, v in range_headers.items()]
+            if status == 416:
+                return await self.error(send, 416, range_headers)
+
+            body = scope['method'] != 'HEAD' and size > 0
+            if body and self.limiter:
+                try:
+                    self.limiter.open(user_id)
+                except TooManyStreams as e:
+                    return await self.error(send, 429, [(b'retry-after', str(e.retry_after).encode())])
+            headers += [
+                (b'content-type', (mimetypes.guess_type(filename)[0] or 'application/octet-stream').encode()),
+                *range_headers,
+            ]
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+
+            if not body:
+                return await send({'type': 'http.response.body', 'body': b''})
+            if self.limiter:
+                # la place prise par open() est rendue à la fermeture du flux
+                chunks = self.limiter.stream(fp, user_id, start, end, asynchronous=True, chunk_size=self.chunk_size)
+            else:
+                chunks = self.chunks(fp, start, end)
+            remaining = end - start + 1
+            try:
+                async for data in chunks:
+                    remaining -= len(data)
+                    await send({'type': 'http.response.body', 'body': data, 'more_body': remaining > 0})
+            finally:
+                if self.limiter:
+                    await asyncio.to_thread(chunks.close)
+            if remaining > 0:
+                # fichier raccourci pendant l'envoi
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await asyncio.to_thread(fp.close)
+
+    async def chunks(self, fp, start, end):
+        await asyncio.to_thread(fp.seek, start)
+        for amount in chunk_sizes(start, end, self.chunk_size):
+            data = await asyncio.to_thread(fp.read, amount)
+            if not data:
+                break
+            yield data
+
+    async def error(self, send, status, headers=()):
+        await send({
+            'type': 'http.response.start', 'status': status,
+            'headers': [(b'content-type', b'text/plain'), *headers],
+        })
+        await send({'type': 'http.response.body', 'body': str(status).encode()})
+
+
+def __getattr__(name):
+    # `application` construite à la demande du serveur ASGI : l'import seul
+    # (tests, classrooms/asgi.py) ne réclame pas les variables d'environnement
+    if name == 'application':
+        return SignedMediaApp.from_env()
+    raise AttributeError(name)
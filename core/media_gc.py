@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Lesson, VideoBlob
+
+
+def referenced_files(media_root):
+    ''' {dossier absolu: {noms de fichiers}} référencés en base, lus par paquets '''
+    refs = defaultdict(set)
+    names = (
+        Lesson.objects.exclude(video_file='').exclude(video_file__isnull=True)
+        .values_list('video_file', flat=True)
+        .iterator(chunk_size=2000)
+    )
+    for name in names:
+        path = os.path.normpath(os.path.join(media_root, name))
+        refs[os.path.dirname(path)].add(os.path.basename(path))
+    return refs
+
+
+def _fingerprint(names):
+    return hashlib.sha1('\n'.join(sorted(names)).encode()).hexdigest()
+
+
+class MediaCollector:
+    '''
+    Parcourt MEDIA_ROOT dossier par dossier. Le manifeste retient, pour chaque
+    dossier propre, son mtime, l'empreinte des fichiers référencés et ses
+    sous-dossiers : un dossier inchangé n'est plus relu aux passages suivants.
+    '''
+
+    def __init__(self, media_root, manifest_path, min_age=3600,
+                 batch_size=500, sleep=0.0, dry_run=False, checkpoint_every=200):
+        self.media_root = os.path.normpath(media_root)
+        self.manifest_path = manifest_path
+        self.min_age = min_age
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.dry_run = dry_run
+        self.checkpoint_every = checkpoint_every
+
+        self.scanned = 0
+        self.skipped = 0
+        self.orphans = 0
+        self.reclaimable = 0
+        self.deleted = 0
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest):
+        tmp = f'{self.manifest_path}.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(manifest, fp)
+        os.replace(tmp, self.manifest_path)
+
+    def run(self):
+        refs = referenced_files(self.media_root)
+        old = self.load_manifest()
+        manifest = {}
+        pending = []  # (chemin, taille, dossier)
+        deadline = time.time() - self.min_age
+        manifest_abs = os.path.abspath(self.manifest_path)
+
+        stack = [self.media_root]
+        while stack:
+            directory = stack.pop()
+            key = os.path.relpath(directory, self.media_root)
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            fingerprint = _fingerprint(refs.get(directory, ()))
+
+            entry = old.get(key)
+            if entry and entry['mtime'] == mtime and entry['refs'] == fingerprint:
+                self.skipped += 1
+                manifest[key] = entry
+                stack.extend(os.path.join(directory, d) for d in entry['subdirs'])
+                continue
+
+            self.scanned += 1
+            found = False
+            subdirs = []
+            young = 0
+            keep = refs.get(directory, set())
+            with os.scandir(directory) as it:
+                for item in it:
+                    if item.is_dir(follow_symlinks=False):
+                        subdirs.append(item.name)
+                        continue
+                    if item.name in keep or item.path == manifest_abs:
+                        continue
+                    stat = item.stat(follow_symlinks=False)
+                    # fichier récent : un upload est peut-être en cours
+                    if stat.st_mtime < deadline:
+                        pending.append((item.path, stat.st_size, key))
+                        found = True
+                    else:
+                        young += 1
+
+            stack.extend(os.path.join(directory, d) for d in subdirs)
+            # un dossier n'est mémorisé comme propre que sans orphelin restant
+            clean = not young and not (self.dry_run and found)
+            if clean:
+                manifest[key] = {'mtime': mtime, 'refs': fingerprint, 'subdirs': subdirs}
+
+            if len(pending) >= self.batch_size or self.scanned % self.checkpoint_every == 0:
+                # on ne sauvegarde le manifeste qu'une fois les orphelins traités
+                self._collect(pending, manifest)
+                pending = []
+                self.save_manifest({**old, **manifest})
+
+        self._collect(pending, manifest)
+        self.save_manifest(manifest)
+        return self
+
+    def _collect(self, pending, manifest):
+        if not pending:
+            return
+        self.orphans += len(pending)
+        self.reclaimable += sum(size for _, size, _ in pending)
+        if self.dry_run:
+            return
+
+        # pause après chaque lot, même à l'intérieur d'un seul gros dossier
+        for start in range(0, len(pending), self.batch_size):
+            kept = self._delete(pending[start:start + self.batch_size])
+            # fichier gardé : son dossier sera relu au prochain passage
+            for key in kept:
+                manifest.pop(key, None)
+            if self.sleep:
+                time.sleep(self.sleep)
+
+        # la suppression a modifié le mtime des dossiers touchés
+        for key in {key for _, _, key in pending}:
+            if key in manifest:
+                manifest[key]['mtime'] = os.stat(os.path.join(self.media_root, key)).st_mtime_ns
+
+    def _delete(self, batch):
+        '''
+        Supprime un lot ; renvoie les dossiers des fichiers gardés. Les blobs
+        sont relus sous verrou : un upload qui vient de retrouver ce contenu
+        (storage._save) a rafraîchi updated_at ou acquis une référence.
+        '''
+        names = {
+            os.path.relpath(path, self.media_root).replace(os.sep, '/'): (path, key)
+            for path, _, key in batch
+        }
+        recent = timezone.now() - timedelta(seconds=self.min_age)
+        kept = set()
+        with transaction.atomic():
+            blobs = VideoBlob.objects.select_for_update().filter(name__in=names)
+            in_use = set(
+                blobs.filter(Q(ref_count__gt=0) | Q(updated_at__gt=recent)).values_list('name', flat=True)
+            )
+            blobs.exclude(name__in=in_use).delete()
+            for name, (path, key) in names.items():
+                if name in in_use:
+                    kept.add(key)
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.deleted += 1
+        return kept
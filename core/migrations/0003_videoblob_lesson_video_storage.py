@@ -0,0 +1,43 @@
+# Generated by Django 6.0.2 on 2026-10-19 09:12
+
+import core.storage
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_remove_lessonvideo_unique_video_order_per_lesson_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=1000, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='course',
+            options={'ordering': ['created_at']},
+        ),
+        migrations.AlterModelOptions(
+            name='enrollment',
+            options={'ordering': ['created_at']},
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='video_file',
+            field=models.FileField(blank=True, max_length=1000, null=True, storage=core.storage.get_video_storage, upload_to='lessons/videos/%Y/%m/%d/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['mp4', 'mkv'], message='Formats autorisés : .mp4, .mkv')]),
+        ),
+    ]
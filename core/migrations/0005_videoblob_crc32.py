@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_videoblob_lesson_video_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videoblob',
+            name='crc32',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
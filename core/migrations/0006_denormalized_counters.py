@@ -0,0 +1,77 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:05
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Module = apps.get_model('core', 'Module')
+    Course = apps.get_model('core', 'Course')
+    Chapter = apps.get_model('core', 'Chapter')
+    Lesson = apps.get_model('core', 'Lesson')
+    Enrollment = apps.get_model('core', 'Enrollment')
+
+    def total(source, link, aggregate, **filters):
+        rows = (
+            source.objects.filter(**{link: OuterRef('pk')}, **filters)
+            .order_by().values(link).annotate(value=aggregate).values('value')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    Chapter.objects.update(
+        lesson_count=total(Lesson, 'chapter', Count('pk')),
+        video_duration=total(Lesson, 'chapter', Sum('video_duration')),
+    )
+    Course.objects.update(
+        lesson_count=total(Lesson, 'chapter__course', Count('pk')),
+        video_duration=total(Lesson, 'chapter__course', Sum('video_duration')),
+        enrollment_count=total(Enrollment, 'course', Count('pk')),
+    )
+    Module.objects.update(course_count=total(Course, 'module', Count('pk'), is_published=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_videoblob_crc32'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='video_duration',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='en secondes'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='enrollment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='video_duration',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='en secondes'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='video_duration',
+            field=models.PositiveIntegerField(default=0, help_text='durée de la vidéo, en secondes'),
+        ),
+        migrations.AddField(
+            model_name='module',
+            name='course_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('name', models.CharField(max_length=200)),
+                ('args', models.JSONField(blank=True, default=list)),
+                ('kwargs', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'En attente'), ('running', 'En cours'), ('done', 'Terminée'), ('dead', 'Abandonnée')], default='queued', max_length=10)),
+                ('priority', models.SmallIntegerField(default=0, help_text="les plus grandes d'abord")),
+                ('run_at', models.DateTimeField(help_text='pas exécutée avant cette date')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.FloatField(blank=True, help_text='en secondes', null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeadJob',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'tâche abandonnée',
+                'verbose_name_plural': 'tâches abandonnées',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.job',),
+        ),
+    ]
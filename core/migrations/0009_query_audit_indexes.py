@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['is_published', 'created_at'], name='course_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['module', 'is_published', 'created_at'], name='course_module_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['teacher', 'is_published', 'created_at'], name='course_teacher_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['student', 'created_at'], name='enrollment_student_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['created_at'], name='enrollment_created_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0.2 on 2026-10-19 17:10
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize(text):
+    # copie de core.utils.normalize au moment de la migration
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    return re.sub(r'[^0-9a-z]+', ' ', text).strip()
+
+
+def fill_search_keys(apps, schema_editor):
+    for model, source in (('Course', 'title'), ('Chapter', 'name'), ('Lesson', 'title')):
+        Model = apps.get_model('core', model)
+        rows = Model.objects.values_list('pk', source).iterator(chunk_size=2000)
+        Model.objects.bulk_update(
+            [Model(pk=pk, search_key=normalize(value)[:150]) for pk, value in rows],
+            ['search_key'], batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_query_audit_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='search_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='search_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='search_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddIndex(
+            model_name='chapter',
+            index=models.Index(fields=['search_key'], name='chapter_search_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['search_key'], name='course_search_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['search_key'], name='lesson_search_key_idx'),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_search_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FanOutProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=32)),
+                ('backend', models.CharField(max_length=200)),
+                ('last_recipient', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'backend'), name='unique_fan_out_progress')],
+            },
+        ),
+    ]
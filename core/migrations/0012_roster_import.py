@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-19 18:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_fan_out_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RosterImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('filename', models.CharField(help_text='fichier déposé sous ROSTER_IMPORT_ROOT', max_length=255)),
+                ('created', models.PositiveIntegerField(blank=True, null=True)),
+                ('errors', models.JSONField(blank=True, default=list, help_text='[numéro de ligne, message]')),
+                ('elapsed', models.FloatField(blank=True, help_text='en secondes', null=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.job')),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
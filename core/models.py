@@ -4,7 +4,9 @@ from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
-from .utils import BaseTimeStamp, SlugBaseModel
+from django.utils.functional import cached_property
+from .storage import get_video_storage
+from .utils import BaseTimeStamp, SearchKeyModel, SlugBaseModel
 
 class TheUser(AbstractUser):
     STUDENT = 'student'
@@ -29,6 +31,15 @@ class TheUser(AbstractUser):
     def is_student(self):
         return self.role == self.STUDENT
 
+    # pré-remplis par core.backends quand l'utilisateur vient du cache
+    @cached_property
+    def group_ids(self):
+        return frozenset(self.groups.values_list('pk', flat=True))
+
+    @cached_property
+    def enrolled_course_ids(self):
+        return frozenset(self.enrollments.values_list('course_id', flat=True))
+
 class Category(SlugBaseModel, BaseTimeStamp):
     name = models.CharField(max_length=100, unique=True)
 
@@ -47,6 +58,9 @@ class Module(SlugBaseModel, BaseTimeStamp):
     )
     name = models.CharField(max_length=200)
 
+    # compteur maintenu par signaux (cours publiés), voir core.counters
+    course_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -59,7 +73,7 @@ class Module(SlugBaseModel, BaseTimeStamp):
     def __str__(self):
         return self.name
 
-class Course(SlugBaseModel, BaseTimeStamp):
+class Course(SlugBaseModel, SearchKeyModel, BaseTimeStamp):
     module = models.ForeignKey(
         Module,
         on_delete=models.CASCADE,
@@ -75,8 +89,20 @@ class Course(SlugBaseModel, BaseTimeStamp):
     description = models.TextField()
     is_published = models.BooleanField(default=False)
 
+    # compteurs maintenus par signaux, voir core.counters
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
+    video_duration = models.PositiveIntegerField(default=0, editable=False, help_text="en secondes")
+    enrollment_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['search_key'], name='course_search_key_idx'),
+            # cours publiés (tous, d'un module, d'un enseignant) dans l'ordre d'affichage (audit_queries)
+            models.Index(fields=['is_published', 'created_at'], name='course_published_idx'),
+            models.Index(fields=['module', 'is_published', 'created_at'], name='course_module_published_idx'),
+            models.Index(fields=['teacher', 'is_published', 'created_at'], name='course_teacher_published_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['teacher', 'title'],
@@ -90,7 +116,9 @@ class Course(SlugBaseModel, BaseTimeStamp):
     def get_absolute_url(self):
         return reverse('course_detail', kwargs={'slug': self.slug})
 
-class Chapter(SlugBaseModel, BaseTimeStamp):
+class Chapter(SlugBaseModel, SearchKeyModel, BaseTimeStamp):
+    search_source = 'name'
+
     course = models.ForeignKey(
         Course,
         on_delete=models.CASCADE,
@@ -101,8 +129,15 @@ class Chapter(SlugBaseModel, BaseTimeStamp):
     description = models.TextField()
     order = models.PositiveIntegerField(default=1)
 
+    # compteurs maintenus par signaux, voir core.counters
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
+    video_duration = models.PositiveIntegerField(default=0, editable=False, help_text="en secondes")
+
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['search_key'], name='chapter_search_key_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['course', 'name'],
@@ -124,7 +159,7 @@ class Chapter(SlugBaseModel, BaseTimeStamp):
             'course_slug': self.course.slug
         })
 
-class Lesson(SlugBaseModel, BaseTimeStamp):
+class Lesson(SlugBaseModel, SearchKeyModel, BaseTimeStamp):
     chapter = models.ForeignKey(
         Chapter,
         on_delete=models.CASCADE,
@@ -136,6 +171,7 @@ class Lesson(SlugBaseModel, BaseTimeStamp):
 
     video_file = models.FileField(
         upload_to='lessons/videos/%Y/%m/%d/',
+        storage=get_video_storage,
         blank=True,
         null=True,
         validators=[
@@ -147,10 +183,15 @@ class Lesson(SlugBaseModel, BaseTimeStamp):
         max_length=1000
     )
 
+    video_duration = models.PositiveIntegerField(default=0, help_text="durée de la vidéo, en secondes")
+
     order = models.PositiveIntegerField(default=1)
 
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['search_key'], name='lesson_search_key_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['chapter', 'title'],
@@ -177,6 +218,17 @@ class Lesson(SlugBaseModel, BaseTimeStamp):
             }
         )
 
+class VideoBlob(BaseTimeStamp):
+    ''' fichier vidéo partagé, référencé par une ou plusieurs leçons '''
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=1000, unique=True)
+    size = models.PositiveBigIntegerField()
+    crc32 = models.PositiveBigIntegerField(null=True, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} leçon(s))"
+
 class Enrollment(BaseTimeStamp):
     student = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -191,6 +243,11 @@ class Enrollment(BaseTimeStamp):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # tableau de bord de l'apprenant ; tri et filtre par date de l'admin
+            models.Index(fields=['student', 'created_at'], name='enrollment_student_date_idx'),
+            models.Index(fields=['created_at'], name='enrollment_created_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['student', 'course'],
@@ -204,3 +261,137 @@ class Enrollment(BaseTimeStamp):
 
     def __str__(self):
         return f"{self.student.username} inscrit à {self.course.title}"
+
+class Notification(BaseTimeStamp):
+    ''' boîte de réception d'un apprenant (remplie par core.notifications) '''
+    PUBLISHED = 'published'
+    NEW_LESSON = 'new_lesson'
+
+    KIND_CHOICES = (
+        (PUBLISHED, 'Cours publié'),
+        (NEW_LESSON, 'Nouvelle leçon'),
+    )
+
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notifications'
+    )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+
+    kind = models.CharField(choices=KIND_CHOICES, max_length=20)
+    title = models.CharField(max_length=300)
+    url = models.CharField(max_length=500)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at'], name='notification_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient_id} : {self.title}"
+
+class FanOutProgress(models.Model):
+    ''' dernier destinataire servi par chaque backend d'une diffusion (reprise après échec) '''
+    key = models.CharField(max_length=32)
+    backend = models.CharField(max_length=200)
+    last_recipient = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'backend'], name='unique_fan_out_progress')
+        ]
+
+    def __str__(self):
+        return f"{self.key} {self.backend} -> {self.last_recipient}"
+
+class Job(BaseTimeStamp):
+    ''' tâche en file, exécutée par `manage.py run_workers` (voir core.jobs) '''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    DEAD = 'dead'
+
+    STATUS_CHOICES = (
+        (QUEUED, 'En attente'),
+        (RUNNING, 'En cours'),
+        (DONE, 'Terminée'),
+        (DEAD, 'Abandonnée'),
+    )
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(choices=STATUS_CHOICES, default=QUEUED, max_length=10)
+    priority = models.SmallIntegerField(default=0, help_text="les plus grandes d'abord")
+    run_at = models.DateTimeField(help_text="pas exécutée avant cette date")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+
+    locked_by = models.CharField(max_length=100, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True, help_text="en secondes")
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+class DeadJob(Job):
+    ''' tâches abandonnées après leur dernier essai (vue dédiée dans l'admin) '''
+
+    class Meta:
+        proxy = True
+        verbose_name = "tâche abandonnée"
+        verbose_name_plural = "tâches abandonnées"
+
+class RosterImport(BaseTimeStamp):
+    ''' import CSV lancé depuis l'admin, exécuté par une tâche (core.roster.run_roster_import) '''
+    filename = models.CharField(max_length=255, help_text="fichier déposé sous ROSTER_IMPORT_ROOT")
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    job = models.ForeignKey(Job, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.PositiveIntegerField(null=True, blank=True)
+    errors = models.JSONField(default=list, blank=True, help_text="[numéro de ligne, message]")
+    elapsed = models.FloatField(null=True, blank=True, help_text="en secondes")
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"import #{self.pk} ({self.status})"
+
+    @property
+    def status(self):
+        if self.elapsed is not None:
+            return Job.DONE
+        return self.job.status if self.job else Job.QUEUED
+
+    @property
+    def finished(self):
+        return self.status in (Job.DONE, Job.DEAD)
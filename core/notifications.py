@@ -0,0 +1,129 @@
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .course_tree import course_trees
+from .jobs import enqueue
+from .models import TheUser, Lesson, Notification, FanOutProgress
+
+
+class Event:
+    ''' ce qui est annoncé aux apprenants d'un cours '''
+    __slots__ = ('kind', 'course_id', 'lesson_id', 'title', 'url')
+
+    def __init__(self, kind, course_id, lesson_id, title, url):
+        self.kind = kind
+        self.course_id = course_id
+        self.lesson_id = lesson_id
+        self.title = title
+        self.url = url
+
+    @classmethod
+    def load(cls, kind, course_id=None, lesson_id=None):
+        ''' None si l'événement n'a plus lieu d'être (cours dépublié ou supprimé entre-temps) '''
+        if lesson_id is not None:
+            course_id = Lesson.objects.filter(pk=lesson_id).values_list(
+                'chapter__course_id', flat=True
+            ).first()
+        course = next(iter(course_trees.many([course_id] if course_id else [])), None)
+        if course is None or not course.is_published:
+            return None
+
+        if kind == Notification.NEW_LESSON:
+            lesson = next((l for l in course.lessons if l.pk == lesson_id), None)
+            if lesson is None:
+                return None
+            return cls(kind, course.pk, lesson.pk,
+                       f"Nouvelle leçon dans {course.title} : {lesson.title}", lesson.url)
+        return cls(kind, course.pk, None, f"Le cours {course.title} est publié", course.url)
+
+
+class InboxBackend:
+    ''' notifications dans l'application (table Notification) '''
+
+    def deliver(self, event, recipients):
+        Notification.objects.bulk_create([
+            Notification(
+                recipient_id=recipient.pk, course_id=event.course_id, lesson_id=event.lesson_id,
+                kind=event.kind, title=event.title, url=event.url,
+            )
+            for recipient in recipients
+        ])
+
+
+class EmailBackend:
+    ''' un e-mail par apprenant, envoyés sur une seule connexion (EMAIL_BACKEND) '''
+
+    def deliver(self, event, recipients):
+        site = settings.SITE_URL
+        messages = [
+            EmailMessage(event.title, f"Bonjour {recipient.username},\n\n{event.title}.\n{site}{event.url}\n",
+                         to=[recipient.email])
+            for recipient in recipients if recipient.email
+        ]
+        if messages:
+            get_connection().send_messages(messages)
+
+
+def get_backends():
+    return {path: import_string(path)() for path in settings.NOTIFICATION_BACKENDS}
+
+
+def recipient_batches(course_id, batch_size, after=0):
+    ''' apprenants inscrits, par lots (pagination par clé, pas d'OFFSET) '''
+    students = (
+        TheUser.objects.filter(enrollments__course_id=course_id, role=TheUser.STUDENT)
+        .order_by('pk').values_list('pk', 'username', 'email', named=True)
+    )
+    last = after
+    while True:
+        batch = list(students.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1].pk
+
+
+def fan_out(kind, course_id=None, lesson_id=None, batch_size=None, key=None):
+    '''
+    Distribue un événement à tous les inscrits ; renvoie le nombre de
+    destinataires servis. Avec `key`, chaque lot livré par un backend est
+    noté (FanOutProgress) dans la même transaction : un nouvel essai de la
+    tâche reprend après le dernier lot livré au lieu de tout renvoyer.
+    '''
+    event = Event.load(kind, course_id, lesson_id)
+    if event is None:
+        return 0
+
+    backends = get_backends()
+    done = dict.fromkeys(backends, 0)
+    if key:
+        done.update(FanOutProgress.objects.filter(key=key).values_list('backend', 'last_recipient'))
+        FanOutProgress.objects.bulk_create(
+            [FanOutProgress(key=key, backend=path) for path in backends], ignore_conflicts=True
+        )
+
+    sent = 0
+    batches = recipient_batches(event.course_id, batch_size or settings.NOTIFICATION_BATCH_SIZE, min(done.values()))
+    for batch in batches:
+        for path, backend in backends.items():
+            todo = [recipient for recipient in batch if recipient.pk > done[path]]
+            if not todo:
+                continue
+            with transaction.atomic():
+                backend.deliver(event, todo)
+                if key:
+                    FanOutProgress.objects.filter(key=key, backend=path).update(last_recipient=todo[-1].pk)
+            done[path] = todo[-1].pk
+        sent += len(batch)
+
+    if key:
+        FanOutProgress.objects.filter(key=key).delete()
+    return sent
+
+
+def notify(kind, course_id=None, lesson_id=None):
+    ''' un job par événement, exécuté après la requête ; la clé identifie ses essais '''
+    enqueue(fan_out, kind, course_id=course_id, lesson_id=lesson_id, key=uuid.uuid4().hex)
@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+import struct
+import zlib
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from .catalog import catalog_version
+from .models import Chapter, Lesson, VideoBlob
+from .storage import video_storage
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_CACHE_TIMEOUT = 60 * 60
+ZIP64_LIMIT = 0xFFFFFFFF
+CHUNK_SIZE = 64 * 1024
+
+STORED = 0
+DEFLATED = 8
+UTF8_FLAG = 0x0800
+# date fixe (1980-01-01) : l'archive ne dépend que de son contenu
+DOS_TIME, DOS_DATE = 0, (1 << 5) | 1
+
+
+class Entry:
+    ''' fichier de l'archive : octets déjà compressés en mémoire, ou fichier stocké tel quel '''
+    __slots__ = ('name', 'method', 'crc', 'size', 'compressed_size', 'data', 'path', 'offset')
+
+    def __init__(self, name, method, crc, size, compressed_size, data=None, path=None):
+        self.name = name.encode()
+        self.method = method
+        self.crc = crc
+        self.size = size
+        self.compressed_size = compressed_size
+        self.data = data
+        self.path = path
+        self.offset = 0
+
+    @classmethod
+    def deflated(cls, name, content):
+        raw = content.encode()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        data = compressor.compress(raw) + compressor.flush()
+        return cls(name, DEFLATED, zlib.crc32(raw), len(raw), len(data), data=data)
+
+    @classmethod
+    def stored_file(cls, name, path, crc):
+        size = os.path.getsize(path)
+        return cls(name, STORED, crc, size, size, path=path)
+
+
+class ZipLayout:
+    '''
+    Archive ZIP décrite comme une suite de segments (octets ou morceaux de
+    fichiers) dont les positions sont connues d'avance : on peut la
+    streamer sans fichier temporaire et en servir n'importe quelle plage.
+    '''
+
+    def __init__(self, entries, zip64_limit=ZIP64_LIMIT):
+        self.entries = entries
+        self.zip64_limit = zip64_limit
+        self.segments = []  # (début, longueur, octets ou (chemin, début dans le fichier))
+        self.size = 0
+
+        for entry in entries:
+            entry.offset = self.size
+            self._add(self._local_header(entry))
+            if entry.path:
+                self._add((entry.path, 0), entry.compressed_size)
+            else:
+                self._add(entry.data)
+
+        cd_offset = self.size
+        central = b''.join(self._central_header(entry) for entry in entries)
+        self._add(central)
+        self._add(self._end_records(cd_offset, len(central)))
+
+    def _add(self, source, length=None):
+        length = len(source) if length is None else length
+        if length:
+            self.segments.append((self.size, length, source))
+            self.size += length
+
+    def _is_zip64(self, entry):
+        return max(entry.size, entry.compressed_size, entry.offset) >= self.zip64_limit
+
+    def _local_header(self, entry):
+        if self._is_zip64(entry):
+            extra = struct.pack('<HHQQ', 0x0001, 16, entry.size, entry.compressed_size)
+            sizes = (ZIP64_LIMIT, ZIP64_LIMIT)
+            version = 45
+        else:
+            extra = b''
+            sizes = (entry.compressed_size, entry.size)
+            version = 20
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, version, UTF8_FLAG, entry.method,
+            DOS_TIME, DOS_DATE, entry.crc, *sizes, len(entry.name), len(extra),
+        ) + entry.name + extra
+
+    def _central_header(self, entry):
+        if self._is_zip64(entry):
+            extra = struct.pack(
+                '<HHQQQ', 0x0001, 24, entry.size, entry.compressed_size, entry.offset
+            )
+            sizes = (ZIP64_LIMIT, ZIP64_LIMIT)
+            offset = ZIP64_LIMIT
+            version = 45
+        else:
+            extra = b''
+            sizes = (entry.compressed_size, entry.size)
+            offset = entry.offset
+            version = 20
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, 45, version, UTF8_FLAG, entry.method,
+            DOS_TIME, DOS_DATE, entry.crc, *sizes, len(entry.name), len(extra),
+            0, 0, 0, 0, offset,
+        ) + entry.name + extra
+
+    def _end_records(self, cd_offset, cd_size):
+        count = len(self.entries)
+        records = b''
+        if max(cd_offset, cd_size) >= self.zip64_limit or count >= 0xFFFF:
+            zip64_offset = cd_offset + cd_size
+            records += struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset
+            )
+            records += struct.pack('<IIQI', 0x07064b50, 0, zip64_offset, 1)
+            count = min(count, 0xFFFF)
+            cd_size = min(cd_size, ZIP64_LIMIT)
+            cd_offset = min(cd_offset, ZIP64_LIMIT)
+        return records + struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0
+        )
+
+    def etag(self):
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(b'%s:%d:%d;' % (entry.name, entry.crc, entry.size))
+        return f'"{digest.hexdigest()}"'
+
+    def stream(self, start=0, end=None):
+        ''' octets [start, end] (inclus) de l'archive, lus au fil de l'eau '''
+        end = self.size - 1 if end is None else end
+        for seg_start, length, source in self.segments:
+            seg_end = seg_start + length - 1
+            if seg_end < start or seg_start > end:
+                continue
+            lo = max(start, seg_start) - seg_start
+            hi = min(end, seg_end) - seg_start + 1
+            if isinstance(source, bytes):
+                yield source[lo:hi]
+                continue
+            path, base = source
+            with open(path, 'rb') as fp:
+                fp.seek(base + lo)
+                remaining = hi - lo
+                while remaining > 0:
+                    chunk = fp.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                    yield chunk
+
+
+def video_crcs(names):
+    ''' crc32 des vidéos : ceux calculés à l'upload (VideoBlob) en une requête, les autres fichier par fichier '''
+    crcs = dict(
+        VideoBlob.objects.filter(name__in=names, crc32__isnull=False).values_list('name', 'crc32')
+    )
+    for name in names:
+        if name not in crcs:
+            crcs[name] = file_crc32(name)
+    return crcs
+
+
+def file_crc32(name):
+    ''' crc32 calculé une fois en lisant le fichier, puis mis en cache '''
+    path = video_storage.path(name)
+    stat = os.stat(path)
+    key = f'crc32:{hashlib.md5(name.encode()).hexdigest()}:{stat.st_size}:{stat.st_mtime_ns}'
+    crc = cache.get(key)
+    if crc is None:
+        crc = 0
+        with open(path, 'rb') as fp:
+            while chunk := fp.read(1024 * 1024):
+                crc = zlib.crc32(chunk, crc)
+        VideoBlob.objects.filter(name=name).update(crc32=crc)
+        cache.set(key, crc, None)
+    return crc
+
+
+def build_course_package(course):
+    ''' arborescence de l'archive hors-ligne d'un cours '''
+    root = course.slug
+    chapters = list(Chapter.objects.filter(course=course).order_by('order'))
+    lessons = list(
+        Lesson.objects.filter(chapter__course=course)
+        .select_related('chapter')
+        .order_by('chapter__order', 'order')
+    )
+
+    pages = []
+    videos = {}  # nom dans l'archive -> nom de stockage (vidéos partagées stockées une fois)
+    for lesson in lessons:
+        page = f'{lesson.chapter.order:02d}-{lesson.chapter.slug}/{lesson.order:02d}-{lesson.slug}.html'
+        video = None
+        name = lesson.video_file.name if lesson.video_file else None
+        if name and not os.path.isfile(video_storage.path(name)):
+            # fichier absent : la leçon part sans sa vidéo plutôt que l'archive en erreur
+            logger.warning("archive hors-ligne %s : vidéo %s introuvable", course.slug, name)
+        elif name:
+            # nom de stockage complet : deux anciennes vidéos de même nom ne se confondent pas
+            video = f'videos/{name}'
+            videos[video] = name
+        pages.append((lesson, page, video))
+
+    entries = [
+        Entry.deflated(f'{root}/index.html', render_to_string('core/offline/index.html', {
+            'course': course,
+            'chapters': [
+                (chapter, [(l, p) for l, p, _ in pages if l.chapter_id == chapter.pk])
+                for chapter in chapters
+            ],
+        })),
+    ]
+    for position, (lesson, page, video) in enumerate(pages):
+        entries.append(Entry.deflated(f'{root}/{page}', render_to_string('core/offline/lesson.html', {
+            'course': course,
+            'lesson': lesson,
+            'video': video,
+            'previous': pages[position - 1][1] if position else None,
+            'next': pages[position + 1][1] if position + 1 < len(pages) else None,
+        })))
+    crcs = video_crcs(set(videos.values()))
+    for name in sorted(videos):
+        entries.append(Entry.stored_file(
+            f'{root}/{name}', video_storage.path(videos[name]), crcs[videos[name]]
+        ))
+    return ZipLayout(entries)
+
+
+def cached_course_package(course):
+    '''
+    build_course_package() mis en cache par version du catalogue : une reprise
+    de téléchargement (Range) ne refait ni le rendu ni la compression des pages.
+    '''
+    key = f'offline-package:{course.pk}:{catalog_version()}'
+    package = cache.get(key)
+    if package is None:
+        package = build_course_package(course)
+        cache.set(key, package, PACKAGE_CACHE_TIMEOUT)
+    return package
@@ -0,0 +1,211 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.urls import reverse
+from .catalog import catalog_version, last_bump
+from .models import Module, Course, Lesson
+from .utils import normalize
+
+MODULE = 'module'
+COURSE = 'course'
+LESSON = 'lesson'
+
+# ordre d'affichage à pertinence égale, et route de chaque type
+KINDS = {
+    COURSE: (0, 'chapter_list'),
+    MODULE: (1, 'course_list'),
+    LESSON: (2, 'lesson_detail'),
+}
+MAX_KEY_LENGTH = 48
+
+
+def index_keys(title):
+    ''' une clé par mot : la fin du titre à partir de ce mot ("python" trouve "Introduction à Python") '''
+    words = normalize(title).split()
+    return tuple(dict.fromkeys(
+        ' '.join(words[i:])[:MAX_KEY_LENGTH] for i in range(len(words))
+    ))
+
+
+class PrefixIndex:
+    '''
+    Index en mémoire du process : clés normalisées triées (bisect), une
+    entrée par module, cours publié et leçon de cours publié. Les signaux le
+    corrigent ligne par ligne ; reconstruit si le catalogue change ailleurs.
+    '''
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._keys = []
+        self._refs = []
+        self._entries = {}  # (type, pk) -> (titre, arguments de l'URL, clés)
+        self._version = None
+        self._lock = threading.RLock()
+
+    @property
+    def limit(self):
+        return self.max_entries or settings.SEARCH_INDEX_MAX_ENTRIES
+
+    def __len__(self):
+        return len(self._entries)
+
+    # construction
+
+    def _rows(self):
+        # order_by() : l'ordre des lignes est indifférent, pas de tri en base
+        for pk, name, module, category in Module.objects.order_by().values_list(
+            'pk', 'name', 'slug', 'category__slug'
+        ).iterator():
+            yield (MODULE, pk), name, (category, module)
+
+        for pk, title, course, module, category in Course.objects.filter(is_published=True).order_by().values_list(
+            'pk', 'title', 'slug', 'module__slug', 'module__category__slug'
+        ).iterator():
+            yield (COURSE, pk), title, (category, module, course)
+
+        yield from self._lesson_rows(Lesson.objects.filter(chapter__course__is_published=True))
+
+    def _lesson_rows(self, lessons):
+        for pk, title, lesson, chapter, course, module, category in lessons.order_by().values_list(
+            'pk', 'title', 'slug', 'chapter__slug', 'chapter__course__slug',
+            'chapter__course__module__slug', 'chapter__course__module__category__slug',
+        ).iterator():
+            yield (LESSON, pk), title, (category, module, course, chapter, lesson)
+
+    def rebuild(self):
+        with self._lock:
+            version = catalog_version()
+            pairs = []
+            entries = {}
+            # modules et cours d'abord : ce sont les leçons qui sautent si la limite est atteinte
+            for ref, title, args in self._rows():
+                if len(entries) >= self.limit:
+                    break
+                keys = index_keys(title)
+                entries[ref] = (title, args, keys)
+                pairs.extend((key, ref) for key in keys)
+            pairs.sort()
+            self._keys = [key for key, _ in pairs]
+            self._refs = [ref for _, ref in pairs]
+            self._entries = entries
+            self._version = version
+            return len(entries)
+
+    def _ensure_current(self):
+        if self._version != catalog_version():
+            self.rebuild()
+
+    # mises à jour incrémentales (core.signals)
+
+    def _remove(self, ref):
+        entry = self._entries.pop(ref, None)
+        if entry is None:
+            return
+        for key in entry[2]:
+            i = bisect_left(self._keys, key)
+            while i < len(self._keys) and self._keys[i] == key:
+                if self._refs[i] == ref:
+                    del self._keys[i]
+                    del self._refs[i]
+                    break
+                i += 1
+
+    def _add(self, ref, title, args):
+        if len(self._entries) >= self.limit:
+            return
+        keys = index_keys(title)
+        self._entries[ref] = (title, args, keys)
+        for key in keys:
+            i = bisect_left(self._keys, key)
+            # (clé, ref) gardés triés comme au rebuild
+            while i < len(self._keys) and self._keys[i] == key and self._refs[i] < ref:
+                i += 1
+            self._keys.insert(i, key)
+            self._refs.insert(i, ref)
+
+    def _patch(self, refs, rows):
+        with self._lock:
+            if self._version is None:
+                return
+            # le changement vient de bumper la version (core.signals). L'index ne la
+            # prend que s'il était à jour juste avant et qu'aucun autre process n'a
+            # bumpé depuis ; sinon il se reconstruit à la prochaine recherche
+            bump = last_bump()
+            if bump is None or bump[0] != self._version or catalog_version() != bump[1]:
+                self._version = None
+                return
+            for ref in refs:
+                self._remove(ref)
+            for ref, title, args in rows:
+                self._add(ref, title, args)
+            self._version = bump[1]
+
+    # index jamais construit dans ce process : aucune requête à faire
+
+    def module_changed(self, pk):
+        if self._version is None:
+            return
+        rows = [
+            ((MODULE, pk), name, (category, slug))
+            for name, slug, category in Module.objects.filter(pk=pk).values_list('name', 'slug', 'category__slug')
+        ]
+        self._patch([(MODULE, pk)], rows)
+
+    def course_changed(self, pk):
+        if self._version is None:
+            return
+        rows = [
+            ((COURSE, pk), title, (category, module, slug))
+            for title, slug, module, category in Course.objects.filter(pk=pk, is_published=True).values_list(
+                'title', 'slug', 'module__slug', 'module__category__slug'
+            )
+        ]
+        # publication, dépublication ou slug changé : ses leçons suivent
+        lessons = Lesson.objects.filter(chapter__course_id=pk)
+        refs = [(COURSE, pk)] + [(LESSON, lesson) for lesson in lessons.values_list('pk', flat=True)]
+        if rows:
+            rows += list(self._lesson_rows(lessons))
+        self._patch(refs, rows)
+
+    def lesson_changed(self, pk):
+        if self._version is None:
+            return
+        rows = list(self._lesson_rows(Lesson.objects.filter(pk=pk, chapter__course__is_published=True)))
+        self._patch([(LESSON, pk)], rows)
+
+    def removed(self, kind, pks):
+        self._patch([(kind, pk) for pk in pks], [])
+
+    def invalidate(self):
+        ''' changement qui touche beaucoup d'URLs (catégorie, chapitre) : reconstruit à la prochaine recherche '''
+        with self._lock:
+            self._version = None
+
+    # recherche
+
+    def search(self, query, limit=8):
+        prefix = normalize(query)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+
+        with self._lock:
+            self._ensure_current()
+            found = {}
+            i = bisect_left(self._keys, prefix)
+            # assez de candidats pour classer par type, sans parcourir toute la plage
+            while i < len(self._keys) and len(found) < limit * 4 and self._keys[i].startswith(prefix):
+                ref = self._refs[i]
+                if ref not in found:
+                    title, args, _ = self._entries[ref]
+                    found[ref] = (title, args)
+                i += 1
+
+        ranked = sorted(found.items(), key=lambda item: (KINDS[item[0][0]][0], len(item[1][0])))[:limit]
+        return [
+            {'type': kind, 'title': title, 'url': reverse(KINDS[kind][1], args=args)}
+            for (kind, _), (title, args) in ranked
+        ]
+
+
+search_index = PrefixIndex()
@@ -0,0 +1,231 @@
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from .course_tree import course_trees
+from .models import Lesson
+from .prefix_index import search_index
+
+EXPLAINED = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+MAX_INDEX_NAME = 30
+# cache propre à l'audit : le cache partagé de production n'est ni vidé ni
+# rempli avec les données de la base jetable
+AUDIT_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'opyc-query-audit',
+    }
+}
+
+
+def view_requests(data, prefix):
+    ''' {route: (utilisateur, URL)} pour chaque vue, sur un catalogue de seed_catalog(prefix=...) '''
+    course = data['courses'][0]
+    chapter = f'{course.slug}-chapter-0'
+    path = (f'{prefix}-category', f'{prefix}-module', course.slug)
+    lesson = (*path, chapter, f'{chapter}-lesson-1')
+    student, teacher = data['students'][0], data['teacher']
+    first_lesson = Lesson.objects.filter(chapter__course=course).values_list('pk', flat=True).first()
+    return {
+        'index': (None, reverse('index')),
+        'category_list': (None, reverse('category_list')),
+        'course_list': (student, reverse('course_list', args=path[:2])),
+        'chapter_list': (student, reverse('chapter_list', args=path)),
+        'lesson_detail': (student, reverse('lesson_detail', args=lesson)),
+        'lesson_video': (student, reverse('lesson_video', args=lesson)),
+        'course_package': (student, reverse('course_package', args=path)),
+        'create_course': (teacher, reverse('create_course')),
+        'dashboard_control': (student, reverse('dashboard_control')),
+        'dashboard_teacher': (teacher, reverse('dashboard_teacher')),
+        'dashboard_student': (student, reverse('dashboard_student')),
+        'inbox': (student, reverse('inbox')),
+        'streaming_metrics': (teacher, reverse('streaming_metrics')),
+        'snapshot_fragment': (student, f"{reverse('snapshot_fragment')}?lesson={first_lesson}"),
+        'register': (None, reverse('register')),
+        'api_list': (None, reverse('api_list', args=['lessons'])),
+        'api_detail': (None, reverse('api_detail', args=['courses', course.slug])),
+        'api_catalog_export': (None, reverse('api_catalog_export')),
+        'api_autocomplete': (None, f"{reverse('api_autocomplete')}?q={prefix}"),
+        # signature invalide : refusée sans requête
+        'signed_media': (None, f"{reverse('signed_media', args=['lessons/video.mp4'])}?u=0&e=0&s=x"),
+        'not_found': (None, '/page-inexistante/'),
+    }
+
+
+@contextmanager
+def audit_cache():
+    ''' le cache par défaut devient celui de l'audit le temps du bloc '''
+    with override_settings(CACHES=AUDIT_CACHES):
+        yield
+
+
+def clear_caches():
+    ''' premier passage : session, utilisateur, arbres et index à recharger (cache de l'audit seulement) '''
+    with audit_cache():
+        cache.clear()
+    course_trees.clear()
+    search_index.invalidate()
+
+
+def capture(client, user, url):
+    ''' (réponse, requêtes SQL) d'un GET, caches vides '''
+    with audit_cache():
+        client.logout()
+        if user:
+            client.force_login(user)
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            response.close()
+    return response, [q['sql'] for q in queries.captured_queries]
+
+
+def explain(sql):
+    ''' lignes "detail" de EXPLAIN QUERY PLAN (SQLite) '''
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+_scan = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+_temp = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT|RIGHT PART OF ORDER BY)')
+
+
+def problems(plan):
+    ''' [(type, table ou None, détail)] : parcours complets et tris en B-tree temporaire '''
+    found = []
+    for detail in plan:
+        scan = _scan.match(detail)
+        if scan:
+            found.append(('scan', scan.group(1), detail))
+        elif _temp.search(detail):
+            found.append(('sort', None, detail))
+    return found
+
+
+def _tables():
+    return {model._meta.db_table: model for model in apps.get_models()}
+
+
+def _clause(sql, clause):
+    ends = r'(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)' if clause == 'WHERE' else r'(?:\bLIMIT\b|$)'
+    match = re.search(rf'\b{clause}\b(.*?){ends}', sql, re.S)
+    return match.group(1) if match else ''
+
+
+def _equalities(sql, table):
+    ''' colonnes de `table` filtrées par égalité ; booléens nus (peu sélectifs) en dernier '''
+    where = _clause(sql, 'WHERE')
+    equal = re.findall(rf'"{table}"\."(\w+)" (?:= |IN \(|IS NULL)', where)
+    flags = re.findall(rf'"{table}"\."(\w+)"(?=\s*(?:AND\b|OR\b|\)|$))', where)
+    return list(dict.fromkeys(equal + flags))
+
+
+def _sort_columns(sql, table):
+    return list(dict.fromkeys(re.findall(rf'"{table}"\."(\w+)"', _clause(sql, 'ORDER BY'))))
+
+
+def _field_names(model, columns):
+    by_column = {field.column: field.name for field in model._meta.concrete_fields}
+    return [by_column[column] for column in columns if column in by_column]
+
+
+def _covered(model, fields):
+    ''' un index existant (Meta, contrainte unique, clé étrangère) commence-t-il par ces champs ? '''
+    existing = [list(index.fields) for index in model._meta.indexes]
+    existing += [list(c.fields) for c in model._meta.constraints if getattr(c, 'fields', None)]
+    existing += [[f.name] for f in model._meta.concrete_fields if f.db_index or f.unique or f.primary_key]
+    wanted = [f.lstrip('-') for f in fields]
+    return any([f.lstrip('-') for f in index[:len(wanted)]] == wanted for index in existing)
+
+
+def _unique(model, fields):
+    ''' égalité sur une clé unique : une ligne au plus, rien à indexer de plus '''
+    if any(model._meta.get_field(f).unique for f in fields):
+        return True
+    return any(
+        set(c.fields) <= set(fields) for c in model._meta.constraints
+        if getattr(c, 'fields', None) and getattr(c, 'condition', None) is None
+    )
+
+
+def _selective(model, fields):
+    # un index sur des booléens seuls ne filtre presque rien
+    return any(model._meta.get_field(f).get_internal_type() != 'BooleanField' for f in fields)
+
+
+def index_name(model, fields):
+    name = '_'.join([model._meta.model_name] + [f.lstrip('-') for f in fields] + ['idx'])
+    return name if len(name) <= MAX_INDEX_NAME else name[:MAX_INDEX_NAME - 4] + '_idx'
+
+
+def suggest(sql, problem_list):
+    '''
+    Index proposés pour une requête : colonnes filtrées par égalité puis
+    colonnes de tri, pour chaque table parcourue ou triée sans index. Un tri
+    de toute la table sans LIMIT (export, liste de choix) ne gagne rien à un index.
+    '''
+    tables = _tables()
+    suggestions = []
+    sorted_query = any(kind == 'sort' for kind, _, _ in problem_list)
+    targets = {table for kind, table, _ in problem_list if kind == 'scan'}
+    if sorted_query:
+        # le tri concerne la table principale (FROM)
+        main = re.search(r'\bFROM "(\w+)"', sql)
+        if main:
+            targets.add(main.group(1))
+
+    for table in targets:
+        model = tables.get(table)
+        if model is None:
+            continue
+        fields = _field_names(model, _equalities(sql, table))
+        if _unique(model, fields):
+            continue
+        if sorted_query and (fields or re.search(r'\bLIMIT\b', sql)):
+            fields += [f for f in _field_names(model, _sort_columns(sql, table)) if f not in fields]
+        if fields and _selective(model, fields) and not _covered(model, fields):
+            suggestions.append((model, tuple(fields)))
+    return suggestions
+
+
+class Finding:
+    __slots__ = ('view', 'sql', 'plan', 'problems')
+
+    def __init__(self, view, sql, plan, problems):
+        self.view = view
+        self.sql = sql
+        self.plan = plan
+        self.problems = problems
+
+
+def audit(requests):
+    '''
+    Rejoue chaque vue et explique chacune de ses requêtes.
+    Renvoie (requêtes par vue, constats, {(modèle, champs): vues concernées}).
+    '''
+    client = Client()
+    counts, findings = {}, []
+    advice = defaultdict(set)
+    for view, (user, url) in requests.items():
+        _, queries = capture(client, user, url)
+        counts[view] = len(queries)
+        for sql in queries:
+            if not sql.lstrip().upper().startswith(EXPLAINED):
+                continue
+            plan = explain(sql)
+            found = problems(plan)
+            if not found:
+                continue
+            findings.append(Finding(view, sql, plan, found))
+            for suggestion in suggest(sql, found):
+                advice[suggestion].add(view)
+    return counts, findings, dict(advice)
@@ -0,0 +1,214 @@
+import csv
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from .jobs import enqueue
+from .models import RosterImport, TheUser
+
+ROLE_GROUPS = {
+    TheUser.TEACHER: 'teacher-group',
+    TheUser.STUDENT: 'student-group',
+}
+
+ROSTER_FIELDS = ('username', 'password', 'role', 'email', 'first_name', 'last_name')
+
+
+def role_group(role):
+    group, _ = Group.objects.get_or_create(name=ROLE_GROUPS[role])
+    return group
+
+
+class RosterReport:
+    def __init__(self):
+        self.created = 0
+        self.errors = []  # (numéro de ligne, message)
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.created} utilisateur(s) créé(s) en {self.elapsed:.2f}s "
+            f"({self.rate:.0f}/s), {len(self.errors)} erreur(s)"
+        )
+
+
+def read_roster(fp):
+    ''' lignes du CSV : (numéro de ligne, dict) '''
+    reader = csv.DictReader(fp)
+    for row in reader:
+        yield reader.line_num, {
+            key: (row.get(key) or '').strip() for key in ROSTER_FIELDS
+        }
+
+
+def hash_passwords(passwords, workers=None):
+    ''' hash en parallèle, mot de passe vide -> mot de passe inutilisable '''
+    passwords = [p or None for p in passwords]
+    if workers == 1 or len(passwords) < 2:
+        return [make_password(p) for p in passwords]
+
+    # spawn plutôt que fork : sûr depuis un thread des workers de core.jobs ;
+    # chaque process initialise Django (initializer importable sans les modèles)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        return list(pool.map(make_password, passwords, chunksize=32))
+
+
+def _validate(rows, report):
+    username_validator = UnicodeUsernameValidator()
+    valid_roles = {choice for choice, _ in TheUser.ROLE_CHOICES}
+    seen = set()
+    valid = []
+
+    for line, row in rows:
+        username = row['username']
+        row['role'] = row['role'] or TheUser.STUDENT
+        try:
+            if not username:
+                raise ValidationError("nom d'utilisateur manquant")
+            if len(username) > 150:
+                raise ValidationError("nom d'utilisateur trop long")
+            username_validator(username)
+            if row['role'] not in valid_roles:
+                raise ValidationError(f"rôle inconnu : {row['role']}")
+            if username in seen:
+                raise ValidationError(f"{username} apparaît plusieurs fois")
+        except ValidationError as e:
+            report.errors.append((line, ' '.join(e.messages)))
+            continue
+        seen.add(username)
+        valid.append((line, row))
+
+    existing = set()
+    usernames = [row['username'] for _, row in valid]
+    for i in range(0, len(usernames), 500):
+        existing.update(
+            TheUser.objects.filter(username__in=usernames[i:i + 500])
+            .values_list('username', flat=True)
+        )
+
+    kept = []
+    for line, row in valid:
+        if row['username'] in existing:
+            report.errors.append((line, f"{row['username']} existe déjà"))
+        else:
+            kept.append((line, row))
+    return kept
+
+
+def _insert_batch(batch, group_ids, report):
+    users = [
+        TheUser(
+            username=row['username'],
+            password=row['password'],
+            role=row['role'],
+            email=row['email'],
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+        )
+        for _, row in batch
+    ]
+    try:
+        with transaction.atomic():
+            TheUser.objects.bulk_create(users)
+            _attach_groups(users, group_ids)
+    except IntegrityError:
+        # un conflit quelque part dans le lot : on isole ligne par ligne
+        for (line, row), user in zip(batch, users):
+            user.pk = None
+            try:
+                with transaction.atomic():
+                    user.save()
+                    _attach_groups([user], group_ids)
+            except IntegrityError as e:
+                report.errors.append((line, str(e)))
+            else:
+                report.created += 1
+        return
+
+    report.created += len(users)
+
+
+def _attach_groups(users, group_ids):
+    if any(user.pk is None for user in users):
+        ids = dict(
+            TheUser.objects.filter(username__in=[u.username for u in users])
+            .values_list('username', 'pk')
+        )
+        for user in users:
+            user.pk = ids[user.username]
+
+    Membership = TheUser.groups.through
+    Membership.objects.bulk_create(
+        [Membership(theuser_id=user.pk, group_id=group_ids[user.role]) for user in users],
+        ignore_conflicts=True,
+    )
+
+
+def import_roster(rows, workers=None, batch_size=1000):
+    ''' crée les utilisateurs du CSV par lots ; une ligne invalide n'arrête pas l'import '''
+    report = RosterReport()
+    start = time.perf_counter()
+
+    rows = _validate(rows, report)
+    hashed = hash_passwords([row['password'] for _, row in rows], workers)
+    for (_, row), password in zip(rows, hashed):
+        row['password'] = password
+
+    group_ids = {role: role_group(role).pk for role in ROLE_GROUPS}
+    for i in range(0, len(rows), batch_size):
+        _insert_batch(rows[i:i + batch_size], group_ids, report)
+
+    report.errors.sort()
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def start_roster_import(upload, user=None):
+    '''
+    Dépose le CSV (fichier binaire) sous ROSTER_IMPORT_ROOT et met son import
+    en file : la requête de l'admin ne hache aucun mot de passe.
+    '''
+    os.makedirs(settings.ROSTER_IMPORT_ROOT, exist_ok=True)
+    filename = f'{uuid.uuid4().hex}.csv'
+    fd = os.open(os.path.join(settings.ROSTER_IMPORT_ROOT, filename), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as fp:
+        shutil.copyfileobj(upload, fp)
+
+    roster = RosterImport.objects.create(filename=filename, uploaded_by=user)
+    # un second essai recréerait un rapport faux ("existe déjà" pour chaque ligne importée)
+    roster.job = enqueue(run_roster_import, roster.pk, max_attempts=1)
+    roster.save(update_fields=['job'])
+    return roster
+
+
+def run_roster_import(roster_id):
+    ''' tâche : importe le CSV déposé, enregistre le rapport et supprime le fichier '''
+    roster = RosterImport.objects.get(pk=roster_id)
+    path = os.path.join(settings.ROSTER_IMPORT_ROOT, roster.filename)
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as fp:
+            report = import_roster(read_roster(fp), workers=settings.ROSTER_IMPORT_WORKERS)
+    finally:
+        # mots de passe en clair : supprimé même en cas d'échec (pas de second essai)
+        os.remove(path)
+
+    roster.created = report.created
+    roster.errors = report.errors
+    roster.elapsed = report.elapsed
+    roster.save(update_fields=['created', 'errors', 'elapsed'])
+    return report
@@ -0,0 +1,63 @@
+from django.contrib.auth.hashers import make_password
+from .catalog import bump_catalog_version
+from .counters import reconcile_counters
+from .utils import normalize
+from .models import TheUser, Category, Module, Course, Chapter, Lesson, Enrollment
+
+
+def seed_catalog(courses=10, chapters=3, lessons=4, students=20, enrollments=5,
+                 prefix='seed', published=True):
+    '''
+    Crée un catalogue de test en quelques bulk_create (benchmarks, tests de
+    performance). Slugs et search_key sont fixés ici car bulk_create
+    n'appelle pas save().
+    '''
+    password = make_password(None)
+    teacher = TheUser.objects.create(
+        username=f'{prefix}-teacher', role=TheUser.TEACHER, password=password
+    )
+    users = TheUser.objects.bulk_create([
+        TheUser(username=f'{prefix}-student-{i}', role=TheUser.STUDENT, password=password)
+        for i in range(students)
+    ])
+
+    category = Category.objects.create(name=f'{prefix} category', slug=f'{prefix}-category')
+    module = Module.objects.create(
+        category=category, name=f'{prefix} module', slug=f'{prefix}-module'
+    )
+
+    course_objs = Course.objects.bulk_create([
+        Course(
+            module=module, teacher=teacher, title=f'{prefix} course {c}',
+            search_key=normalize(f'{prefix} course {c}'), slug=f'{prefix}-course-{c}',
+            description='...', is_published=published,
+        )
+        for c in range(courses)
+    ])
+    chapter_objs = Chapter.objects.bulk_create([
+        Chapter(
+            course=course, name=f'chapter {h}', search_key=f'chapter {h}',
+            slug=f'{course.slug}-chapter-{h}', description='...', order=h + 1,
+        )
+        for course in course_objs
+        for h in range(chapters)
+    ])
+    Lesson.objects.bulk_create([
+        Lesson(
+            chapter=chapter, title=f'lesson {n}', search_key=f'lesson {n}',
+            slug=f'{chapter.slug}-lesson-{n}', content='...', order=n + 1,
+        )
+        for chapter in chapter_objs
+        for n in range(lessons)
+    ])
+    Enrollment.objects.bulk_create([
+        Enrollment(student=users[(c + e) % len(users)], course=course)
+        for c, course in enumerate(course_objs)
+        for e in range(min(enrollments, len(users)))
+    ])
+
+    # bulk_create n'envoie pas de signaux : compteurs à recalculer, caches périmés
+    reconcile_counters()
+    bump_catalog_version()
+
+    return {'teacher': teacher, 'students': users, 'module': module, 'courses': course_objs}
@@ -0,0 +1,230 @@
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.conf import settings
+from django.dispatch import receiver
+from .backends import invalidate_user_snapshot
+from .catalog import bump_catalog_version
+from .counters import adjust, adjust_lessons
+from .jobs import enqueue
+from .notifications import notify
+from .prefix_index import search_index, MODULE, COURSE, LESSON
+from .snapshots import build_snapshot, invalidate_snapshot
+from .models import TheUser, Category, Module, Course, Chapter, Lesson, Enrollment, Notification
+from .storage import acquire_blob, release_blob
+
+
+''' cache des utilisateurs '''
+@receiver([post_save, post_delete], sender=TheUser)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user_snapshot(instance.pk)
+
+@receiver(m2m_changed, sender=TheUser.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_user_snapshot(instance.pk)
+    elif action == 'pre_clear':
+        invalidate_user_snapshot(*instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_user_snapshot(*pk_set)
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_user_snapshot(instance.student_id)
+        adjust(Course.objects.filter(pk=instance.course_id), enrollment_count=1)
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    invalidate_user_snapshot(instance.student_id)
+    adjust(Course.objects.filter(pk=instance.course_id), enrollment_count=-1)
+
+
+''' références des vidéos partagées et compteurs des leçons '''
+@receiver(pre_save, sender=Lesson)
+def remember_lesson_video(sender, instance, **kwargs):
+    instance._previous_video = ''
+    instance._previous_counts = None
+    if not instance._state.adding:
+        previous = Lesson.objects.filter(pk=instance.pk).values_list(
+            'video_file', 'chapter_id', 'video_duration'
+        ).first()
+        if previous:
+            instance._previous_video = previous[0] or ''
+            instance._previous_counts = previous[1:]
+
+@receiver(post_save, sender=Lesson)
+def lesson_counted(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_counts', None)
+    if created or previous is None:
+        adjust_lessons(instance.chapter_id, 1, instance.video_duration)
+        return
+
+    chapter_id, duration = previous
+    if chapter_id != instance.chapter_id:
+        adjust_lessons(chapter_id, -1, -duration)
+        adjust_lessons(instance.chapter_id, 1, instance.video_duration)
+    else:
+        adjust_lessons(chapter_id, duration=instance.video_duration - duration)
+    instance._previous_counts = (instance.chapter_id, instance.video_duration)
+
+@receiver(post_save, sender=Lesson)
+def lesson_video_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_video', '')
+    current = instance.video_file.name or ''
+    if current != previous:
+        if current:
+            acquire_blob(current)
+        if previous:
+            release_blob(previous)
+    instance._previous_video = current
+
+@receiver(post_delete, sender=Lesson)
+def lesson_video_deleted(sender, instance, **kwargs):
+    if instance.video_file:
+        release_blob(instance.video_file.name)
+    adjust_lessons(instance.chapter_id, -1, -instance.video_duration)
+
+
+''' compteurs des chapitres et des cours déplacés '''
+@receiver(pre_save, sender=Chapter)
+def remember_chapter_course(sender, instance, **kwargs):
+    instance._previous_course = None
+    if not instance._state.adding:
+        instance._previous_course = Chapter.objects.filter(pk=instance.pk).values_list(
+            'course_id', 'lesson_count', 'video_duration'
+        ).first()
+
+@receiver(post_save, sender=Chapter)
+def chapter_moved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_course', None)
+    if previous and previous[0] != instance.course_id:
+        course_id, count, duration = previous
+        adjust(Course.objects.filter(pk=course_id), lesson_count=-count, video_duration=-duration)
+        adjust(Course.objects.filter(pk=instance.course_id), lesson_count=count, video_duration=duration)
+    instance._previous_course = None
+
+@receiver(pre_save, sender=Course)
+def remember_course_module(sender, instance, **kwargs):
+    instance._previous_module = None
+    if not instance._state.adding:
+        instance._previous_module = Course.objects.filter(pk=instance.pk).values_list(
+            'module_id', 'is_published'
+        ).first()
+
+@receiver(post_save, sender=Course)
+def course_counted(sender, instance, **kwargs):
+    # Module.course_count ne compte que les cours publiés
+    previous = getattr(instance, '_previous_module', None)
+    if previous and previous[1]:
+        adjust(Module.objects.filter(pk=previous[0]), course_count=-1)
+    if instance.is_published:
+        adjust(Module.objects.filter(pk=instance.module_id), course_count=1)
+    instance._previous_module = (instance.module_id, instance.is_published)
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    if instance.is_published:
+        adjust(Module.objects.filter(pk=instance.module_id), course_count=-1)
+
+
+''' notifications aux apprenants (envoyées par un job après la requête) '''
+@receiver(pre_save, sender=Course)
+def remember_course_published(sender, instance, **kwargs):
+    # état précédent déjà lu par remember_course_module (connecté avant)
+    previous = getattr(instance, '_previous_module', None)
+    instance._was_published = bool(previous and previous[1])
+
+@receiver(post_save, sender=Course)
+def course_published(sender, instance, **kwargs):
+    if instance.is_published and not getattr(instance, '_was_published', False):
+        notify(Notification.PUBLISHED, course_id=instance.pk)
+    instance._was_published = instance.is_published
+
+@receiver(post_save, sender=Lesson)
+def lesson_published(sender, instance, created, **kwargs):
+    # le job vérifie que le cours est publié
+    if created:
+        notify(Notification.NEW_LESSON, lesson_id=instance.pk)
+
+
+''' pages pré-rendues des cours publiés : retirées tout de suite, regénérées par un job '''
+def refresh_snapshots(course_ids):
+    if not settings.SNAPSHOT_PUBLISHING:
+        return
+    for course_id in course_ids:
+        invalidate_snapshot(course_id)
+        # une rafale de modifications du même cours : une seule génération en attente
+        enqueue(build_snapshot, course_id, unique=True)
+
+@receiver([post_save, post_delete], sender=Course)
+def course_snapshot(sender, instance, **kwargs):
+    refresh_snapshots([instance.pk])
+
+@receiver([post_save, post_delete], sender=Chapter)
+def chapter_snapshot(sender, instance, **kwargs):
+    refresh_snapshots([instance.course_id])
+
+@receiver([post_save, post_delete], sender=Lesson)
+def lesson_snapshot(sender, instance, **kwargs):
+    if settings.SNAPSHOT_PUBLISHING:
+        refresh_snapshots(Course.objects.filter(chapters=instance.chapter_id).values_list('pk', flat=True))
+
+@receiver(post_save, sender=Module)
+def module_snapshot(sender, instance, created, **kwargs):
+    # slug changé : les URLs de tous ses cours aussi
+    if not created and settings.SNAPSHOT_PUBLISHING:
+        refresh_snapshots(instance.courses.filter(is_published=True).values_list('pk', flat=True))
+
+@receiver(post_save, sender=Category)
+def category_snapshot(sender, instance, created, **kwargs):
+    if not created and settings.SNAPSHOT_PUBLISHING:
+        refresh_snapshots(
+            Course.objects.filter(module__category=instance, is_published=True).values_list('pk', flat=True)
+        )
+
+
+''' version du catalogue (caches de l'API) '''
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Module)
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Chapter)
+@receiver([post_save, post_delete], sender=Lesson)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+''' index de l'autocomplétion (après le bump : l'index reprend la nouvelle version) '''
+@receiver(post_save, sender=Module)
+def module_indexed(sender, instance, created, **kwargs):
+    if created:
+        search_index.module_changed(instance.pk)
+    else:
+        # slug changé : les URLs de ses cours et leçons aussi
+        search_index.invalidate()
+
+@receiver(post_save, sender=Course)
+def course_indexed(sender, instance, **kwargs):
+    search_index.course_changed(instance.pk)
+
+@receiver(post_save, sender=Lesson)
+def lesson_indexed(sender, instance, **kwargs):
+    search_index.lesson_changed(instance.pk)
+
+@receiver(post_delete, sender=Module)
+def module_unindexed(sender, instance, **kwargs):
+    search_index.removed(MODULE, [instance.pk])
+
+@receiver(post_delete, sender=Course)
+def course_unindexed(sender, instance, **kwargs):
+    search_index.removed(COURSE, [instance.pk])
+
+@receiver(post_delete, sender=Lesson)
+def lesson_unindexed(sender, instance, **kwargs):
+    search_index.removed(LESSON, [instance.pk])
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Chapter)
+def catalog_reindexed(sender, created=False, **kwargs):
+    # nouveau chapitre : aucune leçon encore, rien à indexer
+    if not created:
+        search_index.invalidate()
@@ -0,0 +1,112 @@
+'''
+URLs signées et limitées dans le temps pour les vidéos des leçons.
+
+La signature (HMAC-SHA256 du chemin, de l'utilisateur et de l'expiration)
+se vérifie sans base ni Django : par la vue de repli de Django, par
+core.media_app (petite application ASGI) ou par le serveur frontal.
+Ce module n'importe Django que dans signed_url(). Il porte aussi la
+réponse à Range / If-Range (serve_range) commune aux vues qui servent des
+fichiers et à core.media_app.
+'''
+import base64
+import hashlib
+import hmac
+import posixpath
+import time
+from urllib.parse import urlencode
+
+
+def signature(key, path, user_id, expires):
+    message = f'{path}\n{user_id}\n{expires}'.encode()
+    digest = hmac.new(key.encode(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def expiry(ttl, bucket, now=None):
+    '''
+    Expiration arrondie à la tranche suivante : la même URL pendant toute une
+    tranche (caches du navigateur et du frontal), valable au moins `ttl`.
+    '''
+    now = int(time.time() if now is None else now)
+    return (now // bucket + 1) * bucket + ttl
+
+
+def clean_path(path):
+    ''' chemin relatif sous la racine des médias, None s'il en sort '''
+    path = posixpath.normpath(path.lstrip('/'))
+    if path.startswith(('..', '/')) or path == '.':
+        return None
+    return path
+
+
+def verify(key, path, user_id, expires, sig, now=None):
+    ''' signature valide et non expirée ; aucune requête, aucun état '''
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(signature(key, path, user_id, expires), sig or '')
+
+
+def verify_query(key, path, params, now=None):
+    ''' params : dict de la query string (u, e, s) '''
+    return verify(key, path, params.get('u', ''), params.get('e'), params.get('s'), now)
+
+
+def byte_range(header, size):
+    # en-tête Range : une seule plage "bytes=début-fin" ; None si absente ou illisible, False si hors limites
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, _, end = header[6:].strip().partition('-')
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def serve_range(range_header, if_range, size, etag):
+    '''
+    Réponse à une requête avec Range (course_package, lesson_video,
+    signed_media, core.media_app) : (statut, début, fin, en-têtes).
+    Un If-Range qui ne correspond plus à `etag` fait ignorer Range (tout le
+    fichier, 200), même une plage hors limites ; sinon 206, ou 416 avec
+    début et fin à None.
+    '''
+    requested = None if if_range and if_range != etag else byte_range(range_header, size)
+    if requested is False:
+        return 416, None, None, {'Content-Range': f'bytes */{size}'}
+
+    start, end = requested or (0, size - 1)
+    headers = {'Content-Length': str(end - start + 1), 'Accept-Ranges': 'bytes', 'ETag': etag}
+    if requested:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return (206 if requested else 200), start, end, headers
+
+
+def chunk_sizes(start, end, chunk_size):
+    ''' tailles des morceaux successifs pour envoyer les octets [start, end] '''
+    position = start
+    while position <= end:
+        amount = min(chunk_size, end - position + 1)
+        yield amount
+        position += amount
+
+
+def signed_url(name, user_id, now=None):
+    ''' URL de `name` (chemin dans MEDIA_ROOT) pour cet utilisateur '''
+    from django.conf import settings
+
+    expires = expiry(settings.SIGNED_MEDIA_TTL, settings.SIGNED_MEDIA_BUCKET, now)
+    query = urlencode({'u': user_id, 'e': expires, 's': signature(settings.SIGNED_MEDIA_KEY, name, user_id, expires)})
+    return f'{settings.SIGNED_MEDIA_URL}{name}?{query}'
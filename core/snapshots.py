@@ -0,0 +1,166 @@
+'''
+Pages des cours publiés rendues d'avance. Elles ne sont pas publiques :
+ChapterListView et LessonDetailView font leurs vérifications (connexion,
+rôle, inscription) puis renvoient la page toute prête, lue par Django ou
+envoyée par le serveur frontal (X-Accel-Redirect, SNAPSHOT_ACCEL_REDIRECT).
+'''
+import hashlib
+import os
+import posixpath
+import shutil
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from .course_tree import course_trees
+from .models import Lesson
+
+KEEP_BUILDS = 2
+
+
+def _root(*parts):
+    return os.path.join(settings.SNAPSHOT_ROOT, *parts)
+
+
+def _pointer(course_id):
+    ''' lien vers la version en ligne du cours ; absent = pas de snapshot valide '''
+    return _root('courses', str(course_id))
+
+
+def _replace_symlink(target, link):
+    # un lien temporaire renommé par-dessus l'ancien : jamais d'instant sans lien
+    os.makedirs(os.path.dirname(link), exist_ok=True)
+    tmp = f'{link}.{uuid.uuid4().hex}.tmp'
+    os.symlink(target, tmp)
+    os.replace(tmp, link)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def invalidate_snapshot(course_id):
+    ''' les vues reviennent au rendu dynamique jusqu'à la prochaine génération '''
+    _unlink(_pointer(course_id))
+
+
+def _course_dir(tree):
+    # /start-study/<cat>/<module>/courses/<cours>/chapters/ -> /start-study/.../<cours>/
+    return posixpath.dirname(tree.url.rstrip('/')) + '/'
+
+
+def _page(tree, url):
+    ''' chemin de la page de `url` relatif au dossier du cours '''
+    return url[len(_course_dir(tree)):] + 'index.html'
+
+
+def render_course_pages(tree):
+    '''
+    {chemin relatif au dossier du cours: html} pour le sommaire et chaque
+    leçon, rendus sans utilisateur : le menu et l'URL signée de la vidéo
+    viennent du fragment (snapshot_fragment).
+    '''
+    fragment_url = reverse('snapshot_fragment')
+    pages = {
+        _page(tree, tree.url): render_to_string('core/list/chapter_list.html', {
+            'course': tree, 'chapters': tree.chapters,
+            'snapshot': {'fragment_url': fragment_url},
+        }),
+    }
+    lessons = Lesson.objects.filter(chapter__course_id=tree.pk).only(
+        'pk', 'title', 'content', 'video_file', 'order', 'chapter_id'
+    ).in_bulk()
+    for node in tree.lessons:
+        context = tree.navigation(node)
+        context.update(
+            current_lesson=lessons[node.pk],
+            snapshot={'fragment_url': f'{fragment_url}?lesson={node.pk}'},
+        )
+        pages[_page(tree, node.url)] = render_to_string('core/detail/current_lesson_detail.html', context)
+    return pages
+
+
+def _write_build(course_id, version, pages):
+    ''' écrit la version dans un dossier temporaire puis le renomme (atomique) '''
+    builds = _root('builds', str(course_id))
+    final = os.path.join(builds, version)
+    if os.path.isdir(final):
+        return final
+
+    tmp = os.path.join(builds, f'.{version}.{uuid.uuid4().hex}.tmp')
+    for relative, html in pages.items():
+        target = os.path.join(tmp, *relative.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as fp:
+            fp.write(html)
+    try:
+        os.rename(tmp, final)
+    except OSError:
+        # même version écrite en parallèle
+        shutil.rmtree(tmp, ignore_errors=True)
+    return final
+
+
+def _prune_builds(course_id, keep):
+    builds = _root('builds', str(course_id))
+    if not os.path.isdir(builds):
+        return
+    versions = sorted(
+        (entry for entry in os.scandir(builds) if entry.is_dir() and entry.name != keep),
+        key=lambda entry: entry.stat().st_mtime, reverse=True,
+    )
+    for entry in versions[KEEP_BUILDS - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def remove_snapshot(course_id):
+    ''' cours dépublié ou supprimé : plus aucune page pré-rendue '''
+    invalidate_snapshot(course_id)
+    shutil.rmtree(_root('builds', str(course_id)), ignore_errors=True)
+
+
+def build_snapshot(course_id):
+    ''' (re)génère les pages d'un cours publié ; renvoie la version en ligne '''
+    tree = next(iter(course_trees.many([course_id])), None)
+    if tree is None or not tree.is_published:
+        remove_snapshot(course_id)
+        return None
+
+    pages = render_course_pages(tree)
+    digest = hashlib.sha256()
+    for relative in sorted(pages):
+        digest.update(relative.encode())
+        digest.update(pages[relative].encode())
+    version = digest.hexdigest()[:16]
+
+    build = _write_build(course_id, version, pages)
+    _replace_symlink(build, _pointer(course_id))
+    _prune_builds(course_id, version)
+    return version
+
+
+def snapshot_response(tree, url):
+    '''
+    Page pré-rendue de `url` (sommaire ou leçon du cours `tree`), ou None
+    s'il n'y en a pas (publication désactivée, génération en attente). À
+    n'appeler qu'une fois les droits de l'utilisateur vérifiés par la vue.
+    '''
+    if not settings.SNAPSHOT_PUBLISHING:
+        return None
+    relative = _page(tree, url)
+    path = os.path.realpath(os.path.join(_pointer(tree.pk), *relative.split('/')))
+    if not os.path.isfile(path):
+        return None
+
+    if settings.SNAPSHOT_ACCEL_REDIRECT:
+        # version résolue ici : la page envoyée est celle qui vient d'être vérifiée
+        response = HttpResponse(content_type='text/html; charset=utf-8')
+        internal = os.path.relpath(path, os.path.realpath(settings.SNAPSHOT_ROOT)).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.SNAPSHOT_ACCEL_REDIRECT + internal
+        return response
+    return FileResponse(open(path, 'rb'), content_type='text/html; charset=utf-8')
@@ -0,0 +1,18 @@
+'use strict';
+{
+  // filtre de changelist : recharge la liste quand une valeur est choisie
+  const $ = django.jQuery;
+
+  $(function () {
+    $('select.admin-autocomplete-filter').on('change', function () {
+      if (!this.value) {
+        window.location.href = this.dataset.clearUrl;
+        return;
+      }
+      const params = new URLSearchParams(window.location.search);
+      params.delete('p');
+      params.set(this.dataset.param, this.value);
+      window.location.search = params.toString();
+    });
+  });
+}
@@ -0,0 +1,46 @@
+// Recherche dans le catalogue au fil de la frappe (api/autocomplete/).
+(function () {
+  var input = document.getElementById("catalog-search");
+  var list = document.getElementById("catalog-suggestions");
+  if (!input || !list) return;
+
+  var labels = { course: "cours", module: "module", lesson: "leçon" };
+  var timer = null;
+  var last = "";
+
+  function render(results) {
+    list.innerHTML = "";
+    results.forEach(function (result) {
+      var link = document.createElement("a");
+      link.className = "list-group-item list-group-item-action d-flex justify-content-between";
+      link.href = result.url;
+      link.textContent = result.title;
+      var badge = document.createElement("span");
+      badge.className = "badge text-bg-light";
+      badge.textContent = labels[result.type] || result.type;
+      link.appendChild(badge);
+      list.appendChild(link);
+    });
+  }
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var query = input.value.trim();
+      if (query === last) return;
+      last = query;
+      if (query.length < 2) return render([]);
+
+      fetch(input.dataset.url + "?q=" + encodeURIComponent(query), { headers: { Accept: "application/json" } })
+        .then(function (response) { return response.ok ? response.json() : null; })
+        .then(function (data) {
+          // réponse d'une frappe plus ancienne : ignorée
+          if (data && data.query === input.value.trim()) render(data.results);
+        });
+    }, 120);
+  });
+
+  input.addEventListener("keydown", function (event) {
+    if (event.key === "Escape") render([]);
+  });
+})();
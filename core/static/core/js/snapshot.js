@@ -0,0 +1,22 @@
+// Pages pré-rendues (core.snapshots), servies après les vérifications de la
+// vue : le menu utilisateur et l'URL signée de la vidéo viennent d'un petit
+// fragment dynamique.
+(function () {
+  var script = document.currentScript;
+  var url = script && script.dataset.fragment;
+  if (!url) return;
+
+  fetch(url, { credentials: "same-origin", headers: { Accept: "application/json" } })
+    .then(function (response) { return response.ok ? response.json() : null; })
+    .then(function (data) {
+      if (!data) return;
+      var menu = document.getElementById("user-menu");
+      if (menu) menu.innerHTML = data.user_menu;
+
+      var source = document.querySelector("video source");
+      if (data.video_url && source) {
+        source.src = data.video_url;
+        source.parentNode.load();
+      }
+    });
+})();
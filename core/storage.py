@@ -0,0 +1,105 @@
+import hashlib
+import os
+import tempfile
+import zlib
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'lessons/blobs'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    ''' chaque fichier est stocké une seule fois, sous le sha256 de son contenu '''
+
+    def get_available_name(self, name, max_length=None):
+        # même contenu -> même nom, on ne suffixe jamais
+        return name
+
+    def blob_name(self, digest, ext):
+        return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+    def _save(self, name, content):
+        from .models import VideoBlob
+
+        tmp_dir = self.path(f'{BLOB_DIR}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        # sha256 et crc32 (archives zip) calculés pendant la copie
+        sha = hashlib.sha256()
+        crc = 0
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    sha.update(chunk)
+                    crc = zlib.crc32(chunk, crc)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            digest = sha.hexdigest()
+            with transaction.atomic():
+                # contenu déjà connu : son nom existant (extension du premier envoi),
+                # celui que acquire_blob() et release_blob() retrouvent ; updated_at
+                # rafraîchi pour que gc_media ne supprime pas ce fichier maintenant
+                blob, created = VideoBlob.objects.select_for_update().get_or_create(
+                    digest=digest,
+                    defaults={'name': self.blob_name(digest, os.path.splitext(name)[1].lower()), 'size': size, 'crc32': crc},
+                )
+                if not created:
+                    VideoBlob.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+                blob = blob.name
+
+                if self.exists(blob):
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(self.path(blob)), exist_ok=True)
+                    os.replace(tmp_path, self.path(blob))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return blob
+
+
+video_storage = ContentAddressedStorage()
+
+
+def get_video_storage():
+    return video_storage
+
+
+def acquire_blob(name):
+    from .models import VideoBlob
+
+    VideoBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+
+def release_blob(name):
+    ''' décrémente le compteur ; à zéro, la ligne et le fichier sont supprimés '''
+    from .models import VideoBlob
+
+    with transaction.atomic():
+        VideoBlob.objects.filter(name=name, ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1
+        )
+        deleted, _ = VideoBlob.objects.filter(name=name, ref_count=0).delete()
+
+    if deleted:
+        transaction.on_commit(lambda: _delete_unreferenced(name))
+
+
+def _delete_unreferenced(name):
+    from .models import VideoBlob
+
+    # un nouvel upload du même contenu a pu recréer le blob entre-temps
+    if not VideoBlob.objects.filter(name=name).exists():
+        video_storage.delete(name)
@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from .signed_media import chunk_sizes
+
+
+class TokenBucket:
+    '''
+    Débit `rate` (octets/s) avec une réserve de `burst` octets. reserve()
+    prend les jetons tout de suite, quitte à s'endetter, et renvoie l'attente
+    avant d'envoyer : les demandes sont servies dans leur ordre d'arrivée.
+    '''
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now=None):
+        if not self.rate:
+            return 0.0
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def idle(self, now=None):
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens >= self.burst
+
+
+class StreamMetrics:
+    ''' compteurs du process, lus par la vue streaming_metrics '''
+
+    FIELDS = (
+        'streams_started', 'streams_rejected', 'active_streams',
+        'bytes_sent', 'bytes_throttled', 'throttle_seconds',
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.values = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **deltas):
+        with self._lock:
+            for field, delta in deltas.items():
+                self.values[field] += delta
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+
+class TooManyStreams(Exception):
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StreamLimiter:
+    '''
+    Limites des vidéos d'un process : flux simultanés par utilisateur et au
+    total, débit par utilisateur puis débit global. Chaque flux ne réserve
+    qu'un morceau à la fois : les flux actifs passent à tour de rôle sur le
+    seau global, un client rapide n'affame pas les autres.
+    Verrou de threads (et non asyncio) : les vues async tournent aussi dans
+    une boucle par requête sous WSGI.
+    '''
+
+    MAX_IDLE_BUCKETS = 10_000
+
+    def __init__(self, user_rate=None, user_burst=None, global_rate=None, global_burst=None,
+                 streams_per_user=None, max_streams=None):
+        self.user_rate = user_rate if user_rate is not None else settings.VIDEO_RATE_PER_USER
+        self.user_burst = user_burst or settings.VIDEO_BURST_PER_USER
+        self.streams_per_user = streams_per_user or settings.VIDEO_STREAMS_PER_USER
+        self.max_streams = max_streams or settings.VIDEO_MAX_STREAMS
+        self.bucket = TokenBucket(
+            global_rate if global_rate is not None else settings.VIDEO_RATE_GLOBAL,
+            global_burst or settings.VIDEO_BURST_GLOBAL,
+        )
+        self.metrics = StreamMetrics()
+        self._users = {}    # user_id -> TokenBucket
+        self._streams = {}  # user_id -> flux ouverts
+        self._lock = threading.Lock()
+
+    def open(self, user_id):
+        ''' réserve une place de flux ; TooManyStreams si l'une des limites est atteinte '''
+        with self._lock:
+            if self._streams.get(user_id, 0) >= self.streams_per_user:
+                self.metrics.add(streams_rejected=1)
+                raise TooManyStreams("trop de vidéos ouvertes en même temps", retry_after=5)
+            if sum(self._streams.values()) >= self.max_streams:
+                self.metrics.add(streams_rejected=1)
+                raise TooManyStreams("serveur vidéo saturé", retry_after=30)
+
+            self._streams[user_id] = self._streams.get(user_id, 0) + 1
+            if user_id not in self._users:
+                if len(self._users) >= self.MAX_IDLE_BUCKETS:
+                    self._prune()
+                self._users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        self.metrics.add(streams_started=1, active_streams=1)
+
+    def close(self, user_id):
+        with self._lock:
+            left = self._streams.get(user_id, 0) - 1
+            if left > 0:
+                self._streams[user_id] = left
+            else:
+                self._streams.pop(user_id, None)
+        self.metrics.add(active_streams=-1)
+
+    def _prune(self):
+        # seaux pleins d'utilisateurs sans flux : les recréer ne donne rien de plus
+        now = time.monotonic()
+        for user_id in [u for u, bucket in self._users.items() if u not in self._streams and bucket.idle(now)]:
+            del self._users[user_id]
+
+    def user_delay(self, user_id, amount):
+        with self._lock:
+            return self._users[user_id].reserve(amount)
+
+    def global_delay(self, amount):
+        with self._lock:
+            return self.bucket.reserve(amount)
+
+    def sent(self, amount, waited):
+        if waited:
+            self.metrics.add(bytes_sent=amount, bytes_throttled=amount, throttle_seconds=waited)
+        else:
+            self.metrics.add(bytes_sent=amount)
+
+    def stream(self, fp, user_id, start, end, asynchronous=False, chunk_size=None):
+        ''' itérateur des octets [start, end] de fp ; la place réservée par open() est libérée à la fermeture '''
+        return (AsyncVideoStream if asynchronous else SyncVideoStream)(self, fp, user_id, start, end, chunk_size)
+
+
+class VideoStream:
+    '''
+    Morceaux d'un fichier au rythme des seaux. close() (appelé par Django à
+    la fin de la réponse, même jamais lue) ferme le fichier et rend la place.
+    '''
+
+    def __init__(self, limiter, fp, user_id, start, end, chunk_size=None):
+        self.limiter = limiter
+        self.fp = fp
+        self.user_id = user_id
+        self.start = start
+        self.end = end
+        self.chunk_size = chunk_size or settings.VIDEO_CHUNK_SIZE
+        self._closed = False
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.fp.close()
+            self.limiter.close(self.user_id)
+
+    def chunks(self):
+        return chunk_sizes(self.start, self.end, self.chunk_size)
+
+
+class SyncVideoStream(VideoStream):
+
+    def __iter__(self):
+        limiter = self.limiter
+        try:
+            self.fp.seek(self.start)
+            for amount in self.chunks():
+                waited = 0.0
+                delay = limiter.user_delay(self.user_id, amount)
+                if delay:
+                    time.sleep(delay)
+                    waited += delay
+                # le débit global n'est réservé qu'après l'attente propre à l'utilisateur :
+                # un flux bridé ne garde pas de créneau qu'il n'utiliserait pas
+                delay = limiter.global_delay(amount)
+                if delay:
+                    time.sleep(delay)
+                    waited += delay
+                data = self.fp.read(amount)
+                if not data:
+                    break
+                limiter.sent(len(data), waited)
+                yield data
+        finally:
+            self.close()
+
+
+class AsyncVideoStream(VideoStream):
+    ''' sous ASGI : attentes et lectures disque hors de la boucle d'événements (pas de __iter__) '''
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        limiter = self.limiter
+        try:
+            await asyncio.to_thread(self.fp.seek, self.start)
+            for amount in self.chunks():
+                waited = 0.0
+                delay = limiter.user_delay(self.user_id, amount)
+                if delay:
+                    await asyncio.sleep(delay)
+                    waited += delay
+                delay = limiter.global_delay(amount)
+                if delay:
+                    await asyncio.sleep(delay)
+                    waited += delay
+                data = await asyncio.to_thread(self.fp.read, amount)
+                if not data:
+                    break
+                limiter.sent(len(data), waited)
+                yield data
+        finally:
+            await asyncio.to_thread(self.close)
+
+
+video_limiter = StreamLimiter()
@@ -0,0 +1,11 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def duration(seconds):
+    ''' 3725 -> "1 h 02 min", 420 -> "7 min" '''
+    minutes = (seconds or 0) // 60
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours} h {minutes:02d} min' if hours else f'{minutes} min'
@@ -1,7 +1,54 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
-from .models import Category, Module, Course, Chapter, Lesson, Enrollment
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from . import urls as core_urls
+from .backends import CachedModelBackend, require_shared_cache
+from .media_gc import MediaCollector
+from .offline import ZipLayout, build_course_package
+from .seed import seed_catalog
+from .early_hints import EarlyHintsMiddleware
+from .warmup import warm_up
+from .admin_utils import EstimatedCountPaginator
+from .catalog import CATALOG_VERSION_KEY, bump_catalog_version
+from .cohorts import _insert_enrollments, cohort_from_course, enroll_cohort
+from .counters import reconcile_counters
+from .jobs import WorkerPool, claim, enqueue, requeue_stale, run_pending
+from .snapshots import build_snapshot
+from .course_tree import course_trees, load_course_trees
+from .prefix_index import PrefixIndex, normalize, search_index
+from .query_audit import audit, audit_cache, clear_caches, explain, problems, suggest, view_requests
+from .roster import import_roster, read_roster
+from .models import (
+    TheUser, Category, Module, Course, Chapter, Lesson, Enrollment, Notification, VideoBlob, Job,
+    FanOutProgress, RosterImport,
+)
+from .storage import video_storage
+from .streaming import StreamLimiter, TokenBucket, TooManyStreams
+from .signed_media import expiry, serve_range, signed_url, verify
+from .media_app import SignedMediaApp
 
 
 User = get_user_model()
@@ -103,3 +150,1514 @@ class ElearningModelTest(TestCase):
                 student=self.student,
                 course=self.course
             )
+
+
+class CachedUserTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+        self.teacher = User.objects.create_user(
+            username="teacher1", password="testpass123", role="teacher"
+        )
+        self.student = User.objects.create_user(
+            username="student1", password="testpass123", role="student"
+        )
+        category = Category.objects.create(name="Programmation")
+        module = Module.objects.create(name="Python", category=category)
+        self.course = Course.objects.create(
+            module=module, teacher=self.teacher,
+            title="Python Débutant", description="..."
+        )
+        chapter = Chapter.objects.create(
+            course=self.course, name="Bases", description="...", order=1
+        )
+        self.lesson = Lesson.objects.create(
+            chapter=chapter, title="Variables", content="...", order=1
+        )
+
+    def test_warm_user_costs_no_query(self):
+        self.backend.get_user(self.student.pk)
+
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.student.pk)
+            self.assertTrue(user.is_student)
+            self.assertEqual(user.enrolled_course_ids, frozenset())
+
+    def test_snapshot_invalidated_on_save(self):
+        self.backend.get_user(self.student.pk)
+        self.student.role = "teacher"
+        self.student.save()
+
+        self.assertTrue(self.backend.get_user(self.student.pk).is_teacher)
+
+    def test_snapshot_invalidated_on_enrollment(self):
+        self.backend.get_user(self.student.pk)
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+        user = self.backend.get_user(self.student.pk)
+        self.assertEqual(user.enrolled_course_ids, {self.course.pk})
+
+    def test_lesson_view_without_auth_queries(self):
+        self.client.force_login(self.student)
+        url = self.lesson.get_absolute_url()
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        for query in ctx.captured_queries:
+            self.assertNotIn('django_session', query['sql'])
+            self.assertNotIn('core_theuser', query['sql'])
+
+    @override_settings(SHARED_CACHE_REQUIRED=True)
+    def test_production_refuses_process_local_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            require_shared_cache()
+
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with self.settings(CACHES=shared):
+            require_shared_cache()
+
+
+class RosterImportTest(TestCase):
+
+    def test_import_creates_users_and_groups(self):
+        User.objects.create_user(username="dup", password="x")
+        fp = io.StringIO(
+            "username,password,role,email\n"
+            "alice,secretpass1,student,alice@example.com\n"
+            "bob,secretpass2,teacher,\n"
+            "dup,secretpass3,student,\n"
+            "carol,,admin,\n"
+            "alice,secretpass4,student,\n"
+        )
+
+        report = import_roster(read_roster(fp), workers=1)
+
+        self.assertEqual(report.created, 2)
+        self.assertEqual([line for line, _ in report.errors], [4, 5, 6])
+        alice = User.objects.get(username="alice")
+        self.assertTrue(alice.check_password("secretpass1"))
+        self.assertEqual(
+            list(alice.groups.values_list('name', flat=True)), ['student-group']
+        )
+        self.assertTrue(User.objects.get(username="bob").groups.filter(name='teacher-group').exists())
+
+
+    def test_admin_import_runs_in_a_job(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile('roster.csv', b"username,password\nalice,secretpass1\nalice,x\n")
+
+        with self.settings(ROSTER_IMPORT_ROOT=root, ROSTER_IMPORT_WORKERS=1):
+            response = self.client.post(reverse('admin:core_theuser_import_roster'), {'csv_file': upload})
+            roster = RosterImport.objects.get()
+            self.assertRedirects(response, reverse('admin:core_theuser_roster_status', args=[roster.pk]))
+            # rien d'importé pendant la requête
+            self.assertFalse(User.objects.filter(username='alice').exists())
+            self.assertContains(self.client.get(response.url), 'en attente')
+
+            self.assertEqual(run_pending(), 1)
+
+        roster.refresh_from_db()
+        self.assertEqual((roster.created, roster.errors), (1, [[3, "alice apparaît plusieurs fois"]]))
+        self.assertTrue(User.objects.get(username='alice').check_password('secretpass1'))
+        self.assertEqual(os.listdir(root), [])
+        self.assertContains(self.client.get(response.url), 'ligne 3 : alice apparaît plusieurs fois')
+
+
+class CohortEnrollmentTest(TestCase):
+
+    def setUp(self):
+        teacher = User.objects.create_user(username="teacher1", role="teacher")
+        category = Category.objects.create(name="Programmation")
+        module = Module.objects.create(name="Python", category=category)
+        self.source = Course.objects.create(
+            module=module, teacher=teacher, title="Python 1", description="..."
+        )
+        self.target = Course.objects.create(
+            module=module, teacher=teacher, title="Python 2", description="..."
+        )
+        self.students = [
+            User.objects.create_user(username=f"student{i}", role="student")
+            for i in range(5)
+        ]
+        for student in self.students[:3]:
+            Enrollment.objects.create(student=student, course=self.source)
+        Enrollment.objects.create(student=self.students[0], course=self.target)
+
+    def test_copy_roster_skips_existing(self):
+        created = enroll_cohort(cohort_from_course(self.source), [self.target], batch_size=2)
+
+        self.assertEqual(created, 2)
+        self.assertEqual(
+            set(self.target.enrollments.values_list('student_id', flat=True)),
+            {s.pk for s in self.students[:3]},
+        )
+
+    def test_counter_follows_rows_actually_inserted(self):
+        late = self.students[3]
+
+        def concurrent_enrollment_first(course_id, student_ids):
+            # inscription concurrente entre la lecture des inscrits et l'insertion
+            Enrollment.objects.create(student=late, course_id=course_id)
+            return _insert_enrollments(course_id, student_ids)
+
+        with mock.patch('core.cohorts._insert_enrollments', concurrent_enrollment_first):
+            created = enroll_cohort(User.objects.all(), [self.target])
+
+        self.assertEqual(created, 3)
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.enrollment_count, self.target.enrollments.count())
+        self.assertEqual(self.target.enrollment_count, 5)
+        inserted = Enrollment.objects.get(student=self.students[4], course=self.target)
+        self.assertLess(abs((timezone.now() - inserted.created_at).total_seconds()), 60)
+
+    def test_only_students_are_enrolled(self):
+        created = enroll_cohort(User.objects.all(), [self.source, self.target])
+
+        self.assertEqual(created, 2 + 4)
+        self.assertFalse(Enrollment.objects.filter(student__role="teacher").exists())
+
+
+class ContentAddressedVideoTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        teacher = User.objects.create_user(username="teacher1", role="teacher")
+        category = Category.objects.create(name="Programmation")
+        module = Module.objects.create(name="Python", category=category)
+        course = Course.objects.create(
+            module=module, teacher=teacher, title="Python", description="..."
+        )
+        self.chapter = Chapter.objects.create(
+            course=course, name="Bases", description="...", order=1
+        )
+
+    def make_lesson(self, order, data, filename="intro.mp4"):
+        lesson = Lesson(chapter=self.chapter, title=f"Leçon {order}", content="...", order=order)
+        lesson.video_file.save(filename, ContentFile(data), save=False)
+        lesson.save()
+        return lesson
+
+    def test_same_content_is_stored_once(self):
+        first = self.make_lesson(1, b"intro video")
+        second = self.make_lesson(2, b"intro video")
+
+        self.assertEqual(first.video_file.name, second.video_file.name)
+        blob = VideoBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.size, len(b"intro video"))
+
+    def test_same_content_under_another_extension(self):
+        first = self.make_lesson(1, b"intro video")
+        second = self.make_lesson(2, b"intro video", filename="intro.mkv")
+
+        self.assertEqual(second.video_file.name, first.video_file.name)
+        self.assertEqual(VideoBlob.objects.get().ref_count, 2)
+        blob_dir = os.path.dirname(video_storage.path(first.video_file.name))
+        self.assertEqual(os.listdir(blob_dir), [os.path.basename(first.video_file.name)])
+
+    def test_blob_deleted_with_last_reference(self):
+        first = self.make_lesson(1, b"intro video")
+        second = self.make_lesson(2, b"intro video")
+        path = video_storage.path(first.video_file.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(VideoBlob.objects.exists())
+
+    def test_replacing_video_releases_old_blob(self):
+        lesson = self.make_lesson(1, b"old video")
+        old_name = lesson.video_file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.video_file.save("new.mp4", ContentFile(b"new video"))
+
+        self.assertNotEqual(lesson.video_file.name, old_name)
+        self.assertFalse(video_storage.exists(old_name))
+        self.assertEqual(VideoBlob.objects.get().name, lesson.video_file.name)
+
+
+class MediaGarbageCollectorTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        self.manifest = os.path.join(state_dir, 'manifest.json')
+
+        teacher = User.objects.create_user(username="teacher1", role="teacher")
+        category = Category.objects.create(name="Programmation")
+        module = Module.objects.create(name="Python", category=category)
+        course = Course.objects.create(
+            module=module, teacher=teacher, title="Python", description="..."
+        )
+        chapter = Chapter.objects.create(course=course, name="Bases", description="...")
+        self.lesson = Lesson.objects.create(
+            chapter=chapter, title="Variables", content="...",
+            video_file='lessons/videos/kept.mp4',
+        )
+        self.kept = self.write('lessons/videos/kept.mp4')
+        self.orphan = self.write('lessons/videos/old/orphan.mp4')
+
+    def write(self, name, data=b'0123456789'):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        return path
+
+    def collect(self, **kwargs):
+        return MediaCollector(self.media_root, self.manifest, min_age=0, **kwargs).run()
+
+    def test_dry_run_only_reports(self):
+        collector = self.collect(dry_run=True)
+
+        self.assertEqual(collector.orphans, 1)
+        self.assertEqual(collector.reclaimable, 10)
+        self.assertTrue(os.path.exists(self.orphan))
+
+    def test_deletes_orphans_and_skips_unchanged_dirs(self):
+        collector = self.collect()
+        self.assertEqual(collector.deleted, 1)
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.kept))
+
+        collector = self.collect()
+        self.assertEqual(collector.scanned, 0)
+        self.assertEqual(collector.deleted, 0)
+
+    def test_large_directory_is_deleted_in_throttled_batches(self):
+        for i in range(5):
+            self.write(f'lessons/videos/old/extra-{i}.mp4')
+
+        with mock.patch('core.media_gc.time.sleep') as sleep:
+            collector = self.collect(batch_size=2, sleep=0.1)
+        self.assertEqual(collector.deleted, 6)
+        self.assertEqual(sleep.call_count, 3)
+
+    def test_blob_reused_during_collection_is_kept(self):
+        reused = self.write('lessons/blobs/ab/cd/abcd.mp4')
+        VideoBlob.objects.create(digest='abcd', name='lessons/blobs/ab/cd/abcd.mp4', size=10, ref_count=1)
+        stale = self.write('lessons/blobs/ef/01/ef01.mp4')
+        VideoBlob.objects.create(digest='ef01', name='lessons/blobs/ef/01/ef01.mp4', size=10)
+
+        self.collect()
+        self.assertTrue(os.path.exists(reused))
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(list(VideoBlob.objects.values_list('digest', flat=True)), ['abcd'])
+
+        # le dossier du fichier gardé est relu au passage suivant
+        collector = self.collect()
+        self.assertEqual((collector.scanned, collector.deleted), (1, 0))
+        self.assertTrue(os.path.exists(reused))
+
+    def test_deleted_lesson_file_is_collected(self):
+        self.collect()
+        Lesson.objects.filter(pk=self.lesson.pk).delete()
+
+        collector = self.collect()
+        self.assertEqual(collector.deleted, 1)
+        self.assertFalse(os.path.exists(self.kept))
+
+
+class AdminChangelistScaleTest(TestCase):
+
+    CHANGELISTS = (
+        '/admin/core/course/',
+        '/admin/core/chapter/',
+        '/admin/core/lesson/',
+        '/admin/core/enrollment/',
+    )
+
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        self.client.get('/admin/')
+
+    def query_counts(self):
+        counts = {}
+        for url in self.CHANGELISTS:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts[url] = len(ctx.captured_queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_rows(self):
+        seed_catalog(courses=3, prefix='small')
+        small = self.query_counts()
+        seed_catalog(courses=30, prefix='large')
+
+        self.assertEqual(self.query_counts(), small)
+
+    def test_filter_and_prefix_search(self):
+        data = seed_catalog(courses=3)
+        course = data['courses'][1]
+
+        response = self.client.get(
+            '/admin/core/lesson/', {'chapter__course__id__exact': course.pk}
+        )
+        self.assertEqual(response.context['cl'].result_count, 12)
+
+        response = self.client.get('/admin/core/course/', {'q': 'SEED COURSE 2'})
+        self.assertEqual(
+            [c.pk for c in response.context['cl'].result_list], [data['courses'][2].pk]
+        )
+
+        course.title, course.description = "Python Débutant", "Les bases du langage"
+        course.save()
+        for q in ("python débutant", "PYTHON DEB", "body:bases du"):
+            response = self.client.get('/admin/core/course/', {'q': q})
+            self.assertEqual([c.pk for c in response.context['cl'].result_list], [course.pk], q)
+        # la description n'est lue que sur demande
+        response = self.client.get('/admin/core/course/', {'q': 'bases du'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_title_search_uses_the_search_key_index(self):
+        seed_catalog(courses=3)
+        for url, index in (('/admin/core/course/', 'course_search_key_idx'),
+                           ('/admin/core/lesson/', 'lesson_search_key_idx')):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(url, {'q': 'seed'})
+            searches = [q['sql'] for q in ctx.captured_queries if '"search_key" >=' in q['sql']]
+            self.assertTrue(searches, url)
+            for sql in searches:
+                plan = explain(sql)
+                self.assertTrue(any(index in detail for detail in plan), (sql, plan))
+                self.assertFalse(any(d.startswith(('SCAN core_course', 'SCAN core_lesson')) for d in plan), plan)
+
+    def test_filtered_count_is_not_truncated(self):
+        course = seed_catalog(courses=1, students=12, enrollments=12)['courses'][0]
+        paginator = EstimatedCountPaginator(Enrollment.objects.filter(course=course).order_by('pk'), 5)
+        paginator.count_limit = 5
+
+        self.assertEqual(paginator.count, 12)
+        self.assertEqual(len(paginator.get_page(3).object_list), 2)
+
+    def test_inlines_are_paginated(self):
+        course = seed_catalog(courses=1, students=60, enrollments=60)['courses'][0]
+        url = f'/admin/core/course/{course.pk}/change/'
+
+        def enrollment_formset(response):
+            return next(
+                f.formset for f in response.context['inline_admin_formsets']
+                if f.formset.model is Enrollment
+            )
+
+        response = self.client.get(url)
+        self.assertEqual(enrollment_formset(response).initial_form_count(), 25)
+
+        response = self.client.get(url, {'enrollment_page': 3})
+        formset = enrollment_formset(response)
+        self.assertEqual(formset.initial_form_count(), 10)
+        self.assertContains(response, '?enrollment_page=2')
+
+
+class CatalogApiTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        data = seed_catalog(courses=3, chapters=2, lessons=2)
+        self.courses = data['courses']
+        Course.objects.filter(pk=self.courses[2].pk).update(is_published=False)
+
+    def test_sparse_fields_and_cursor_pagination(self):
+        response = self.client.get('/api/courses/', {'fields': 'slug,title', 'limit': 1})
+        payload = response.json()
+
+        self.assertEqual(payload['results'], [{'slug': 'seed-course-0', 'title': 'seed course 0'}])
+        self.assertTrue(payload['next'].startswith('/api/courses/?'))
+        response = self.client.get(payload['next'])
+        payload = response.json()
+        self.assertEqual([c['slug'] for c in payload['results']], ['seed-course-1'])
+        self.assertIsNone(payload['next'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/lessons/', {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_resource_is_a_json_404(self):
+        for url in ('/api/users/', '/api/users/admin/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json(), {'error': 'ressource inconnue'})
+            self.assertFalse(response.has_header('ETag'))
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/chapters/', {'course': 'seed-course-0'})
+        self.assertEqual(len(response.json()['results']), 2)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/chapters/', {'course': 'seed-course-0'},
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_catalog(self):
+        etag = self.client.get('/api/courses/')['ETag']
+        self.courses[0].title = 'renamed'
+        self.courses[0].save()
+
+        response = self.client.get('/api/courses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['title'], 'renamed')
+
+    def test_streamed_export(self):
+        response = self.client.get('/api/catalog/export/')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        types = [line['type'] for line in lines]
+        self.assertEqual(types.count('courses'), 2)
+        self.assertEqual(types.count('lessons'), 2 * 2 * 2)
+
+
+class EarlyHintsTest(TestCase):
+
+    def test_lesson_links_next_lesson(self):
+        seed_catalog(courses=1, chapters=2, lessons=2)
+        lessons = list(Lesson.objects.order_by('chapter__order', 'order'))
+
+        response = self.client.get(lessons[0].get_absolute_url())
+        self.assertIn('rel=preload; as=style', response['Link'])
+        self.assertIn(f'<{lessons[1].get_absolute_url()}>; rel=prefetch', response['Link'])
+        # pas de Link sur une plage d'octets : la vidéo courante se précharge par la balise
+        self.assertContains(response, '<video controls preload="auto"')
+
+        # dernière leçon du chapitre : on précharge le chapitre suivant
+        response = self.client.get(lessons[1].get_absolute_url())
+        self.assertIn(f'<{lessons[2].get_absolute_url()}>; rel=prefetch', response['Link'])
+
+    def test_asgi_early_hints(self):
+        sent = []
+
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200})
+
+        async def send(message):
+            sent.append(message['type'])
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/start-study/',
+            'extensions': {'http.response.early_hint': {}},
+        }
+        asyncio.run(EarlyHintsMiddleware(app)(scope, None, send))
+        self.assertEqual(sent, ['http.response.early_hint', 'http.response.start'])
+
+        sent.clear()
+        asyncio.run(EarlyHintsMiddleware(app)({**scope, 'extensions': {}}, None, send))
+        self.assertEqual(sent, ['http.response.start'])
+
+
+class WarmUpTest(TestCase):
+
+    def test_warm_up_runs_every_step(self):
+        cache.clear()
+        report = warm_up()
+
+        self.assertEqual(set(report), {'routes', 'templates', 'catalogue', 'courses', 'search'})
+        self.assertGreater(report['templates'][0], 0)
+        with self.assertNumQueries(0):
+            self.client.get('/api/courses/')
+
+    def test_primed_pages_match_real_responses(self):
+        seed_catalog(courses=3)
+        cache.clear()
+        warm_up()
+        primed = self.client.get('/api/courses/', {'limit': 50}).content
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/courses/').content, primed)
+
+
+class CourseTreeTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        data = seed_catalog(courses=2, chapters=2, lessons=3, students=1, enrollments=1)
+        self.course = data['courses'][0]
+        self.student = data['students'][0]
+        self.path = ('seed-category', 'seed-module', self.course.slug)
+
+    def test_loads_whole_course_in_three_queries(self):
+        with self.assertNumQueries(3):
+            trees = load_course_trees(Q(module__slug='seed-module'))
+
+        tree = trees[self.course.pk]
+        self.assertEqual([c.order for c in tree.chapters], [1, 2])
+        self.assertEqual(len(tree.lessons), 6)
+        lesson = tree.chapters[1].first_lesson
+        self.assertEqual(tree.previous_lesson(lesson), tree.chapters[0].lessons[-1])
+        self.assertEqual(lesson.url, Lesson.objects.get(pk=lesson.pk).get_absolute_url())
+
+    def test_cached_until_catalog_changes(self):
+        tree = course_trees.get(*self.path)
+        with self.assertNumQueries(0):
+            self.assertIs(course_trees.get(*self.path), tree)
+
+        Chapter.objects.filter(pk=tree.chapters[0].pk).get().save()
+        self.assertIsNot(course_trees.get(*self.path), tree)
+
+    def test_views_read_structure_from_tree(self):
+        self.client.force_login(self.student)
+        tree = course_trees.get(*self.path)
+        self.client.get('/admin/')  # instantané utilisateur en cache
+
+        with self.assertNumQueries(1):
+            response = self.client.get(tree.lessons[2].url)
+        self.assertEqual(response.context['next_chapter_lesson'], tree.lessons[3])
+
+        response = self.client.get(tree.url)
+        self.assertContains(response, tree.chapters[1].first_lesson.url)
+        response = self.client.get(reverse('dashboard_student'))
+        self.assertEqual(response.context['booked_courses'][0], tree)
+
+
+class OfflinePackageTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        data = seed_catalog(courses=1, chapters=2, lessons=2, students=2, enrollments=1)
+        self.course = data['courses'][0]
+        self.student, self.outsider = data['students']
+
+        lesson = Lesson.objects.filter(chapter__course=self.course).order_by('pk').first()
+        lesson.video_file.save("intro.mp4", ContentFile(b"video " * 5000), save=True)
+        self.url = reverse('course_package', args=[
+            self.course.module.category.slug, self.course.module.slug, self.course.slug
+        ])
+
+    def download(self, user, **headers):
+        self.client.force_login(user)
+        response = self.client.get(self.url, headers=headers)
+        return response, b''.join(response.streaming_content) if response.streaming else b''
+
+    def test_archive_opens_and_matches_course(self):
+        response, body = self.download(self.student)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        archive = zipfile.ZipFile(io.BytesIO(body))
+        self.assertIsNone(archive.testzip())
+        names = archive.namelist()
+        self.assertIn(f'{self.course.slug}/index.html', names)
+        self.assertEqual(archive.read(f'{self.course.slug}/videos/{VideoBlob.objects.get().name}'),
+                         b"video " * 5000)
+        self.assertEqual(sum(n.endswith('.html') for n in names), 1 + 4)
+
+    def test_range_resumes_download(self):
+        response, full = self.download(self.student)
+        etag = response['ETag']
+
+        response, part = self.download(self.student, Range='bytes=100-199', If_Range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(part, full[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(full)}')
+
+        response, _ = self.download(self.student, Range=f'bytes={len(full)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # If-Range périmé : l'archive complète est renvoyée
+        response, body = self.download(self.student, Range='bytes=0-9', If_Range='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, full)
+
+    def test_range_reuses_cached_layout(self):
+        response, full = self.download(self.student)
+
+        with mock.patch('core.offline.render_to_string') as render:
+            response, part = self.download(self.student, Range='bytes=100-199', If_Range=response['ETag'])
+        render.assert_not_called()
+        self.assertEqual(part, full[100:200])
+
+    def test_same_basename_in_two_folders(self):
+        lessons = Lesson.objects.filter(chapter__course=self.course).order_by('pk')
+        for lesson, folder in zip(lessons[1:3], ('2023/01/01', '2024/02/02')):
+            name = f'lessons/videos/{folder}/intro.mp4'
+            os.makedirs(os.path.dirname(video_storage.path(name)))
+            with open(video_storage.path(name), 'wb') as fp:
+                fp.write(folder.encode())
+            Lesson.objects.filter(pk=lesson.pk).update(video_file=name)
+
+        archive = zipfile.ZipFile(io.BytesIO(self.download(self.student)[1]))
+        for folder in ('2023/01/01', '2024/02/02'):
+            video = f'{self.course.slug}/videos/lessons/videos/{folder}/intro.mp4'
+            self.assertEqual(archive.read(video), folder.encode())
+
+    def test_missing_video_is_skipped(self):
+        os.remove(video_storage.path(VideoBlob.objects.get().name))
+
+        with self.assertLogs('core.offline', 'WARNING'):
+            response, body = self.download(self.student)
+        self.assertEqual(response.status_code, 200)
+        names = zipfile.ZipFile(io.BytesIO(body)).namelist()
+        self.assertFalse(any('/videos/' in n for n in names))
+
+    def test_not_enrolled_is_forbidden(self):
+        response, _ = self.download(self.outsider)
+        self.assertEqual(response.status_code, 403)
+
+    def test_zip64_records(self):
+        package = build_course_package(self.course)
+        layout = ZipLayout(package.entries, zip64_limit=64)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(layout.stream())))
+
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), [e.name.decode() for e in package.entries])
+
+
+class QueryBudgetTest(TestCase):
+    '''
+    Chaque vue de core/urls.py rendue sur deux catalogues de tailles
+    différentes : même nombre de requêtes aux deux échelles (pas de N+1),
+    égal au budget fixé ici, et un temps de rendu borné.
+    '''
+    SCALES = {
+        'small': dict(courses=2, chapters=2, lessons=2, students=3, enrollments=2),
+        'large': dict(courses=6, chapters=8, lessons=10, students=30, enrollments=25),
+    }
+    # vue -> nombre de requêtes, caches vides (session, utilisateur, arbres)
+    BUDGETS = {
+        'index': 0,
+        'category_list': 3,
+        'course_list': 6,
+        'chapter_list': 7,
+        'lesson_detail': 8,
+        'course_package': 7,
+        'create_course': 5,
+        'dashboard_control': 4,
+        'dashboard_teacher': 6,
+        'dashboard_student': 8,
+        'inbox': 5,
+        'snapshot_fragment': 5,
+        'register': 0,
+        'api_list': 1,
+        'api_detail': 1,
+        'api_catalog_export': 5,
+        'api_autocomplete': 3,
+        'lesson_video': 11,
+        'streaming_metrics': 4,
+        'signed_media': 0,
+        'not_found': 4,
+    }
+    MAX_RENDER_SECONDS = 1.0
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = {}
+        for scale, sizes in cls.SCALES.items():
+            data = seed_catalog(prefix=scale, **sizes)
+            student = data['students'][0]
+            # l'étudiant mesuré suit tous les cours de son échelle
+            Enrollment.objects.bulk_create(
+                [Enrollment(student=student, course=course) for course in data['courses']],
+                ignore_conflicts=True,
+            )
+            cls.data[scale] = data
+
+    def requests_for(self, scale):
+        return view_requests(self.data[scale], scale)
+
+    def measure(self, user, url):
+        with audit_cache():
+            self.client.logout()
+            if user:
+                self.client.force_login(user)
+            clear_caches()
+
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = self.client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+        self.assertLess(response.status_code, 500, url)
+        return len(queries), elapsed
+
+    def test_every_view_is_covered(self):
+        routes = {p.name for p in core_urls.extra_patterns + core_urls.profile_patterns
+                  + core_urls.api_patterns + core_urls.urlpatterns if getattr(p, 'name', None)}
+        self.assertLessEqual(routes, set(self.BUDGETS))
+
+    def test_query_counts_do_not_grow_with_data(self):
+        small, large = self.requests_for('small'), self.requests_for('large')
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(view=name):
+                small_count, _ = self.measure(*small[name])
+                large_count, elapsed = self.measure(*large[name])
+
+                self.assertEqual(small_count, large_count)
+                self.assertEqual(large_count, budget)
+                self.assertLess(elapsed, self.MAX_RENDER_SECONDS)
+
+
+class DenormalizedCounterTest(TestCase):
+
+    def setUp(self):
+        data = seed_catalog(courses=2, chapters=2, lessons=2, students=4, enrollments=2)
+        self.module = data['module']
+        self.course, self.other = data['courses']
+        self.students = data['students']
+        self.chapter = self.course.chapters.get(order=1)
+
+    def assertCounts(self, obj, **expected):
+        obj.refresh_from_db()
+        self.assertEqual({field: getattr(obj, field) for field in expected}, expected)
+
+    def test_seeded_counters(self):
+        self.assertCounts(self.course, lesson_count=4, enrollment_count=2)
+        self.assertCounts(self.chapter, lesson_count=2)
+        self.assertCounts(self.module, course_count=2)
+
+    def test_lessons_update_chapter_and_course(self):
+        lesson = Lesson.objects.create(
+            chapter=self.chapter, title="Bonus", content="...", order=9, video_duration=120
+        )
+        self.assertCounts(self.chapter, lesson_count=3, video_duration=120)
+        self.assertCounts(self.course, lesson_count=5, video_duration=120)
+
+        lesson.video_duration = 60
+        lesson.save()
+        self.assertCounts(self.course, video_duration=60)
+
+        lesson.delete()
+        self.assertCounts(self.chapter, lesson_count=2, video_duration=0)
+        self.assertCounts(self.course, lesson_count=4, video_duration=0)
+
+    def test_enrollments_and_published_courses(self):
+        enroll_cohort(TheUser.objects.filter(pk__in=[s.pk for s in self.students]), [self.course])
+        self.assertCounts(self.course, enrollment_count=4)
+        Enrollment.objects.filter(course=self.course).first().delete()
+        self.assertCounts(self.course, enrollment_count=3)
+
+        self.course.is_published = False
+        self.course.save()
+        self.assertCounts(self.module, course_count=1)
+        self.other.delete()
+        self.assertCounts(self.module, course_count=0)
+
+    def test_reconcile_fixes_drift(self):
+        Course.objects.filter(pk=self.course.pk).update(lesson_count=99, enrollment_count=0)
+        Chapter.objects.filter(pk=self.chapter.pk).update(video_duration=7)
+
+        self.assertEqual(reconcile_counters(dry_run=True)['course.lesson_count'], 1)
+        out = io.StringIO()
+        call_command('reconcile_counters', stdout=out)
+
+        self.assertIn("3 ligne(s) corrigée(s)", out.getvalue())
+        self.assertCounts(self.course, lesson_count=4, enrollment_count=2)
+        self.assertCounts(self.chapter, video_duration=0)
+        self.assertFalse(any(reconcile_counters(dry_run=True).values()))
+
+
+class FlakyBackend:
+    ''' échoue une fois au second lot, comme un serveur SMTP indisponible '''
+    delivered = []
+    failed = False
+
+    def deliver(self, event, recipients):
+        if len(FlakyBackend.delivered) >= 3 and not FlakyBackend.failed:
+            FlakyBackend.failed = True
+            raise ConnectionError("smtp")
+        FlakyBackend.delivered.extend(r.pk for r in recipients)
+
+
+@override_settings(JOBS_EAGER=True, NOTIFICATION_BATCH_SIZE=3)
+class NotificationFanOutTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        data = seed_catalog(courses=1, chapters=1, lessons=1, students=7, enrollments=7, published=False)
+        self.course = data['courses'][0]
+        self.students = data['students']
+        TheUser.objects.filter(pk=self.students[0].pk).update(email='a@example.com')
+
+    def publish(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.is_published = True
+            self.course.save()
+
+    def test_publish_fans_out_to_enrolled_students(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.publish()
+
+        self.assertEqual(Notification.objects.filter(kind=Notification.PUBLISHED).count(), 7)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(self.course.title, mail.outbox[0].subject)
+        # 7 inscrits par lots de 3 : requêtes par lot (livraison et progression
+        # de chaque backend), pas par apprenant
+        self.assertLess(len(queries), 40)
+
+        # republier un cours déjà publié ne renotifie pas
+        self.publish()
+        self.assertEqual(Notification.objects.count(), 7)
+
+    @override_settings(
+        JOBS_EAGER=False, JOBS_RETRY_DELAY=0,
+        NOTIFICATION_BACKENDS=['core.notifications.InboxBackend', 'core.tests.FlakyBackend'],
+    )
+    def test_retry_resumes_after_last_delivered_batch(self):
+        FlakyBackend.delivered, FlakyBackend.failed = [], False
+        self.publish()
+
+        with self.assertLogs('core.jobs', 'WARNING'):
+            run_pending(limit=1)
+        self.assertEqual(Notification.objects.count(), 6)
+        run_pending()
+
+        self.assertEqual(Notification.objects.count(), 7)
+        self.assertEqual(sorted(FlakyBackend.delivered), sorted(s.pk for s in self.students))
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertFalse(FanOutProgress.objects.exists())
+
+    def test_new_lesson_only_for_published_courses(self):
+        chapter = self.course.chapters.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Lesson.objects.create(chapter=chapter, title="Brouillon", content="...", order=5)
+        self.assertEqual(Notification.objects.count(), 0)
+
+        self.publish()
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(chapter=chapter, title="Nouvelle", content="...", order=6)
+
+        notification = self.students[3].notifications.get(kind=Notification.NEW_LESSON)
+        self.assertEqual(notification.lesson_id, lesson.pk)
+        self.assertEqual(notification.url, lesson.get_absolute_url())
+
+    def test_inbox_marks_notifications_read(self):
+        self.publish()
+        self.client.force_login(self.students[0])
+
+        response = self.client.get(reverse('inbox'))
+        self.assertContains(response, "nouveau")
+        self.assertFalse(self.students[0].notifications.filter(read_at__isnull=True).exists())
+
+
+class SnapshotPublishingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.root = root
+        override = override_settings(SNAPSHOT_PUBLISHING=True, JOBS_EAGER=True, SNAPSHOT_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        data = seed_catalog(courses=1, chapters=2, lessons=2, students=2, enrollments=0)
+        self.course = data['courses'][0]
+        self.teacher = data['teacher']
+        self.student, self.outsider = data['students']
+        self.lesson = Lesson.objects.filter(chapter__course=self.course).order_by('pk').first()
+        self.tree = course_trees.get('seed-category', 'seed-module', self.course.slug)
+
+    def get(self, url, user=None):
+        if user:
+            self.client.force_login(user)
+        response = self.client.get(url)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        # page pré-rendue : FileResponse ; rendu dynamique : réponse ordinaire
+        return response, body.decode(), response.streaming
+
+    def test_build_writes_outline_and_lessons(self):
+        build_snapshot(self.course.pk)
+
+        response, body, prerendered = self.get(self.tree.url, self.student)
+        self.assertTrue(prerendered)
+        self.assertIn(self.tree.chapters[1].first_lesson.url, body)
+        self.assertIn(reverse('snapshot_fragment'), body)
+        for lesson in self.tree.lessons:
+            response, body, prerendered = self.get(lesson.url)
+            self.assertTrue(prerendered)
+            self.assertIn(lesson.title, body)
+            self.assertIn(f"{reverse('snapshot_fragment')}?lesson={lesson.pk}", body)
+
+    def test_prerendered_outline_keeps_view_checks(self):
+        build_snapshot(self.course.pk)
+
+        self.assertEqual(self.client.get(self.tree.url).status_code, 302)
+        self.assertEqual(self.get(self.tree.url, self.teacher)[0].status_code, 403)
+        self.assertTrue(self.get(self.tree.url, self.student)[2])
+        self.assertTrue(Enrollment.objects.filter(student=self.student, course=self.course).exists())
+
+    @override_settings(SNAPSHOT_ACCEL_REDIRECT='/internal-snapshots/')
+    def test_front_server_sends_the_page(self):
+        version = build_snapshot(self.course.pk)
+
+        response = self.get(self.tree.url, self.student)[0]
+        self.assertEqual(response.content, b'')
+        self.assertTrue(response['X-Accel-Redirect'].startswith(f'/internal-snapshots/builds/{self.course.pk}/{version}/'))
+
+    def test_edit_falls_back_then_republishes(self):
+        first = build_snapshot(self.course.pk)
+        url = self.lesson.get_absolute_url()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson.content = "contenu mis à jour"
+            self.lesson.save()
+            # page périmée retirée avant la fin de la requête : rendu dynamique
+            self.assertFalse(self.get(url)[2])
+
+        response, body, prerendered = self.get(url)
+        self.assertTrue(prerendered)
+        self.assertIn("contenu mis à jour", body)
+        self.assertNotEqual(build_snapshot(self.course.pk), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.is_published = False
+            self.course.save()
+        self.assertFalse(os.path.lexists(os.path.join(self.root, 'builds', str(self.course.pk))))
+
+    @override_settings(JOBS_EAGER=False)
+    def test_rebuilds_of_a_course_are_coalesced(self):
+        for lesson in Lesson.objects.filter(chapter__course=self.course):
+            lesson.content = "modifié"
+            lesson.save()
+
+        self.assertEqual(Job.objects.filter(name='core.snapshots.build_snapshot', args=[self.course.pk]).count(), 1)
+
+    def test_fragment_signs_video_for_enrolled_students(self):
+        Lesson.objects.filter(pk=self.lesson.pk).update(video_file='lessons/blobs/ab/cd/abcd.mp4')
+        Enrollment.objects.create(student=self.student, course=self.course)
+        url = f"{reverse('snapshot_fragment')}?lesson={self.lesson.pk}"
+
+        data = self.get(url, self.student)[0].json()
+        self.assertIn(self.student.username, data['user_menu'])
+        self.assertTrue(data['video_url'].startswith('/protected-media/lessons/blobs/ab/cd/abcd.mp4?'))
+        self.assertIn('no-store', self.client.get(url)['Cache-Control'])
+
+        self.assertIsNone(self.get(url, self.outsider)[0].json()['video_url'])
+        self.client.logout()
+        self.assertNotIn('video_url', self.client.get(url).json())
+
+
+JOB_CALLS = []
+
+
+def record_job(value, suffix=''):
+    JOB_CALLS.append(f'{value}{suffix}')
+
+
+def failing_job():
+    raise RuntimeError("boom")
+
+
+@override_settings(JOBS_RETRY_DELAY=0)
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def test_jobs_run_by_priority_and_schedule(self):
+        enqueue(record_job, 'low')
+        enqueue(record_job, 'high', suffix='!', priority=10)
+        later = enqueue(record_job, 'later', delay=timedelta(hours=1))
+
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(JOB_CALLS, ['high!', 'low'])
+        later.refresh_from_db()
+        self.assertEqual(later.status, Job.QUEUED)
+        self.assertEqual(Job.objects.filter(status=Job.DONE, duration__isnull=False).count(), 2)
+
+    def test_claim_is_exclusive(self):
+        enqueue(record_job, 'once')
+        job = claim('worker-a')
+
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(claim('worker-b'))
+
+    def test_failing_job_is_retried_then_dead_lettered(self):
+        enqueue(failing_job, max_attempts=2)
+
+        with self.assertLogs('core.jobs', 'WARNING'):
+            run_pending(limit=1)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        with self.assertLogs('core.jobs', 'ERROR'):
+            run_pending(limit=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DEAD)
+        self.assertIn("RuntimeError: boom", job.last_error)
+
+        admin_user = TheUser.objects.create_superuser('root', 'root@example.com', 'x')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:core_deadjob_changelist'))
+        self.assertContains(response, "RuntimeError: boom")
+        self.assertEqual(self.client.get(reverse('admin:core_job_changelist')).status_code, 200)
+
+    def test_stale_jobs_count_as_failed_attempts(self):
+        enqueue(record_job, 'stuck', max_attempts=2)
+        job = claim('crashed')
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale(timeout=60), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.QUEUED, 1, ''))
+        self.assertIn("worker arrêté", job.last_error)
+
+        # second essai interrompu aussi : dernier essai, la tâche est abandonnée
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        claim('crashed-again')
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(requeue_stale(timeout=60), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DEAD, 2))
+        self.assertEqual(JOB_CALLS, [])
+
+    def test_notifications_go_through_the_queue(self):
+        data = seed_catalog(courses=1, chapters=1, lessons=1, students=3, enrollments=3, published=False)
+        course = data['courses'][0]
+        course.is_published = True
+        course.save()
+
+        job = Job.objects.get(name='core.notifications.fan_out')
+        self.assertEqual(job.kwargs, {'course_id': course.pk, 'lesson_id': None, 'key': job.kwargs['key']})
+        run_pending()
+        self.assertEqual(Notification.objects.count(), 3)
+
+
+class RunWorkersCommandTest(TransactionTestCase):
+
+    def test_burst_pool_drains_queue(self):
+        JOB_CALLS.clear()
+        for i in range(6):
+            enqueue(record_job, i)
+
+        out = io.StringIO()
+        call_command('run_workers', '--burst', '--threads', '2', stdout=out)
+
+        self.assertEqual(sorted(JOB_CALLS), [str(i) for i in range(6)])
+        self.assertIn("6 tâche(s) exécutée(s)", out.getvalue())
+        self.assertIn("core.tests.record_job : 6 tâche(s)", out.getvalue())
+
+    def test_worker_survives_database_errors(self):
+        JOB_CALLS.clear()
+        enqueue(record_job, 'after')
+        errors = [OperationalError("database is locked")]
+
+        def flaky_claim(worker_id):
+            if errors:
+                raise errors.pop()
+            return claim(worker_id)
+
+        pool = WorkerPool(threads=1, poll_interval=0.01, burst=True)
+        with mock.patch('core.jobs.claim', flaky_claim), self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(pool.run(), 1)
+        self.assertEqual(JOB_CALLS, ['after'])
+
+
+class PrefixIndexTest(TestCase):
+
+    def setUp(self):
+        data = seed_catalog(courses=2, chapters=1, lessons=2, students=1, enrollments=0)
+        self.course, self.other = data['courses']
+        self.lesson = Lesson.objects.filter(chapter__course=self.course).order_by('order').first()
+        search_index.rebuild()
+
+    def titles(self, query, **kwargs):
+        return [result['title'] for result in search_index.search(query, **kwargs)]
+
+    def test_normalize_strips_accents_and_case(self):
+        self.assertEqual(normalize("  Éléments de  CÁLCULO (1) "), 'elements de calculo 1')
+
+    def test_prefix_of_any_word_matches_without_accents(self):
+        self.course.title = "Introduction à l'Économie"
+        self.course.save()
+
+        self.assertEqual(self.titles('econ'), ["Introduction à l'Économie"])
+        self.assertEqual(self.titles('INTRO'), ["Introduction à l'Économie"])
+        self.assertEqual(self.titles('a l eco'), ["Introduction à l'Économie"])
+        self.assertEqual(self.titles('xyz'), [])
+
+    def test_courses_rank_before_lessons(self):
+        self.lesson.title = 'seed lesson'
+        self.lesson.save()
+        results = search_index.search('seed', limit=5)
+        self.assertEqual([r['type'] for r in results], ['course', 'course', 'module', 'lesson'])
+        self.assertEqual(results[0]['url'], reverse('chapter_list', args=[
+            'seed-category', 'seed-module', self.course.slug,
+        ]))
+
+    def test_signals_patch_the_index_without_rebuild(self):
+        self.lesson.title = 'Dérivées partielles'
+        self.lesson.save()
+        self.assertEqual(self.titles('derivee'), ['Dérivées partielles'])
+
+        self.course.is_published = False
+        self.course.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('derivee'), [])
+            self.assertEqual(self.titles('seed course'), [self.other.title])
+
+        self.course.is_published = True
+        self.course.save()
+        self.assertEqual(self.titles('derivee'), ['Dérivées partielles'])
+
+        self.lesson.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('derivee'), [])
+
+    def test_patch_does_not_swallow_another_process_bump(self):
+        bump_catalog_version()
+        # un autre process modifie une leçon et bumpe entre-temps
+        other = Lesson.objects.filter(chapter__course=self.other).first()
+        Lesson.objects.filter(pk=other.pk).update(title='Intégrales')
+        cache.set(CATALOG_VERSION_KEY, 1, None)
+
+        search_index.lesson_changed(self.lesson.pk)
+        self.assertEqual(self.titles('integrale'), ['Intégrales'])
+
+    def test_unbuilt_index_costs_no_query(self):
+        search_index.invalidate()
+        with self.assertNumQueries(0):
+            search_index.course_changed(self.course.pk)
+            search_index.lesson_changed(self.lesson.pk)
+            search_index.module_changed(self.course.module_id)
+
+    def test_chapter_change_rebuilds_on_next_search(self):
+        chapter = self.lesson.chapter
+        chapter.slug = 'renamed'
+        chapter.save()
+
+        result = search_index.search(self.lesson.title, limit=1)[0]
+        self.assertIn('/renamed/', result['url'])
+
+    def test_size_is_bounded(self):
+        index = PrefixIndex(max_entries=3)
+        self.assertEqual(index.rebuild(), 3)
+        # modules et cours passent avant les leçons
+        self.assertEqual({r['type'] for r in index.search('seed', limit=10)}, {'module', 'course'})
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('api_autocomplete'), {'q': 'Seed cou', 'limit': 1})
+        self.assertEqual(response.json()['results'], [{
+            'type': 'course', 'title': self.course.title,
+            'url': reverse('chapter_list', args=['seed-category', 'seed-module', self.course.slug]),
+        }])
+        self.assertEqual(self.client.get(reverse('api_autocomplete'), {'q': 't'}).json()['results'], [])
+        self.assertEqual(self.client.get(reverse('api_autocomplete'), {'q': 'te', 'limit': 'x'}).status_code, 400)
+
+
+class VideoStreamingTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, VIDEO_CHUNK_SIZE=1000)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        course_trees.clear()
+
+        data = seed_catalog(courses=1, chapters=1, lessons=2, students=2, enrollments=2)
+        self.student, self.other = data['students']
+        self.lesson = Lesson.objects.filter(chapter__course=data['courses'][0]).order_by('order').first()
+        self.video = bytes(range(256)) * 20
+        self.lesson.video_file.save("intro.mp4", ContentFile(self.video), save=True)
+        self.url = f"{course_trees.many([self.lesson.chapter.course_id])[0].lesson(self.lesson.chapter.slug, self.lesson.slug).url}video/"
+
+        self.limiter = StreamLimiter(
+            user_rate=0, user_burst=1, global_rate=0, global_burst=1, streams_per_user=1, max_streams=10
+        )
+        patcher = mock.patch('core.views.video_limiter', self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_bucket_queues_reservations_in_order(self):
+        bucket = TokenBucket(rate=1000, burst=1000)
+        bucket.updated = 0
+        self.assertEqual(bucket.reserve(1000, now=0), 0)
+        # chaque demande passe après celles déjà réservées
+        self.assertEqual(bucket.reserve(500, now=0), 0.5)
+        self.assertEqual(bucket.reserve(500, now=0), 1.0)
+        self.assertEqual(bucket.reserve(500, now=1.0), 0.5)
+        self.assertEqual(TokenBucket(rate=0, burst=0).reserve(10 ** 9), 0)
+
+    def test_stream_cap_per_user_and_release(self):
+        self.limiter.open(self.student.pk)
+        with self.assertRaises(TooManyStreams):
+            self.limiter.open(self.student.pk)
+        self.limiter.open(self.other.pk)
+        self.limiter.close(self.student.pk)
+        self.limiter.open(self.student.pk)
+
+        metrics = self.limiter.metrics.snapshot()
+        self.assertEqual((metrics['streams_started'], metrics['streams_rejected'], metrics['active_streams']), (3, 1, 2))
+
+    def test_range_request_streams_in_chunks(self):
+        self.client.force_login(self.student)
+        response = self.client.get(self.url, headers={'Range': 'bytes=100-2599'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-2599/{len(self.video)}')
+        chunks = list(response.streaming_content)
+        self.assertEqual([len(c) for c in chunks], [1000, 1000, 500])
+        self.assertEqual(b''.join(chunks), self.video[100:2600])
+        self.assertEqual(self.limiter.metrics.snapshot()['bytes_sent'], 2500)
+
+    def test_asgi_request_gets_async_stream(self):
+        async def fetch():
+            client = AsyncClient()
+            await client.aforce_login(self.student)
+            response = await client.get(self.url, headers={'Range': 'bytes=0-1499'})
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+
+        response, body = async_to_sync(fetch)()
+        self.assertTrue(response.is_async)
+        self.assertEqual(body, self.video[:1500])
+        self.assertEqual(self.limiter.metrics.snapshot()['active_streams'], 0)
+
+    def test_open_stream_blocks_a_second_one_until_closed(self):
+        self.client.force_login(self.student)
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+
+        second = self.client.get(self.url)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second['Retry-After'], '5')
+
+        # réponse fermée sans être lue : la place est rendue
+        first.close()
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.video)
+
+    def test_throttled_bytes_are_counted(self):
+        self.limiter.user_rate, self.limiter.user_burst = 10 ** 6, 1000
+        self.client.force_login(self.student)
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-2999'})
+        b''.join(response.streaming_content)
+
+        metrics = self.limiter.metrics.snapshot()
+        self.assertEqual(metrics['bytes_throttled'], 2000)
+        self.assertGreater(metrics['throttle_seconds'], 0)
+
+    def test_access(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(self.url.replace(self.lesson.slug, 'nope')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('streaming_metrics')).status_code, 302)
+
+        self.student.is_staff = True
+        self.student.save()
+        self.assertIn('bytes_throttled', self.client.get(reverse('streaming_metrics')).json())
+
+
+class SQLitePragmaTest(TestCase):
+
+    def test_production_pragmas_on_each_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+
+class QueryAuditTest(TestCase):
+
+    def test_plan_problems_and_suggested_index(self):
+        plan = ['SEARCH core_course USING INDEX core_course_module_id (module_id=?)', 'USE TEMP B-TREE FOR ORDER BY']
+        sql = ('SELECT "core_course"."id" FROM "core_course" WHERE ("core_course"."is_published" '
+               'AND "core_course"."module_id" = 1) ORDER BY "core_course"."title" ASC LIMIT 10')
+        found = problems(plan)
+
+        self.assertEqual([kind for kind, _, _ in found], ['sort'])
+        self.assertEqual(suggest(sql, found), [(Course, ('module', 'is_published', 'title'))])
+        self.assertEqual(problems(['SCAN core_lesson', 'SCAN core_lesson USING INDEX x']), [
+            ('scan', 'core_lesson', 'SCAN core_lesson'),
+        ])
+
+    def test_no_suggestion_for_unique_lookups_or_booleans(self):
+        unique = 'SELECT * FROM "core_course" WHERE "core_course"."slug" = \'a\' ORDER BY "core_course"."id" ASC'
+        flag = 'SELECT * FROM "core_course" WHERE "core_course"."is_published"'
+        self.assertEqual(suggest(unique, [('sort', None, '')]), [])
+        self.assertEqual(suggest(flag, [('scan', 'core_course', '')]), [])
+
+    def test_every_view_is_served_by_indexes(self):
+        data = seed_catalog(courses=3, chapters=2, lessons=2, students=5, enrollments=3, prefix='audit')
+        with self.assertLogs('django.request', 'WARNING'):
+            counts, _, advice = audit(view_requests(data, 'audit'))
+
+        self.assertEqual(set(counts), set(QueryBudgetTest.BUDGETS))
+        self.assertEqual(advice, {})
+
+    def test_audit_leaves_the_default_cache_alone(self):
+        data = seed_catalog(courses=1, chapters=1, lessons=1, students=1, prefix='audit')
+        cache.clear()
+        cache.set('shared-key', 'kept')
+        audit({'index': (None, reverse('index')), 'chapter_list': view_requests(data, 'audit')['chapter_list']})
+
+        self.assertEqual(cache.get('shared-key'), 'kept')
+        self.assertIsNone(cache.get(CATALOG_VERSION_KEY))
+
+
+class SignedMediaTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, SIGNED_MEDIA_KEY='k' * 32)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        course_trees.clear()
+
+        data = seed_catalog(courses=1, chapters=1, lessons=1, students=2, enrollments=1)
+        self.student, self.outsider = data['students']
+        self.lesson = Lesson.objects.get(chapter__course=data['courses'][0])
+        self.video = b'0123456789' * 100
+        self.lesson.video_file.save("intro.mp4", ContentFile(self.video), save=True)
+        self.name = self.lesson.video_file.name
+        self.page = course_trees.many([data['courses'][0].pk])[0].lessons[0].url
+
+        self.limiter = StreamLimiter(
+            user_rate=0, user_burst=1, global_rate=0, global_burst=1, streams_per_user=1, max_streams=10
+        )
+        patcher = mock.patch('core.views.video_limiter', self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_signature_binds_path_user_and_expiry(self):
+        expires = expiry(600, 3600, now=1000)
+        self.assertEqual(expires, 3600 + 600)
+        self.assertEqual(expiry(600, 3600, now=3599), expires)
+
+        url = signed_url(self.name, 7, now=1000)
+        params = dict(p.split('=') for p in url.split('?')[1].split('&'))
+        self.assertTrue(verify('k' * 32, self.name, '7', params['e'], params['s'], now=1000))
+        self.assertFalse(verify('k' * 32, self.name, '8', params['e'], params['s'], now=1000))
+        self.assertFalse(verify('k' * 32, 'lessons/other.mp4', '7', params['e'], params['s'], now=1000))
+        self.assertFalse(verify('k' * 32, self.name, '7', params['e'], params['s'], now=int(params['e']) + 1))
+        self.assertFalse(verify('other', self.name, '7', params['e'], params['s'], now=1000))
+
+    def test_serve_range_and_if_range(self):
+        etag = '"abc.mp4"'
+        self.assertEqual(serve_range('bytes=10-19', None, 100, etag), (206, 10, 19, {
+            'Content-Length': '10', 'Accept-Ranges': 'bytes', 'ETag': etag, 'Content-Range': 'bytes 10-19/100',
+        }))
+        self.assertEqual(serve_range('bytes=10-19', etag, 100, etag)[0], 206)
+        self.assertEqual(serve_range(None, None, 100, etag)[:3], (200, 0, 99))
+        self.assertEqual(serve_range('bytes=200-', None, 100, etag), (416, None, None, {'Content-Range': 'bytes */100'}))
+        # If-Range périmé : Range ignoré, même hors limites
+        self.assertEqual(serve_range('bytes=10-19', '"old.mp4"', 100, etag)[:3], (200, 0, 99))
+        self.assertEqual(serve_range('bytes=200-', '"old.mp4"', 100, etag)[:3], (200, 0, 99))
+
+    def test_lesson_page_signs_video_for_enrolled_students_only(self):
+        self.client.force_login(self.student)
+        url = self.client.get(self.page).context['signed_video_url']
+        self.assertTrue(url.startswith(f'/protected-media/{self.name}?u={self.student.pk}&'))
+
+        self.client.force_login(self.outsider)
+        response = self.client.get(self.page)
+        self.assertNotIn('signed_video_url', response.context)
+        # ni URL signée ni route non signée pour un non-inscrit
+        self.assertEqual(self.client.get(f'{self.page}video/').status_code, 403)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(f'{self.page}video/').status_code, 200)
+
+    def test_django_fallback_serves_ranges_without_queries(self):
+        url = signed_url(self.name, self.student.pk)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, headers={'Range': 'bytes=10-19'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), self.video[10:20])
+            self.assertTrue(response['Cache-Control'].startswith('public, max-age='))
+            self.assertEqual(self.client.get(url.replace('s=', 's=x')).status_code, 403)
+
+    def test_second_signed_stream_of_a_user_is_refused(self):
+        url = signed_url(self.name, self.student.pk)
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+
+        second = self.client.get(url)
+        self.assertEqual((second.status_code, second['Retry-After']), (429, '5'))
+        # un autre utilisateur a sa propre place
+        self.assertEqual(self.client.get(signed_url(self.name, self.outsider.pk)).status_code, 200)
+
+        first.close()
+        self.assertEqual(b''.join(self.client.get(url).streaming_content), self.video)
+        self.assertEqual(self.limiter.metrics.snapshot()['streams_rejected'], 1)
+
+    def asgi(self, app, path, headers=()):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        path, _, query = path.partition('?')
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(),
+                 'headers': [(k.encode(), v.encode()) for k, v in headers]}
+        asyncio.run(app(scope, None, send))
+        return sent[0]['status'], dict(sent[0]['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+    def test_standalone_asgi_app(self):
+        app = SignedMediaApp(self.media_root, 'k' * 32, chunk_size=300)
+        url = signed_url(self.name, self.student.pk)
+
+        status, headers, body = self.asgi(app, url)
+        self.assertEqual((status, body), (200, self.video))
+        self.assertEqual(headers[b'content-type'], b'video/mp4')
+        expires = int(url.rsplit('e=', 1)[1].split('&')[0])
+        max_age = int(headers[b'cache-control'].decode().removeprefix('public, max-age='))
+        self.assertTrue(0 < max_age <= expires - int(time.time()))
+
+        status, headers, body = self.asgi(app, url, [('range', 'bytes=-5')])
+        self.assertEqual((status, body, headers[b'content-range']), (206, self.video[-5:], b'bytes 995-999/1000'))
+
+        self.assertEqual(self.asgi(app, url.replace(str(self.student.pk), '999', 1))[0], 403)
+        self.assertEqual(self.asgi(app, '/protected-media/../secret?u=1&e=1&s=x')[0], 404)
+
+        accel = SignedMediaApp(self.media_root, 'k' * 32, accel_redirect='/internal-media/')
+        status, headers, body = self.asgi(accel, url)
+        self.assertEqual((status, body), (200, b''))
+        self.assertEqual(headers[b'x-accel-redirect'], f'/internal-media/{self.name}'.encode())
+
+    def test_standalone_asgi_app_limits_streams_per_signed_user(self):
+        limiter = StreamLimiter(
+            user_rate=0, user_burst=1, global_rate=0, global_burst=1, streams_per_user=1, max_streams=2
+        )
+        app = SignedMediaApp(self.media_root, 'k' * 32, chunk_size=300, limiter=limiter)
+        url = signed_url(self.name, self.student.pk)
+
+        # flux déjà ouvert pour cet utilisateur : le second est refusé
+        limiter.open(self.student.pk)
+        status, headers, _ = self.asgi(app, url)
+        self.assertEqual((status, headers[b'retry-after']), (429, b'5'))
+
+        # limite globale : deux flux ouverts en tout
+        limiter.open(self.outsider.pk)
+        self.assertEqual(self.asgi(app, signed_url(self.name, 999))[0], 429)
+
+        limiter.close(self.student.pk)
+        limiter.close(self.outsider.pk)
+        self.assertEqual(self.asgi(app, url)[:3:2], (200, self.video))
+        self.assertEqual(limiter.metrics.snapshot()['active_streams'], 0)
+        self.assertEqual(limiter.metrics.snapshot()['bytes_sent'], len(self.video))
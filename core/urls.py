@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path, include
-from . import views
+from . import api, views
 
 extra_patterns = [
     path('', views.CategoryListView.as_view(), name='category_list'),
@@ -7,12 +8,29 @@ extra_patterns = [
     path('<slug:category_slug>/<slug:module_slug>/courses/<slug:course_slug>/chapters/', views.ChapterListView.as_view(), name='chapter_list'),
     path('<slug:category_slug>/<slug:module_slug>/courses/<slug:course_slug>/<slug:chapter_slug>/<slug:lesson_slug>/', 
         views.LessonDetailView.as_view(), name='lesson_detail'),
+    path('<slug:category_slug>/<slug:module_slug>/courses/<slug:course_slug>/<slug:chapter_slug>/<slug:lesson_slug>/video/',
+        views.lesson_video, name='lesson_video'),
+    path('<slug:category_slug>/<slug:module_slug>/courses/<slug:course_slug>/offline.zip',
+        views.course_package, name='course_package'),
 ]
 
 profile_patterns = [
     path('', views.dashboard_view, name='dashboard_control'),
     path('teacher/', views.dashboard_teacher_view, name='dashboard_teacher'),
-    path('student/', views.dashboard_student_view, name='dashboard_student')
+    path('student/', views.dashboard_student_view, name='dashboard_student'),
+    path('inbox/', views.inbox_view, name='inbox'),
+    path('streams/', views.streaming_metrics, name='streaming_metrics'),
+]
+
+snapshot_patterns = [
+    path('user/', views.snapshot_fragment, name='snapshot_fragment'),
+]
+
+api_patterns = [
+    path('catalog/export/', api.catalog_export, name='api_catalog_export'),
+    path('autocomplete/', api.autocomplete, name='api_autocomplete'),
+    path('<str:resource>/', api.resource_list, name='api_list'),
+    path('<str:resource>/<slug:slug>/', api.resource_detail, name='api_detail'),
 ]
 
 urlpatterns = [
@@ -20,6 +38,10 @@ urlpatterns = [
     path('start-study/', include(extra_patterns)),
     path('create-course/', views.CourseCreateView.as_view(), name='create_course'),
     path('accounts/profile/', include(profile_patterns)),
+    path('api/', include(api_patterns)),
+    path('fragments/', include(snapshot_patterns)),
+    # repli de core.media_app quand le serveur ASGI ou le frontal ne l'intercepte pas (runserver, WSGI)
+    path(f"{settings.SIGNED_MEDIA_URL.lstrip('/')}<path:path>", views.signed_media, name='signed_media'),
 
     # auth
     path('account/register/', views.RegisterView.as_view(), name='register'),
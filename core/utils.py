@@ -1,6 +1,19 @@
-from django.db.models import Model, DateTimeField, SlugField
+import re
+import unicodedata
+
+from django.db.models import Model, CharField, DateTimeField, SlugField
 from django.utils.text import slugify
 
+_separators = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    ''' "Éléments de Cálculo" -> "elements de calculo" '''
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    return _separators.sub(' ', text).strip()
+
+
 class BaseTimeStamp(Model):
     created_at = DateTimeField(auto_now_add=True)
     updated_at = DateTimeField(auto_now_add=True)
@@ -27,3 +40,20 @@ class SlugBaseModel(Model):
     class Meta:
         abstract = True
 
+class SearchKeyModel(Model):
+    '''
+    search_key : le champ `search_source` normalisé (minuscules, sans
+    accents), indexé pour la recherche par préfixe de l'admin.
+    '''
+    search_source = 'title'
+    search_key = CharField(max_length=150, blank=True, default='', editable=False)
+
+    def save(self, *args, **kwargs):
+        self.search_key = normalize(getattr(self, self.search_source))[:150]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.search_source in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_key'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
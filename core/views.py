@@ -1,9 +1,14 @@
+import mimetypes
+import os
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.models import Group
 from django.core.paginator import Paginator
 from django.contrib.auth import login
-from django.contrib.auth.decorators import login_required
-from django.contrib.auth.views import LoginView
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.views import LoginView, redirect_to_login
 from django.contrib import messages
 from django.urls import reverse_lazy
 from django.core.exceptions import PermissionDenied
@@ -11,13 +16,26 @@ from django.views.generic import (
     TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 )
 from .models import (
-    TheUser, Category, Module, Course, Chapter, Lesson, Enrollment
+    TheUser, Category, Module, Course, Chapter, Lesson, Enrollment, Notification
 )
 
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from .forms import (
     CourseCreateForm, RegisterForm, LoginForm
 )
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.views.decorators.cache import never_cache
+from django.utils import timezone
+from .course_tree import course_trees
+from .streaming import TooManyStreams, video_limiter
+from .storage import video_storage
+from .signed_media import clean_path, serve_range, signed_url, verify_query
+from .early_hints import asset_links
+from .offline import cached_course_package
+from .snapshots import snapshot_response
+from .roster import role_group
 # Create your views here.
 
 class IndexView(TemplateView):
@@ -40,7 +58,7 @@ class CourseListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         self.module = get_object_or_404(
-            Module, 
+            Module.objects.select_related('category'),
             slug=self.kwargs['module_slug'],
             category__slug=self.kwargs['category_slug']
         )
@@ -51,22 +69,25 @@ class CourseListView(LoginRequiredMixin, ListView):
         context['module'] = self.module 
         return context
 
+def enroll_on_visit(user, course_id):
+    # déjà inscrit : rien à écrire (enrolled_course_ids vient du cache)
+    if course_id not in user.enrolled_course_ids:
+        Enrollment.objects.get_or_create(
+            student=user,
+            course_id=course_id
+        )
+
 class ChapterListView(LoginRequiredMixin, ListView):
-    model = Chapter
     template_name = 'core/list/chapter_list.html'
     context_object_name = 'chapters'
 
     def get_queryset(self):
-        self.course = get_object_or_404(
-            Course,
-            slug=self.kwargs['course_slug'],
-            module__slug=self.kwargs['module_slug'],
-            module__category__slug=self.kwargs['category_slug']
+        self.course = course_trees.get(
+            self.kwargs['category_slug'], self.kwargs['module_slug'], self.kwargs['course_slug']
         )
-
-        return Chapter.objects.filter(course=self.course).prefetch_related(
-            'lessons__chapter__course__module__category'
-        ).order_by('order')
+        if self.course is None:
+            raise Http404
+        return self.course.chapters
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -74,72 +95,67 @@ class ChapterListView(LoginRequiredMixin, ListView):
 
         user = self.request.user
         if user.is_authenticated and user.is_student:
-            Enrollment.objects.get_or_create(
-                student=user,
-                course=self.course
-            )
+            enroll_on_visit(user, self.course.pk)
         else:
             raise PermissionDenied
 
         return context
+
+    def render_to_response(self, context, **response_kwargs):
+        # droits vérifiés et inscription faite : page pré-rendue si elle existe
+        return snapshot_response(self.course, self.course.url) or super().render_to_response(context, **response_kwargs)
     
+def can_watch(user, course_id, teacher_id):
+    ''' vidéos d'un cours : inscrits, enseignant du cours et staff '''
+    return user.is_authenticated and (
+        course_id in user.enrolled_course_ids or user.pk == teacher_id or user.is_staff
+    )
+
+def signed_video_url(user, course_id, teacher_id, video_name):
+    ''' URL signée, servie sans Django, si l'utilisateur peut voir la vidéo ; sinon None '''
+    if video_name and can_watch(user, course_id, teacher_id):
+        return signed_url(video_name, user.pk)
+    return None
+
 class LessonDetailView(DetailView):
-    model = Lesson
     template_name = 'core/detail/current_lesson_detail.html'
     context_object_name = 'current_lesson'
-    slug_url_kwarg = 'lesson_slug'
 
-    def get_queryset(self):
-        return (
-            Lesson.objects
-            .select_related(
-                'chapter__course__module__category'
-            )
-            .filter(
-                slug=self.kwargs['lesson_slug'],
-                chapter__slug=self.kwargs['chapter_slug'],
-                # Correction de la chaîne ici : course -> module -> slug
-                chapter__course__module__slug=self.kwargs['module_slug'],
-                chapter__course__slug=self.kwargs['course_slug'],
-                # Correction de la chaîne ici : course -> module -> category -> slug
-                chapter__course__module__category__slug=self.kwargs['category_slug'],
-            )
+    def get_object(self, queryset=None):
+        # la structure du cours vient de l'arbre en mémoire ; seule la leçon est lue
+        self.course = course_trees.get(
+            self.kwargs['category_slug'], self.kwargs['module_slug'], self.kwargs['course_slug']
         )
+        self.node = self.course and self.course.lesson(
+            self.kwargs['chapter_slug'], self.kwargs['lesson_slug']
+        )
+        if not self.node:
+            raise Http404
+        return get_object_or_404(Lesson, pk=self.node.pk)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        current_lesson = self.object
-        chapter = current_lesson.chapter
-        course = chapter.course 
-
-        # OPTIMISATION ICI : On ajoute select_related pour le sommaire
-        context['all_lessons'] = Lesson.objects.filter(chapter=chapter).select_related(
-            'chapter__course__module__category'
-        ).order_by('order')
-
-        # Navigation (C'est déjà assez léger ici)
-        context['previous_lesson'] = Lesson.objects.filter(
-            chapter=chapter, order__lt=current_lesson.order
-        ).order_by('-order').first()
-
-        next_lesson = Lesson.objects.filter(
-            chapter=chapter, order__gt=current_lesson.order
-        ).order_by('order').first()
-        context['next_lesson'] = next_lesson
-
-        if not next_lesson:
-            next_chapter = Chapter.objects.filter(
-                course=course, order__gt=chapter.order
-            ).order_by('order').first()
-
-            if next_chapter:
-                # OPTIMISATION ICI : select_related pour le lien du chapitre suivant
-                context['next_chapter_lesson'] = Lesson.objects.filter(
-                    chapter=next_chapter
-                ).select_related('chapter__course__module__category').order_by('order').first()
-                
+        context.update(self.course.navigation(self.node))
+
+        video_url = signed_video_url(
+            self.request.user, self.course.pk, self.course.teacher_id, self.object.video_file.name
+        )
+        if video_url:
+            context['signed_video_url'] = video_url
         return context
 
+    def render_to_response(self, context, **response_kwargs):
+        # page pré-rendue : l'URL signée de la vidéo vient ensuite du fragment
+        response = snapshot_response(self.course, self.node.url) or super().render_to_response(context, **response_kwargs)
+
+        # le navigateur charge le CSS tout de suite et la leçon suivante en fond
+        links = asset_links()
+        following = context.get('next_lesson') or context.get('next_chapter_lesson')
+        if following:
+            links.append(f'<{following.url}>; rel=prefetch; as=document')
+        response['Link'] = ', '.join(links)
+        return response
+
 ''' cours suivi/vu par un student ou enrollment '''
 @login_required
 def course_tracking(request, category_slug, module_slug, course_slug):
@@ -156,6 +172,150 @@ def course_tracking(request, category_slug, module_slug, course_slug):
         course_slug=course_slug  
     )
 
+''' partie propre à l'utilisateur des pages pré-rendues (core.snapshots) '''
+@never_cache
+def snapshot_fragment(request):
+    data = {'user_menu': render_to_string('core/partials/user_menu.html', request=request)}
+
+    lesson_id = request.GET.get('lesson', '')
+    if lesson_id.isdigit() and request.user.is_authenticated:
+        row = Lesson.objects.filter(pk=lesson_id).values_list(
+            'chapter__course_id', 'chapter__course__teacher_id', 'video_file'
+        ).first()
+        if row:
+            data['video_url'] = signed_video_url(request.user, *row)
+
+    return JsonResponse(data)
+
+''' paquet hors-ligne du cours (zip streamé, reprise possible avec Range) '''
+@login_required
+def course_package(request, category_slug, module_slug, course_slug):
+    course = get_object_or_404(
+        Course,
+        slug=course_slug,
+        module__slug=module_slug,
+        module__category__slug=category_slug,
+        is_published=True,
+    )
+    if course.pk not in request.user.enrolled_course_ids:
+        raise PermissionDenied
+
+    package = cached_course_package(course)
+    etag = package.etag()
+
+    # If-Range différent : l'archive a changé depuis le début du téléchargement, on renvoie tout
+    status, start, end, headers = serve_range(
+        request.headers.get('Range'), request.headers.get('If-Range'), package.size, etag
+    )
+    if status == 416:
+        return HttpResponse(status=416, headers=headers)
+
+    response = StreamingHttpResponse(
+        package.stream(start, end), status=status, content_type='application/zip', headers=headers,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{course.slug}.zip"'
+    return response
+
+''' vidéo d'une leçon : Range, débit équitable entre les flux (core.streaming) '''
+async def lesson_video(request, category_slug, module_slug, course_slug, chapter_slug, lesson_slug):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    course = await sync_to_async(course_trees.get)(category_slug, module_slug, course_slug)
+    node = course and course.lesson(chapter_slug, lesson_slug)
+    if not node or not node.has_video:
+        raise Http404
+    if not course.is_published and user.pk != course.teacher_id and not user.is_staff:
+        raise Http404
+    # même règle que les URLs signées : sans inscription, pas de vidéo
+    if not await sync_to_async(can_watch)(user, course.pk, course.teacher_id):
+        raise PermissionDenied
+
+    name = await Lesson.objects.filter(pk=node.pk).values_list('video_file', flat=True).afirst()
+    try:
+        fp = await sync_to_async(video_storage.open)(name, 'rb')
+        size = fp.size
+    except (FileNotFoundError, ValueError):
+        raise Http404
+
+    # stockage par contenu : le nom du fichier change avec la vidéo
+    status, start, end, headers = serve_range(
+        request.headers.get('Range'), request.headers.get('If-Range'), size, f'"{os.path.basename(name)}"'
+    )
+    if status == 416:
+        fp.close()
+        return HttpResponse(status=416, headers=headers)
+
+    try:
+        video_limiter.open(user.pk)
+    except TooManyStreams as e:
+        fp.close()
+        response = HttpResponse(str(e), status=429, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = e.retry_after
+        return response
+
+    # sous WSGI un itérateur async serait lu en entier avant l'envoi
+    stream = video_limiter.stream(fp, user.pk, start, end, asynchronous=isinstance(request, ASGIRequest))
+    response = StreamingHttpResponse(
+        stream, status=status, headers=headers,
+        content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+    )
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+''' URL signée (core.signed_media) : même vérification que core.media_app, sans base '''
+def signed_media(request, path):
+    name = clean_path(path)
+    if name is None:
+        raise Http404
+    if not verify_query(settings.SIGNED_MEDIA_KEY, name, request.GET):
+        raise PermissionDenied
+
+    try:
+        fp = open(os.path.join(settings.MEDIA_ROOT, *name.split('/')), 'rb')
+    except (FileNotFoundError, IsADirectoryError):
+        raise Http404
+    status, start, end, headers = serve_range(
+        request.headers.get('Range'), request.headers.get('If-Range'),
+        os.fstat(fp.fileno()).st_size, f'"{os.path.basename(name)}"',
+    )
+    if status == 416:
+        fp.close()
+        return HttpResponse(status=416, headers=headers)
+
+    # mêmes limites que lesson_video, pour l'utilisateur signé
+    user_id = int(request.GET['u'])
+    try:
+        video_limiter.open(user_id)
+    except TooManyStreams as e:
+        fp.close()
+        response = HttpResponse(str(e), status=429, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = e.retry_after
+        return response
+
+    stream = video_limiter.stream(fp, user_id, start, end, asynchronous=isinstance(request, ASGIRequest))
+    response = StreamingHttpResponse(
+        stream, status=status, headers=headers,
+        content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+    )
+    # la signature dans l'URL fait le contrôle d'accès : le frontal peut la garder jusqu'à l'expiration
+    response['Cache-Control'] = f"public, max-age={max(int(request.GET['e']) - int(time.time()), 0)}"
+    return response
+
+
+@user_passes_test(lambda user: user.is_staff)
+def streaming_metrics(request):
+    ''' compteurs des vidéos de ce process (flux, octets envoyés et bridés) '''
+    return JsonResponse({
+        **video_limiter.metrics.snapshot(),
+        'rate_per_user': video_limiter.user_rate,
+        'rate_global': video_limiter.bucket.rate,
+        'streams_per_user': video_limiter.streams_per_user,
+        'max_streams': video_limiter.max_streams,
+    })
+
 ''' forms '''
 class RegisterView(CreateView):
     model = TheUser
@@ -165,13 +325,7 @@ class RegisterView(CreateView):
 
     def form_valid(self, form):
         user = form.save()
-        
-        if user.role == 'teacher':
-            group = Group.objects.get('teacher-group')
-        else:
-            group = Group.objects.get('student-group')
-
-        user.groups.add(group)
+        user.groups.add(role_group(user.role))
 
         login(self.request, user)
         messages.success(self.request, 'inscription reussie.')
@@ -193,7 +347,7 @@ class CourseCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
 
     # seul un teacher cree des cours.
     def test_func(self):
-        return self.request.user.teacher
+        return self.request.user.is_teacher
 
     def form_valid(self, form):
         form.instance.teacher = self.request.user
@@ -236,21 +390,32 @@ def dashboard_student_view(request):
     if not request.user.is_student:
         raise PermissionDenied
 
-    booked_courses = request.user.enrollments.select_related('course__module__category')
+    # ordre d'inscription ; le détail des cours vient des arbres en mémoire
+    booked_courses = course_trees.many(
+        request.user.enrollments.values_list('course_id', flat=True)
+    )
     context = {
         'booked_courses': booked_courses
     }
 
     return render(request, 'core/profile/student_profile.html', context)
 
+@login_required
+def inbox_view(request):
+    notifications = list(request.user.notifications.all()[:50])
+    unread = [n.pk for n in notifications if n.read_at is None]
+    if unread:
+        # lues dès l'affichage ; la page garde leur état d'avant
+        Notification.objects.filter(pk__in=unread).update(read_at=timezone.now())
+
+    return render(request, 'core/profile/inbox.html', {'notifications': notifications})
+
 ''' 404 '''
 def custom_404(request, exception):
 
-    popular_courses = Course.objects.filter(
-        is_published=True
-    ).select_related(
-        "module__category", "teacher"
-    )[:3]
+    popular_courses = course_trees.many(
+        Course.objects.filter(is_published=True).values_list('pk', flat=True)[:3]
+    )
 
     categories = Category.objects.all()[:5]
 
@@ -0,0 +1,96 @@
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def compile_urlpatterns(resolver=None):
+    ''' compile les regex de toutes les routes et remplit les index de reverse() '''
+    resolver = resolver or get_resolver()
+    resolver.reverse_dict  # noqa: B018 (construit les index nommés)
+    count = 0
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex  # noqa: B018
+        if isinstance(pattern, URLResolver):
+            count += compile_urlpatterns(pattern)
+        else:
+            count += 1
+    return count
+
+
+def compile_templates():
+    ''' charge chaque template une fois : le loader en cache garde la version compilée '''
+    count = 0
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if not filename.endswith('.html'):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), directory)
+                    try:
+                        engine.get_template(name.replace(os.sep, '/'))
+                        count += 1
+                    except Exception:
+                        logger.warning("warm-up : template %s non compilé", name, exc_info=True)
+    return count
+
+
+def prime_catalog_caches():
+    ''' premières pages de l'API du catalogue (corps JSON mis en cache) '''
+    from .api import prime_first_pages
+
+    return prime_first_pages()
+
+
+def prime_course_trees():
+    ''' arbres des cours publiés, dans la limite du cache en mémoire '''
+    from .course_tree import course_trees
+    from .models import Course
+
+    pks = Course.objects.filter(is_published=True).values_list('pk', flat=True)
+    return len(course_trees.many(pks[:course_trees.max_size]))
+
+
+def build_search_index():
+    ''' index de l'autocomplétion (un parcours values_list() par type) '''
+    from .prefix_index import search_index
+
+    return search_index.rebuild()
+
+
+WARMUP_STEPS = (
+    ('routes', compile_urlpatterns),
+    ('templates', compile_templates),
+    ('catalogue', prime_catalog_caches),
+    ('courses', prime_course_trees),
+    ('search', build_search_index),
+)
+
+
+def warm_up():
+    ''' à appeler au démarrage d'un worker, avant la première requête '''
+    report = {}
+    for name, step in WARMUP_STEPS:
+        start = time.perf_counter()
+        try:
+            count = step()
+        except Exception:
+            logger.warning("warm-up : étape %s en échec", name, exc_info=True)
+            continue
+        report[name] = (count, time.perf_counter() - start)
+
+    # pas de connexion ouverte héritée par un fork (gunicorn --preload)
+    connections.close_all()
+    return report
+
+
+def warm_up_on_boot():
+    if settings.WARMUP_ON_BOOT:
+        warm_up()